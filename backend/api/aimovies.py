@@ -1,105 +1,353 @@
-import pandas as pd
-from surprise import SVD, Dataset, Reader
-from surprise.model_selection import train_test_split
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-import nltk
-from nltk.corpus import stopwords
+# aimovies.py - pipeline de treino do SVD (fatoração de avaliações explícitas) e pontuação vetorizada
+#
+# Importar este módulo não faz download, não lê arquivos e não treina nada:
+# o treino roda por `python manage.py train_models svd` (ratings do banco ou de um CSV)
+# e o modelo é gravado no ModelStore; o SVDScorer só é carregado na primeira consulta.
 import string
+import threading
+from functools import lru_cache
+from pathlib import Path
 
-nltk.download('stopwords')
+import numpy as np
+from django.conf import settings
+from scipy import sparse
 
-# Carregar dados (dados de avaliação de filmes, como MovieLens)
-ratings = pd.read_csv('ratings.csv')  # Ajuste o caminho para o arquivo
-movies = pd.read_csv('movies.csv')    # Ajuste o caminho para o arquivo
+from .model_store import get_model_registry
+from .models import Rating
 
-# Criar um objeto Reader para ler os dados no formato Surprise
-reader = Reader(rating_scale=(1, 5))
-data = Dataset.load_from_df(ratings[['userId', 'movieId', 'rating']], reader)
 
-# Dividir os dados em treino e teste
-trainset, testset = train_test_split(data, test_size=0.2)
+# ----------------------------------------------------------------------
+# Texto
+# ----------------------------------------------------------------------
+def _nltk_data_dir():
+    return Path(getattr(settings, 'NLTK_DATA_DIR', Path(settings.BASE_DIR) / 'nltk_data'))
 
-# Usar o algoritmo SVD (Singular Value Decomposition)
-model = SVD()
-model.fit(trainset)
 
-# Fazer previsões
-predictions = model.test(testset)
+@lru_cache(maxsize=None)
+def get_stopwords(languages=('english', 'portuguese')):
+    """
+    Stopwords do NLTK, baixadas uma única vez para NLTK_DATA_DIR e lidas do disco
+    nas execuções seguintes (o resultado também fica em memória no processo).
+    Sem o NLTK (ou sem rede no primeiro uso), usa as stopwords em inglês do scikit-learn.
+    """
+    try:
+        import nltk
+        from nltk.corpus import stopwords
+    except ImportError:
+        nltk = None
+
+    if nltk is not None:
+        data_dir = str(_nltk_data_dir())
+        if data_dir not in nltk.data.path:
+            nltk.data.path.insert(0, data_dir)
+        try:
+            nltk.data.find('corpora/stopwords')
+        except LookupError:
+            nltk.download('stopwords', download_dir=data_dir, quiet=True)
+        try:
+            return frozenset(word for language in languages for word in stopwords.words(language))
+        except LookupError:
+            pass
+
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+    return frozenset(ENGLISH_STOP_WORDS)
+
+
+_PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
+def preprocess_text(text):
+    """
+    Minúsculas, sem pontuação e sem stopwords.
+    """
+    stop_words = get_stopwords()
+    return ' '.join(word for word in text.lower().translate(_PUNCTUATION).split() if word not in stop_words)
+
+
+# ----------------------------------------------------------------------
+# Leitura das avaliações em fluxo
+# ----------------------------------------------------------------------
+def iter_ratings_from_db(chunk_size=50000):
+    """
+    Avaliações do banco em blocos de arrays (user_ids, movie_ids, ratings), com cursor no servidor.
+    """
+    chunk = []
+    for row in Rating.objects.values_list('user_id', 'movie_id', 'rating').order_by().iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield _chunk_arrays(chunk)
+            chunk = []
+    if chunk:
+        yield _chunk_arrays(chunk)
+
+
+def _chunk_arrays(chunk):
+    user_ids, movie_ids, ratings = zip(*chunk)
+    return (np.asarray(user_ids, dtype=np.int64), np.asarray(movie_ids, dtype=np.int64),
+            np.asarray([float(rating) for rating in ratings], dtype=np.float32))
+
+
+def iter_ratings_from_csv(path, chunk_size=500000, user_column='userId', movie_column='movieId',
+                          rating_column='rating'):
+    """
+    Avaliações de um CSV no formato do MovieLens (userId, movieId, rating), lidas
+    em blocos com pandas para não carregar o arquivo inteiro.
+    """
+    import pandas as pd
+
+    columns = [user_column, movie_column, rating_column]
+    for frame in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+        yield (frame[user_column].to_numpy(np.int64), frame[movie_column].to_numpy(np.int64),
+               frame[rating_column].to_numpy(np.float32))
+
+
+def collect_ratings(chunks):
+    """
+    Junta os blocos em arrays compactos: índices int32 de usuário/filme, notas float32
+    e os mapas índice -> id.
+
+    :return: (user_rows, movie_cols, ratings, user_ids, movie_ids).
+    """
+    users, movies, values = [], [], []
+    for user_ids, movie_ids, ratings in chunks:
+        users.append(user_ids)
+        movies.append(movie_ids)
+        values.append(ratings)
+    if not users:
+        empty = np.empty(0, dtype=np.int64)
+        return empty.astype(np.int32), empty.astype(np.int32), empty.astype(np.float32), empty, empty
+    user_ids, user_rows = np.unique(np.concatenate(users), return_inverse=True)
+    movie_ids, movie_cols = np.unique(np.concatenate(movies), return_inverse=True)
+    return (user_rows.astype(np.int32), movie_cols.astype(np.int32), np.concatenate(values),
+            user_ids, movie_ids)
+
+
+# ----------------------------------------------------------------------
+# Treino
+# ----------------------------------------------------------------------
+def _fit_numpy(user_rows, movie_cols, ratings, n_users, n_movies, factors, epochs, lr, reg, batch_size, seed):
+    """
+    SVD com vieses (mesmo modelo do surprise.SVD) treinado por SGD em minilotes
+    vetorizados: cada lote atualiza vieses e fatores com np.add.at.
+    """
+    rng = np.random.default_rng(seed)
+    global_mean = float(ratings.mean()) if len(ratings) else 0.0
+    user_factors = rng.normal(0, 0.1, (n_users, factors)).astype(np.float32)
+    item_factors = rng.normal(0, 0.1, (n_movies, factors)).astype(np.float32)
+    user_bias = np.zeros(n_users, dtype=np.float32)
+    item_bias = np.zeros(n_movies, dtype=np.float32)
+
+    for _ in range(epochs):
+        order = rng.permutation(len(ratings))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            users, movies = user_rows[batch], movie_cols[batch]
+            p, q = user_factors[users], item_factors[movies]
+            error = ratings[batch] - (global_mean + user_bias[users] + item_bias[movies] + np.einsum('ij,ij->i', p, q))
+
+            np.add.at(user_bias, users, lr * (error - reg * user_bias[users]))
+            np.add.at(item_bias, movies, lr * (error - reg * item_bias[movies]))
+            np.add.at(user_factors, users, lr * (error[:, None] * q - reg * p))
+            np.add.at(item_factors, movies, lr * (error[:, None] * p - reg * q))
+    return global_mean, user_factors, item_factors, user_bias, item_bias
+
+
+def _fit_surprise(user_rows, movie_cols, ratings, n_users, n_movies, factors, epochs, lr, reg, seed):
+    """
+    Treina com surprise.SVD e converte os parâmetros para a ordem dos índices compactos.
+    """
+    import pandas as pd
+    from surprise import SVD, Dataset, Reader
+
+    frame = pd.DataFrame({'user': user_rows, 'movie': movie_cols, 'rating': ratings})
+    trainset = Dataset.load_from_df(frame, Reader(rating_scale=(1, 5))).build_full_trainset()
+    model = SVD(n_factors=factors, n_epochs=epochs, lr_all=lr, reg_all=reg, random_state=seed)
+    model.fit(trainset)
+
+    user_factors = np.zeros((n_users, factors), dtype=np.float32)
+    item_factors = np.zeros((n_movies, factors), dtype=np.float32)
+    user_bias = np.zeros(n_users, dtype=np.float32)
+    item_bias = np.zeros(n_movies, dtype=np.float32)
+    # Os ids "brutos" do trainset são os índices compactos; os internos seguem a ordem de aparição.
+    # (_inner2raw_id_* só é montado na primeira chamada de to_raw_uid/to_raw_iid.)
+    for raw, inner in trainset._raw2inner_id_users.items():
+        user_factors[raw], user_bias[raw] = model.pu[inner], model.bu[inner]
+    for raw, inner in trainset._raw2inner_id_items.items():
+        item_factors[raw], item_bias[raw] = model.qi[inner], model.bi[inner]
+    return float(trainset.global_mean), user_factors, item_factors, user_bias, item_bias
+
+
+def train_svd_artifacts(ratings_csv=None, factors=100, epochs=20, lr=0.005, reg=0.02, batch_size=4096,
+                        backend='auto', chunk_size=50000, seed=0):
+    """
+    Treina o SVD sobre as avaliações (do banco ou de ratings_csv) e gera os arrays do ModelStore.
+
+    :param backend: 'surprise', 'numpy' ou 'auto' (surprise se estiver instalado).
+    :return: (arrays, metadata) para ModelStore.save.
+    """
+    chunks = iter_ratings_from_csv(ratings_csv) if ratings_csv else iter_ratings_from_db(chunk_size)
+    user_rows, movie_cols, ratings, user_ids, movie_ids = collect_ratings(chunks)
+    n_users, n_movies = len(user_ids), len(movie_ids)
+
+    if backend == 'auto':
+        try:
+            import surprise  # noqa: F401
+            backend = 'surprise'
+        except ImportError:
+            backend = 'numpy'
+    if backend == 'surprise':
+        params = _fit_surprise(user_rows, movie_cols, ratings, n_users, n_movies, factors, epochs, lr, reg, seed)
+    else:
+        params = _fit_numpy(user_rows, movie_cols, ratings, n_users, n_movies, factors, epochs, lr, reg,
+                            batch_size, seed)
+    global_mean, user_factors, item_factors, user_bias, item_bias = params
+
+    rated = sparse.csr_matrix((np.ones(len(ratings), dtype=np.int8), (user_rows, movie_cols)),
+                              shape=(n_users, n_movies))
+    arrays = {
+        'user_factors': user_factors,
+        'item_factors': item_factors,
+        'user_bias': user_bias,
+        'item_bias': item_bias,
+        'user_ids': user_ids,
+        'movie_ids': movie_ids,
+        'rated_indices': rated.indices,
+        'rated_indptr': rated.indptr,
+    }
+    metadata = {
+        'backend': backend,
+        'source': str(ratings_csv) if ratings_csv else 'database',
+        'n_users': int(n_users),
+        'n_movies': int(n_movies),
+        'n_ratings': int(len(ratings)),
+        'global_mean': global_mean,
+        'factors': factors,
+        'epochs': epochs,
+        'lr': lr,
+        'reg': reg,
+    }
+    return arrays, metadata
+
+
+# ----------------------------------------------------------------------
+# Pontuação
+# ----------------------------------------------------------------------
+class SVDScorer:
+    """
+    Previsões do SVD a partir de um artefato 'svd' do ModelStore:
+    nota = média + viés do usuário + viés do filme + fatores do filme · fatores do usuário,
+    calculada para todo o catálogo com um produto matriz-vetor.
+    """
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self.global_mean = artifact.metadata['global_mean']
+        self.user_factors = artifact['user_factors']
+        self.item_factors = artifact['item_factors']
+        self.user_bias = artifact['user_bias']
+        self.item_bias = artifact['item_bias']
+        self.user_ids = artifact['user_ids']
+        self.movie_ids = artifact['movie_ids']
+        self.rated = sparse.csr_matrix(
+            (np.ones(len(artifact['rated_indices']), dtype=np.int8), artifact['rated_indices'],
+             artifact['rated_indptr']),
+            shape=(len(self.user_ids), len(self.movie_ids)),
+        )
+
+    def _user_row(self, user_id):
+        row = int(np.searchsorted(self.user_ids, user_id))  # user_ids vem ordenado (np.unique)
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return row
+        return None
+
+    def predict_all(self, user_id):
+        """
+        Nota prevista para todos os filmes do modelo. Usuário desconhecido recebe
+        só média + viés do filme.
+        """
+        scores = self.global_mean + self.item_bias
+        row = self._user_row(user_id)
+        if row is not None:
+            scores = scores + self.user_bias[row] + self.item_factors @ self.user_factors[row]
+        return np.asarray(scores, dtype=np.float32)
+
+    def predict(self, user_id, movie_ids):
+        """
+        :return: Dicionário {movie_id: nota prevista} (filmes fora do modelo são ignorados).
+        """
+        movie_ids = np.asarray(list(movie_ids), dtype=np.int64)
+        cols = np.searchsorted(self.movie_ids, movie_ids)
+        known = (cols < len(self.movie_ids)) & (self.movie_ids[np.minimum(cols, len(self.movie_ids) - 1)] == movie_ids)
+        scores = self.predict_all(user_id)
+        return {int(movie_id): float(scores[col]) for movie_id, col in zip(movie_ids[known], cols[known])}
+
+    def top_n(self, user_id, n=10, exclude_rated=True):
+        """
+        Os n filmes com maior nota prevista (seleção parcial com argpartition).
+
+        :return: Lista de (movie_id, nota prevista) em ordem decrescente.
+        """
+        scores = self.predict_all(user_id)
+        row = self._user_row(user_id)
+        if exclude_rated and row is not None:
+            scores[self.rated[row].indices] = -np.inf
+        n = min(n, len(scores))
+        if n <= 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(self.movie_ids[col]), float(scores[col])) for col in top if np.isfinite(scores[col])]
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_svd_scorer():
+    """
+    SVDScorer da versão ativa do modelo 'svd' (None se nunca foi treinado),
+    carregado na primeira chamada e recriado só quando a versão muda.
+    """
+    global _scorer
+    artifact = get_model_registry().get('svd')
+    if artifact is None:
+        return None
+    with _scorer_lock:
+        if _scorer is None or _scorer.artifact is not artifact:
+            _scorer = SVDScorer(artifact)
+        return _scorer
+
 
-# Mostrar as recomendações
 def get_top_n(predictions, n=10):
+    """
+    Agrupa previsões (uid, iid, nota real, estimativa, detalhes) no formato do
+    surprise e mantém as n maiores estimativas por usuário.
+    """
     top_n = {}
     for uid, iid, true_r, est, _ in predictions:
-        if uid not in top_n:
-            top_n[uid] = []
-        top_n[uid].append((iid, est))
-
+        top_n.setdefault(uid, []).append((iid, est))
     for uid, user_ratings in top_n.items():
         user_ratings.sort(key=lambda x: x[1], reverse=True)
         top_n[uid] = user_ratings[:n]
-
     return top_n
 
-top_n = get_top_n(predictions, n=10)
 
-# Exibir os 10 melhores filmes para o usuário com id 1
-print("Recomendações para o usuário 1:")
-for movie_id, rating in top_n[1]:
-    movie_name = movies[movies['movieId'] == movie_id]['title'].values[0]
-    print(f'{movie_name}: {rating}')
+def get_movie_recommendations(movie_id, n=10):
+    """
+    Filmes parecidos com movie_id, lidos da tabela pré-calculada MovieSimilarity.
+    """
+    from .machineLern import recommend_movies_content_based
 
+    return recommend_movies_content_based(movie_id, top_n=n)
 
-# Preprocessamento do texto (títulos e descrições dos filmes)
-stop_words = set(stopwords.words('english'))
 
-# Função para remover stopwords e pontuação
-def preprocess_text(text):
-    text = text.lower()
-    text = ''.join([char for char in text if char not in string.punctuation])
-    return ' '.join([word for word in text.split() if word not in stop_words])
-
-# Preprocessar os dados de filmes
-movies['processed_title'] = movies['title'].apply(preprocess_text)
-
-# Usando o TF-IDF para transformar o texto em vetores numéricos
-tfidf = TfidfVectorizer(stop_words='english')
-tfidf_matrix = tfidf.fit_transform(movies['processed_title'])
-
-# Calcular a similaridade entre os filmes
-cosine_sim = cosine_similarity(tfidf_matrix, tfidf_matrix)
-
-# Função para recomendar filmes com base em um filme específico
-def get_movie_recommendations(movie_title, cosine_sim=cosine_sim):
-    idx = movies.index[movies['title'] == movie_title].tolist()[0]
-    sim_scores = list(enumerate(cosine_sim[idx]))
-    
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    sim_scores = sim_scores[1:11]
-    movie_indices = [i[0] for i in sim_scores]
-    
-    recommended_movies = movies['title'].iloc[movie_indices]
-    return recommended_movies
-
-# Testando a recomendação baseada no filme 'The Dark Knight'
-recommendations = get_movie_recommendations('The Dark Knight')
-print("\nRecomendações baseadas no filme 'The Dark Knight':")
-print(recommendations)
-
-
-
-# Função híbrida que recomenda filmes combinando os dois métodos
-def hybrid_recommendation(user_id, movie_title, top_n, cosine_sim):
-    collaborative_recs = top_n[user_id]
-    content_based_recs = get_movie_recommendations(movie_title)
-    
-    # Combina as recomendações
-    all_recs = set([rec[0] for rec in collaborative_recs])
-    all_recs.update(content_based_recs)
-    
-    return list(all_recs)
-
-# Recomendando filmes para o usuário 1 com base em 'The Dark Knight'
-hybrid_recs = hybrid_recommendation(1, 'The Dark Knight', top_n, cosine_sim)
-print("\nRecomendações híbridas para o usuário 1:")
-print(hybrid_recs)
+def hybrid_recommendation(user_id, movie_id, top_n=10):
+    """
+    Combina as melhores previsões do SVD para o usuário com os filmes parecidos com movie_id.
+
+    :return: Lista de IDs de filmes sem duplicatas (SVD primeiro).
+    """
+    scorer = get_svd_scorer()
+    collaborative = [movie for movie, _ in scorer.top_n(user_id, top_n)] if scorer else []
+    return list(dict.fromkeys(collaborative + get_movie_recommendations(movie_id, top_n)))
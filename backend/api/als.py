@@ -0,0 +1,199 @@
+# als.py - fatoração de matrizes para feedback implícito (ALS) com pontuação em lote
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from .machineLern import DEFAULT_IMPLICIT_WEIGHTS, build_interaction_matrix
+from .model_store import get_model_registry
+
+
+def _solve_factors(interactions, preferences, fixed, regularization, block_size=1024):
+    """
+    Meia-iteração do ALS: recalcula os fatores de todas as linhas de `interactions`
+    mantendo `fixed` (fatores do outro lado) constante.
+
+    Para a linha u: (YᵀY + Yᵤᵀ(Cᵤ - I)Yᵤ + λI) xᵤ = Yᵤᵀ Cᵤ pᵤ, onde Cᵤ - I está em
+    interactions.data (alpha·|r|) e pᵤ em preferences.data (1 se r > 0, senão 0).
+    YᵀY é calculado uma vez; cada linha só soma a parte dos filmes com que interagiu.
+    Os sistemas f x f são resolvidos em blocos com np.linalg.solve vetorizado.
+    """
+    n_rows, n_factors = interactions.shape[0], fixed.shape[1]
+    base = fixed.T @ fixed + regularization * np.eye(n_factors, dtype=fixed.dtype)
+    factors = np.zeros((n_rows, n_factors), dtype=fixed.dtype)
+    indptr, indices = interactions.indptr, interactions.indices
+
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        A = np.repeat(base[None, :, :], stop - start, axis=0)
+        b = np.zeros((stop - start, n_factors), dtype=fixed.dtype)
+        for offset, row in enumerate(range(start, stop)):
+            low, high = indptr[row], indptr[row + 1]
+            if low == high:
+                continue
+            Y = fixed[indices[low:high]]
+            confidence = interactions.data[low:high]
+            A[offset] += (Y.T * confidence) @ Y
+            b[offset] = Y.T @ ((1 + confidence) * preferences.data[low:high])
+        factors[start:stop] = np.linalg.solve(A, b[:, :, None])[:, :, 0]
+    return factors
+
+
+def train_als(matrix, factors=64, regularization=0.1, alpha=40.0, iterations=15, random_state=0,
+              dtype=np.float32):
+    """
+    ALS para feedback implícito (Hu, Koren e Volinsky): confiança cᵤᵢ = 1 + alpha·|rᵤᵢ|
+    e preferência pᵤᵢ = 1 se rᵤᵢ > 0. Sinais negativos (dislike) viram preferência 0
+    com confiança alta.
+
+    :param matrix: CSR usuários x filmes com os pesos das interações.
+    :return: (fatores dos usuários (n_usuarios, factors), fatores dos filmes (n_filmes, factors)).
+    """
+    matrix = sparse.csr_matrix(matrix, dtype=dtype)
+    confidence = matrix.copy()
+    confidence.data = alpha * np.abs(confidence.data)
+    preferences = matrix.copy()
+    preferences.data = (preferences.data > 0).astype(dtype)
+
+    # Versões transpostas (filmes x usuários) para a meia-iteração dos filmes
+    confidence_t = confidence.T.tocsr()
+    preferences_t = preferences.T.tocsr()
+
+    rng = np.random.default_rng(random_state)
+    user_factors = np.zeros((matrix.shape[0], factors), dtype=dtype)
+    item_factors = (rng.standard_normal((matrix.shape[1], factors)) * 0.01).astype(dtype)
+    for _ in range(iterations):
+        user_factors = _solve_factors(confidence, preferences, item_factors, regularization)
+        item_factors = _solve_factors(confidence_t, preferences_t, user_factors, regularization)
+    return user_factors, item_factors
+
+
+def top_k_batch(user_factors, item_factors, k=20, exclude=None, batch_size=2048):
+    """
+    Pontua usuários em lote: (bloco de usuários x fatores) @ (fatores x filmes) e
+    seleção parcial dos k maiores com argpartition; só os k são ordenados.
+
+    :param exclude: CSR usuários x filmes com os itens a não recomendar (ex.: já vistos).
+    :return: Gerador de (primeira linha do bloco, colunas (b, k), pontuações (b, k)).
+    """
+    n_users, n_items = user_factors.shape[0], item_factors.shape[0]
+    k = min(k, n_items)
+    item_factors_t = np.ascontiguousarray(item_factors.T)
+    for start in range(0, n_users, batch_size):
+        stop = min(start + batch_size, n_users)
+        scores = user_factors[start:stop] @ item_factors_t
+        if exclude is not None:
+            seen = exclude[start:stop].tocoo()
+            scores[seen.row, seen.col] = -np.inf
+        if k < n_items:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(n_items), (stop - start, 1))
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        yield start, np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+def train_als_artifacts(factors=64, regularization=0.1, alpha=40.0, iterations=15, implicit_weights=None,
+                        chunk_size=50000):
+    """
+    Treina o ALS sobre as interações (avaliações + likes, favoritos e
+    watch_count) e gera os arrays persistidos no ModelStore.
+
+    :return: (arrays, metadata) para ModelStore.save.
+    """
+    interactions = build_interaction_matrix(
+        chunk_size=chunk_size, implicit_weights=implicit_weights or DEFAULT_IMPLICIT_WEIGHTS,
+        use_watch_count=True,
+    )
+    user_factors, item_factors = train_als(
+        interactions.matrix, factors=factors, regularization=regularization, alpha=alpha, iterations=iterations,
+    )
+    matrix = interactions.matrix
+    arrays = {
+        'user_factors': user_factors,
+        'item_factors': item_factors,
+        'user_ids': interactions.user_ids,
+        'movie_ids': interactions.movie_ids,
+        # Itens já vistos por usuário (para excluir na pontuação)
+        'seen_indices': matrix.indices,
+        'seen_indptr': matrix.indptr,
+    }
+    metadata = {
+        'n_users': int(matrix.shape[0]),
+        'n_movies': int(matrix.shape[1]),
+        'nnz': int(matrix.nnz),
+        'factors': factors,
+        'regularization': regularization,
+        'alpha': alpha,
+        'iterations': iterations,
+    }
+    return arrays, metadata
+
+
+class ALSRecommender:
+    """
+    Recomendador sobre um artefato 'als' do ModelStore (arrays mapeados em memória).
+    """
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self.user_factors = artifact['user_factors']
+        self.item_factors = artifact['item_factors']
+        self.user_ids = artifact['user_ids']
+        self.movie_ids = artifact['movie_ids']
+        self.seen = sparse.csr_matrix(
+            (np.ones(len(artifact['seen_indices']), dtype=np.int8), artifact['seen_indices'], artifact['seen_indptr']),
+            shape=(len(self.user_ids), len(self.movie_ids)),
+        )
+        self.user_index = {int(user_id): row for row, user_id in enumerate(self.user_ids.tolist())}
+
+    @property
+    def version(self):
+        return self.artifact.version
+
+    def recommend(self, user_id, k=20):
+        """
+        :return: Lista de (movie_id, pontuação) ou [] se o usuário não estava no treino.
+        """
+        row = self.user_index.get(user_id)
+        if row is None:
+            return []
+        _, columns, scores = next(top_k_batch(
+            self.user_factors[row:row + 1], self.item_factors, k=k, exclude=self.seen[row:row + 1],
+        ))
+        return [(int(self.movie_ids[column]), float(score))
+                for column, score in zip(columns[0], scores[0]) if np.isfinite(score)]
+
+    def recommend_all(self, k=20, batch_size=2048):
+        """
+        Pontua todos os usuários em lote.
+
+        :return: Gerador de (user_id, [(movie_id, pontuação), ...]).
+        """
+        for start, columns, scores in top_k_batch(self.user_factors, self.item_factors, k=k,
+                                                  exclude=self.seen, batch_size=batch_size):
+            for offset in range(columns.shape[0]):
+                finite = np.isfinite(scores[offset])
+                yield int(self.user_ids[start + offset]), list(zip(
+                    self.movie_ids[columns[offset][finite]].tolist(), scores[offset][finite].tolist(),
+                ))
+
+
+_recommender = None
+_recommender_lock = threading.Lock()
+
+
+def get_als_recommender():
+    """
+    ALSRecommender da versão ativa do modelo 'als' (None se nunca foi treinado).
+    O objeto (e o mapa de usuários) é recriado só quando a versão muda.
+    """
+    global _recommender
+    artifact = get_model_registry().get('als')
+    if artifact is None:
+        return None
+    with _recommender_lock:
+        if _recommender is None or _recommender.artifact is not artifact:
+            _recommender = ALSRecommender(artifact)
+        return _recommender
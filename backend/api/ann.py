@@ -0,0 +1,187 @@
+# ann.py - índice de vizinhos aproximados (LSH por projeções aleatórias) para similaridade cosseno
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+
+class RandomProjectionLSH:
+    """
+    Índice aproximado de vizinhos mais próximos por similaridade cosseno, com a
+    mesma interface usada de NearestNeighbors (fit / kneighbors), para servir
+    de substituto em build_knn_model e recommend_movies_user_based.
+
+    Cada uma das n_tables tabelas sorteia n_bits hiperplanos; o código de um
+    vetor é o lado de cada hiperplano em que ele cai. Vetores com ângulo pequeno
+    tendem a cair no mesmo balde. Na consulta, os candidatos dos baldes
+    (e dos baldes vizinhos, com multi-probe) são reordenados pelo cosseno exato.
+
+    Os baldes são arrays de códigos ordenados (busca com searchsorted), não
+    dicionários, então o índice cabe em memória para milhões de usuários.
+
+    Compromisso recall x latência:
+      - n_tables: mais tabelas -> mais recall, mais memória e tempo de consulta;
+      - n_bits: mais bits -> baldes menores e consultas mais rápidas, menos recall;
+      - probes: quantos bits menos confiáveis da consulta são invertidos para
+        visitar baldes vizinhos (multi-probe) -> mais recall sem mais tabelas;
+      - max_candidates: limite de candidatos reordenados (os que colidem em mais
+        tabelas têm prioridade).
+    """
+
+    def __init__(self, n_neighbors=5, n_tables=16, n_bits=8, probes=3, max_candidates=None,
+                 rebuild_fraction=0.1, random_state=0, hash_batch_size=20000):
+        self.n_neighbors = n_neighbors
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.probes = min(probes, n_bits)
+        self.max_candidates = max_candidates
+        self.rebuild_fraction = rebuild_fraction
+        self.random_state = random_state
+        self.hash_batch_size = hash_batch_size
+        self._bit_weights = np.left_shift(np.uint64(1), np.arange(n_bits, dtype=np.uint64))
+
+    # ------------------------------------------------------------------
+    # Construção
+    # ------------------------------------------------------------------
+    def fit(self, X):
+        X = self._prepare(X)
+        rng = np.random.default_rng(self.random_state)
+        self._planes = rng.standard_normal((X.shape[1], self.n_tables * self.n_bits)).astype(np.float32)
+        self._data = X
+        codes = self._hash(X)
+        self._build_tables(codes)
+        return self
+
+    def partial_fit(self, X):
+        """
+        Insere novos vetores (ex.: usuários novos) sem reconstruir o índice.
+        Os índices dos novos vetores continuam a numeração existente.
+        Os códigos ficam numa área pendente, varrida linearmente, até passarem de
+        rebuild_fraction do índice, quando as tabelas são reordenadas.
+        """
+        X = self._prepare(X)
+        codes = self._hash(X)
+        if sparse.issparse(self._data):
+            self._data = sparse.vstack([self._data, X], format='csr')
+        else:
+            self._data = np.vstack([self._data, X])
+        self._pending_codes = np.vstack([self._pending_codes, codes])
+        if len(self._pending_codes) > self.rebuild_fraction * self._n_indexed:
+            self._build_tables(np.vstack([self._indexed_codes, self._pending_codes]))
+        return self
+
+    @property
+    def n_samples_fit_(self):
+        return self._data.shape[0]
+
+    def _prepare(self, X):
+        if sparse.issparse(X):
+            X = sparse.csr_matrix(X, dtype=np.float32)
+        else:
+            X = np.asarray(X, dtype=np.float32)
+            if X.ndim == 1:
+                X = X.reshape(1, -1)
+        return normalize(X)
+
+    def _hash_blocks(self, X):
+        """
+        Calcula, em blocos de hash_batch_size linhas, o código de cada vetor em
+        cada tabela; só um bloco de projeções fica em memória por vez.
+
+        :return: Gerador de (início, códigos uint64 (bloco, n_tables), projeções float32 (bloco, n_tables, n_bits)).
+        """
+        for start in range(0, X.shape[0], self.hash_batch_size):
+            stop = min(start + self.hash_batch_size, X.shape[0])
+            block = np.asarray(X[start:stop] @ self._planes).reshape(stop - start, self.n_tables, self.n_bits)
+            codes = ((block > 0).astype(np.uint64) * self._bit_weights).sum(axis=2, dtype=np.uint64)
+            yield start, codes, block
+
+    def _hash(self, X):
+        """
+        Códigos uint64 (n, n_tables) de todos os vetores, sem guardar as projeções.
+        """
+        codes = np.empty((X.shape[0], self.n_tables), dtype=np.uint64)
+        for start, block_codes, _ in self._hash_blocks(X):
+            codes[start:start + len(block_codes)] = block_codes
+        return codes
+
+    def _build_tables(self, codes):
+        self._indexed_codes = codes
+        self._n_indexed = len(codes)
+        self._order = np.argsort(codes, axis=0, kind='stable').T.astype(np.int64)  # (n_tables, n)
+        self._sorted_codes = np.take_along_axis(codes, self._order.T, axis=0).T  # (n_tables, n)
+        self._pending_codes = np.empty((0, self.n_tables), dtype=np.uint64)
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    def _probe_codes(self, code, projection):
+        """
+        Código do balde da consulta e os obtidos invertendo os `probes` bits
+        cuja projeção ficou mais perto de zero (menos confiáveis).
+        """
+        codes = [code]
+        for bit in np.argsort(np.abs(projection))[:self.probes]:
+            codes.append(code ^ self._bit_weights[bit])
+        return codes
+
+    def _candidates(self, codes, projections):
+        found = []
+        for table in range(self.n_tables):
+            sorted_codes = self._sorted_codes[table]
+            for code in self._probe_codes(codes[table], projections[table]):
+                low = np.searchsorted(sorted_codes, code, side='left')
+                high = np.searchsorted(sorted_codes, code, side='right')
+                if high > low:
+                    found.append(self._order[table, low:high])
+                if len(self._pending_codes):
+                    pending = np.flatnonzero(self._pending_codes[:, table] == code)
+                    if len(pending):
+                        found.append(pending + self._n_indexed)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+
+        candidates, collisions = np.unique(np.concatenate(found), return_counts=True)
+        if self.max_candidates and len(candidates) > self.max_candidates:
+            # Prioriza os candidatos que colidiram em mais tabelas/baldes
+            keep = np.argpartition(-collisions, self.max_candidates - 1)[:self.max_candidates]
+            candidates = candidates[keep]
+        return candidates
+
+    def kneighbors(self, X=None, n_neighbors=None, return_distance=True):
+        """
+        Busca os vizinhos aproximados de cada linha de X (em lote).
+
+        :return: (distâncias cosseno, índices), ambos de forma (n_consultas, n_neighbors),
+                 ordenados do mais próximo ao mais distante, como em NearestNeighbors.
+        """
+        n_neighbors = n_neighbors or self.n_neighbors
+        Q = self._data if X is None else self._prepare(X)
+        n_total = self._data.shape[0]
+        n_neighbors = min(n_neighbors, n_total)
+
+        distances = np.empty((Q.shape[0], n_neighbors), dtype=np.float32)
+        indices = np.empty((Q.shape[0], n_neighbors), dtype=np.int64)
+        for start, codes, projections in self._hash_blocks(Q):
+            for offset in range(len(codes)):
+                row = start + offset
+                candidates = self._candidates(codes[offset], projections[offset])
+                if len(candidates) < n_neighbors:
+                    # Poucos candidatos nos baldes: cai para a busca exata
+                    candidates = np.arange(n_total)
+                query = Q[row].toarray().ravel() if sparse.issparse(Q) else Q[row]
+                similarity = np.asarray(self._data[candidates] @ query).ravel()
+                top = np.argpartition(-similarity, n_neighbors - 1)[:n_neighbors]
+                top = top[np.argsort(-similarity[top], kind='stable')]
+                indices[row] = candidates[top]
+                distances[row] = 1 - similarity[top]
+
+        if return_distance:
+            return distances, indices
+        return indices
+
+    def memory_usage(self):
+        """
+        Bytes ocupados pelos hiperplanos e tabelas (sem contar os vetores indexados).
+        """
+        return (self._planes.nbytes + self._order.nbytes + self._sorted_codes.nbytes
+                + self._indexed_codes.nbytes + self._pending_codes.nbytes)
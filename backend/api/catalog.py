@@ -0,0 +1,272 @@
+# catalog.py - importação em lote do catálogo de filmes (movies_metadata.csv), com upsert por external_id
+import ast
+import math
+import time
+from datetime import date
+
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .genre_index import peek_genre_index
+from .models import Genre, Movie
+
+# Colunas lidas do movies_metadata.csv (o arquivo tem mais de 20)
+CSV_COLUMNS = ['id', 'title', 'overview', 'release_date', 'runtime', 'poster_path', 'genres']
+
+# Campos de Movie comparados com o CSV e regravados quando mudaram
+MOVIE_FIELDS = ['title', 'description', 'release_date', 'duration', 'image_url']
+
+# Linhas por UPDATE do bulk_update (o CASE ... WHEN cresce com o lote)
+UPDATE_BATCH_SIZE = 100
+
+# release_date de filmes sem data (ou com data inválida) no CSV: um valor fixo, para que
+# reimportar o mesmo arquivo não altere o filme
+MISSING_RELEASE_DATE = date(1900, 1, 1)
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _external_id(value):
+    # O CSV tem linhas quebradas com datas ou textos na coluna id: essas são ignoradas
+    try:
+        external_id = int(value)
+    except (TypeError, ValueError):
+        return None
+    return external_id if external_id > 0 else None
+
+
+def _text(value):
+    return None if _missing(value) else str(value).strip()
+
+
+def _release_date(value):
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return MISSING_RELEASE_DATE
+
+
+def _duration(value):
+    try:
+        duration = float(value)
+    except (TypeError, ValueError):
+        return 1
+    return int(round(duration)) if math.isfinite(duration) and duration >= 1 else 1
+
+
+def _unique_slug(text, taken, fallback):
+    """
+    Slug livre (em memória, sem consultar o banco); cabe nos 50 caracteres do SlugField.
+    """
+    base = slugify(text)[:40].strip('-') or fallback
+    slug = base
+    counter = 1
+    while slug in taken:
+        slug = f'{base}-{counter}'
+        counter += 1
+    taken.add(slug)
+    return slug
+
+
+class CatalogImporter:
+    """
+    Importa o catálogo em blocos: slugs e gêneros resolvidos em memória, filmes
+    gravados com bulk_create/bulk_update e relações filme-gênero regravadas (um
+    DELETE e um bulk_create por bloco) só para filmes novos ou cujo conjunto de
+    gêneros mudou, cada bloco na sua transação.
+
+    A chave é o id do catálogo (external_id): rodar de novo atualiza os filmes e
+    gêneros em vez de duplicá-los. Filmes e gêneros já existentes sem
+    external_id (importações antigas) são adotados pelo título e pelo nome.
+    """
+
+    def __init__(self):
+        genres = list(Genre.objects.all())
+        self.genres_by_external = {genre.external_id: genre for genre in genres if genre.external_id is not None}
+        self.genres_by_name = {genre.name: genre for genre in genres}
+        self.genre_slugs = {genre.slug for genre in genres if genre.slug}
+        self.movie_slugs = set(Movie.objects.exclude(slug=None).values_list('slug', flat=True))
+        self.orphan_movies = dict(Movie.objects.filter(external_id=None).values_list('title', 'id'))
+        self._parsed_genres = {}
+
+    def parse_genres(self, value):
+        """
+        Lista de (id, nome) a partir do texto "[{'id': 16, 'name': 'Animation'}, ...]".
+        O mesmo texto se repete em milhares de linhas: cada um é avaliado uma vez só.
+        """
+        if _missing(value):
+            return []
+        value = str(value)
+        if value not in self._parsed_genres:
+            try:
+                self._parsed_genres[value] = [
+                    (_external_id(genre.get('id')), str(genre['name']).strip())
+                    for genre in ast.literal_eval(value) if str(genre.get('name', '')).strip()
+                ]
+            except (ValueError, SyntaxError, TypeError, AttributeError, KeyError):
+                self._parsed_genres[value] = []
+        return self._parsed_genres[value]
+
+    def resolve_genres(self, pairs):
+        """
+        Garante um Genre para cada (id, nome): cria os novos com bulk_create e
+        completa o external_id dos que já existiam só pelo nome.
+
+        :return: Dicionário {(id, nome): genre_id}.
+        """
+        created, adopted, resolved = [], [], {}
+        for external_id, name in pairs:
+            genre = self.genres_by_external.get(external_id) if external_id else None
+            if genre is None:
+                genre = self.genres_by_name.get(name)
+                if genre is None:
+                    genre = Genre(name=name, external_id=external_id,
+                                  slug=_unique_slug(name, self.genre_slugs, 'genero'))
+                    created.append(genre)
+                    self.genres_by_name[name] = genre
+                elif genre.external_id is None and external_id:
+                    genre.external_id = external_id
+                    adopted.append(genre)
+                if external_id:
+                    self.genres_by_external[external_id] = genre
+            resolved[(external_id, name)] = genre
+
+        if created:
+            Genre.objects.bulk_create(created)
+            if created[0].pk is None:  # Banco sem RETURNING no bulk_create
+                ids = dict(Genre.objects.filter(name__in=[genre.name for genre in created]).values_list('name', 'id'))
+                for genre in created:
+                    genre.pk = ids[genre.name]
+        if adopted:
+            Genre.objects.bulk_update(adopted, ['external_id'])
+        return {key: genre.pk for key, genre in resolved.items()}
+
+    def import_chunk(self, frame):
+        """
+        Grava um bloco do CSV numa transação.
+
+        :return: (filmes criados, filmes alterados, linhas ignoradas). Alterados são os
+                 filmes com algum campo ou gênero diferente do CSV.
+        """
+        rows = {}
+        skipped = 0
+        for external_id, title, overview, release_date, runtime, poster_path, genres in frame[CSV_COLUMNS].itertuples(
+                index=False, name=None):
+            external_id, title = _external_id(external_id), _text(title)
+            if external_id is None or not title:
+                skipped += 1
+                continue
+            # O CSV repete alguns filmes: vale a última linha
+            rows[external_id] = {
+                'title': title[:255],
+                'description': _text(overview) or '',
+                'release_date': _release_date(release_date),
+                'duration': _duration(runtime),
+                'image_url': (_text(poster_path) or '')[:200] or None,
+                'genres': self.parse_genres(genres),
+            }
+        if not rows:
+            return 0, 0, skipped
+
+        now = timezone.now()
+        with transaction.atomic():
+            genre_ids = self.resolve_genres({pair for row in rows.values() for pair in row['genres']})
+            current = {
+                values[0]: values[1:]
+                for values in Movie.objects.filter(external_id__in=list(rows)).values_list(
+                    'external_id', 'id', *MOVIE_FIELDS)
+            }
+            existing = {external_id: values[0] for external_id, values in current.items()}
+
+            new_movies, updated_movies = [], []
+            fields_of = {external_id: {field: row[field] for field in MOVIE_FIELDS} for external_id, row in rows.items()}
+            for external_id, row in rows.items():
+                fields = fields_of[external_id]
+                if external_id in current:
+                    # Reimportação: só regrava o que mudou no CSV
+                    if current[external_id][1:] != tuple(fields.values()):
+                        updated_movies.append(Movie(pk=existing[external_id], external_id=external_id,
+                                                    updated_at=now, **fields))
+                    continue
+                movie_id = self.orphan_movies.pop(row['title'], None)
+                if movie_id is None:
+                    new_movies.append(Movie(external_id=external_id,
+                                            slug=_unique_slug(row['title'], self.movie_slugs, 'filme'), **fields))
+                else:
+                    existing[external_id] = movie_id
+                    updated_movies.append(Movie(pk=movie_id, external_id=external_id, updated_at=now, **fields))
+
+            # Gêneros atuais dos filmes que já existiam: só os que mudaram são regravados
+            Through = Movie.genres.through
+            linked = {}
+            for movie_id, genre_id in Through.objects.filter(movie_id__in=list(existing.values())).values_list(
+                    'movie_id', 'genre_id'):
+                linked.setdefault(movie_id, set()).add(genre_id)
+            wanted = {external_id: {genre_ids[pair] for pair in row['genres']} for external_id, row in rows.items()}
+            updated_ids = {movie.pk for movie in updated_movies}
+            relinked = []
+            for external_id, movie_id in existing.items():
+                if linked.get(movie_id, set()) != wanted[external_id]:
+                    relinked.append(external_id)
+                    if movie_id not in updated_ids:
+                        updated_movies.append(Movie(pk=movie_id, external_id=external_id, updated_at=now,
+                                                    **fields_of[external_id]))
+
+            if new_movies:
+                Movie.objects.bulk_create(new_movies)
+                if new_movies[0].pk is None:  # Banco sem RETURNING no bulk_create
+                    ids = dict(Movie.objects.filter(external_id__in=[movie.external_id for movie in new_movies])
+                               .values_list('external_id', 'id'))
+                    for movie in new_movies:
+                        movie.pk = ids[movie.external_id]
+                existing.update((movie.external_id, movie.pk) for movie in new_movies)
+            if updated_movies:
+                Movie.objects.bulk_update(updated_movies, MOVIE_FIELDS + ['external_id', 'updated_at'],
+                                          batch_size=UPDATE_BATCH_SIZE)
+
+            # Relações filme-gênero dos filmes alterados são substituídas de uma vez; as dos novos, criadas
+            if relinked:
+                Through.objects.filter(movie_id__in=[existing[external_id] for external_id in relinked]).delete()
+            relinked.extend(movie.external_id for movie in new_movies)
+            Through.objects.bulk_create([
+                Through(movie_id=existing[external_id], genre_id=genre_id)
+                for external_id in relinked
+                for genre_id in wanted[external_id]
+            ], ignore_conflicts=True)
+
+            # Operações em lote não disparam os sinais de Movie: marca o índice de gêneros aqui
+            index = peek_genre_index()
+            movie_ids = [movie.pk for movie in new_movies + updated_movies]
+            if index is not None and movie_ids:
+                transaction.on_commit(lambda: index.mark_dirty(movie_ids))
+        return len(new_movies), len(updated_movies), skipped
+
+
+def import_catalog(path, chunk_size=2000, limit=None, progress=None):
+    """
+    Importa o CSV em blocos de chunk_size linhas (pandas lê só as colunas usadas).
+
+    :param limit: Número máximo de linhas lidas (None = arquivo inteiro).
+    :param progress: Função chamada após cada bloco com os totais acumulados.
+    :return: Dicionário com rows, created, updated, skipped, seconds e rows_per_second.
+    """
+    importer = CatalogImporter()
+    totals = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0}
+    started = time.perf_counter()
+    for frame in pd.read_csv(path, usecols=CSV_COLUMNS, dtype=str, chunksize=chunk_size, nrows=limit):
+        created, updated, skipped = importer.import_chunk(frame)
+        totals['rows'] += len(frame)
+        totals['created'] += created
+        totals['updated'] += updated
+        totals['skipped'] += skipped
+        totals['seconds'] = time.perf_counter() - started
+        totals['rows_per_second'] = totals['rows'] / totals['seconds'] if totals['seconds'] else 0.0
+        if progress is not None:
+            progress(totals)
+    totals.setdefault('seconds', time.perf_counter() - started)
+    totals.setdefault('rows_per_second', 0.0)
+    return totals
@@ -0,0 +1,153 @@
+# content.py - vizinhos por conteúdo ("mais como este") pré-calculados a partir de TF-IDF
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from .aimovies import get_stopwords
+from .models import FavoriteMovie, LikeDislike, Movie, MovieSimilarity, Rating
+
+
+def iter_movie_documents(chunk_size=5000):
+    """
+    Lê os filmes em blocos e monta o texto de cada um: título (repetido, para pesar
+    mais), gêneros como tokens próprios (genero_<slug>) e descrição.
+
+    :return: Gerador de (movie_id, texto), em ordem de id.
+    """
+    genres = {}
+    for movie_id, slug, name in Movie.genres.through.objects.values_list(
+            'movie_id', 'genre__slug', 'genre__name').iterator(chunk_size=chunk_size):
+        token = 'genero_' + (slug or name).replace('-', '_')
+        genres.setdefault(movie_id, []).append(token)
+
+    movies = Movie.objects.order_by('id').values_list('id', 'title', 'description')
+    for movie_id, title, description in movies.iterator(chunk_size=chunk_size):
+        yield movie_id, ' '.join([title, title, *genres.get(movie_id, ()), description or ''])
+
+
+def build_tfidf_matrix(documents, max_features=50000):
+    """
+    Vetoriza os textos. Retorna (ids dos filmes, matriz CSR normalizada em L2),
+    de modo que o produto de duas linhas é a similaridade cosseno.
+    """
+    movie_ids = []
+    texts = []
+    for movie_id, text in documents:
+        movie_ids.append(movie_id)
+        texts.append(text)
+    movie_ids = np.array(movie_ids, dtype=np.int64)
+    if not texts:
+        return movie_ids, sparse.csr_matrix((0, 0), dtype=np.float32)
+    vectorizer = TfidfVectorizer(
+        stop_words=sorted(get_stopwords()), sublinear_tf=True,
+        # Com menos de 3 filmes, max_df=0.5 descartaria (ou rejeitaria) todos os termos
+        max_df=0.5 if len(texts) >= 3 else 1.0,
+        max_features=max_features, dtype=np.float32,
+        token_pattern=r'(?u)\b\w\w+\b',
+    )
+    try:
+        matrix = vectorizer.fit_transform(texts).tocsr()
+    except ValueError:
+        # Nenhum termo sobrou (textos vazios ou só stopwords): filmes sem vizinhos
+        matrix = sparse.csr_matrix((len(texts), 0), dtype=np.float32)
+    return movie_ids, matrix
+
+
+def top_k_similar(matrix, k=20, block_size=1000, min_score=0.0):
+    """
+    Calcula os k vizinhos mais similares de cada linha sem montar a matriz N x N:
+    multiplica blocos de block_size linhas pela transposta (produto esparso) e
+    mantém só os k maiores valores de cada linha.
+
+    :return: Gerador de (linha, linhas vizinhas, similaridades), em ordem decrescente de similaridade.
+    """
+    transposed = matrix.T.tocsr()
+    for start in range(0, matrix.shape[0], block_size):
+        stop = min(start + block_size, matrix.shape[0])
+        block = (matrix[start:stop] @ transposed).tocsr()
+        for offset in range(stop - start):
+            row = start + offset
+            low, high = block.indptr[offset], block.indptr[offset + 1]
+            columns = block.indices[low:high]
+            scores = block.data[low:high]
+
+            keep = (columns != row) & (scores > min_score)
+            columns, scores = columns[keep], scores[keep]
+            if len(scores) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                columns, scores = columns[top], scores[top]
+            # Desempate pelo id (coluna) para o resultado ser determinístico
+            order = np.lexsort((columns, -scores))
+            yield row, columns[order], scores[order]
+
+
+def rebuild_movie_similarities(k=20, block_size=1000, batch_size=5000, max_features=50000):
+    """
+    Recalcula a tabela MovieSimilarity inteira: TF-IDF de título, gêneros e
+    descrição, top-K por filme em blocos e gravação em lote numa única transação
+    (leitores veem a versão antiga até o commit).
+
+    :return: (número de filmes, número de linhas gravadas).
+    """
+    movie_ids, matrix = build_tfidf_matrix(iter_movie_documents(), max_features=max_features)
+    if not len(movie_ids):
+        MovieSimilarity.objects.all().delete()
+        return 0, 0
+
+    written = 0
+    with transaction.atomic():
+        MovieSimilarity.objects.all().delete()
+        batch = []
+        for row, neighbours, scores in top_k_similar(matrix, k=k, block_size=block_size):
+            movie_id = int(movie_ids[row])
+            for rank, (neighbour, score) in enumerate(zip(neighbours, scores), start=1):
+                batch.append(MovieSimilarity(
+                    movie_id=movie_id, similar_movie_id=int(movie_ids[neighbour]),
+                    score=float(score), rank=rank,
+                ))
+            if len(batch) >= batch_size:
+                written += len(MovieSimilarity.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            written += len(MovieSimilarity.objects.bulk_create(batch))
+    return len(movie_ids), written
+
+
+def get_similar_movies(movie_id, limit=10):
+    """
+    Vizinhos pré-calculados de um filme: leitura pelo índice (movie, rank).
+    """
+    return (
+        MovieSimilarity.objects.filter(movie_id=movie_id)
+        .select_related('similar_movie')
+        .prefetch_related('similar_movie__genres')
+        .order_by('rank')[:limit]
+    )
+
+
+def recommend_movies_content_for_user(user_id, limit=20, max_seeds=20):
+    """
+    Recomendação por conteúdo para um usuário: soma, por filme, a similaridade
+    com os filmes de que ele gostou recentemente (likes, favoritos e notas >= 4).
+
+    :return: Lista de (movie_id, pontuação) em ordem decrescente.
+    """
+    seeds = set(LikeDislike.objects.filter(user_id=user_id, action='like')
+                .order_by('-created_at').values_list('movie_id', flat=True)[:max_seeds])
+    seeds.update(FavoriteMovie.objects.filter(user_id=user_id)
+                 .order_by('-added_at').values_list('movie_id', flat=True)[:max_seeds])
+    seeds.update(Rating.objects.filter(user_id=user_id, rating__gte=4)
+                 .order_by('-created_at').values_list('movie_id', flat=True)[:max_seeds])
+    if not seeds:
+        return []
+
+    neighbours = (
+        MovieSimilarity.objects.filter(movie_id__in=seeds)
+        .exclude(similar_movie_id__in=seeds)
+        .values('similar_movie_id')
+        .annotate(total=Sum('score'))
+        .order_by('-total', 'similar_movie_id')[:limit]
+    )
+    return [(row['similar_movie_id'], row['total']) for row in neighbours]
@@ -0,0 +1,409 @@
+# counters.py - buffer write-behind em memória: soma incrementos de contadores e grava em lote
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def counter_buffer_mode():
+    """
+    COUNTER_BUFFER_MODE: 'direct' (cada incremento é um UPDATE, padrão) ou
+    'buffered' (incrementos somados em memória e gravados em lote pelo CounterBuffer).
+    """
+    return getattr(settings, 'COUNTER_BUFFER_MODE', 'direct')
+
+
+class CounterBuffer:
+    """
+    Soma em memória, por processo, os incrementos dos contadores mais disputados
+    e grava tudo em lote a cada flush_interval segundos ou a cada max_events
+    incrementos, numa única transação:
+
+    - watch_count de linhas de WatchedMovie que já existem;
+    - contadores de MovieStats (likes, favoritos, assistidos, avaliações);
+    - prioridade das preferências de gênero (Preference);
+    - pontuação de tendência dos filmes e gêneros.
+
+    Mil likes no mesmo filme entre dois flushes viram um UPDATE. Os incrementos
+    só entram no buffer depois do commit da transação que os gerou. Leituras
+    deste processo somam os valores pendentes (pending_*), então o usuário vê o
+    que acabou de fazer; outros processos só veem depois do flush.
+
+    Os ajustes de preferência não são somados: a prioridade é limitada a 0..5 a
+    cada ajuste, e "+3, -3" a partir de 4 termina em 2, não em 4. O buffer guarda
+    os ajustes de cada (usuário, gênero) em ordem, juntando só os consecutivos de
+    mesmo sinal (que dão o mesmo resultado somados), e o flush os aplica nessa
+    ordem, como o modo 'direct'.
+
+    O preço é a durabilidade: incrementos ainda não gravados se perdem se o
+    processo morrer sem passar pelo close() (registrado no atexit). Um flush que
+    falha devolve os incrementos ao buffer para a próxima tentativa.
+    """
+
+    def __init__(self, flush_interval=None, max_events=None, known_watches=None):
+        self.flush_interval = flush_interval if flush_interval is not None else getattr(
+            settings, 'COUNTER_BUFFER_FLUSH_MS', 200) / 1000
+        self.max_events = max_events if max_events is not None else getattr(
+            settings, 'COUNTER_BUFFER_MAX_EVENTS', 1000)
+        self.known_watches = known_watches if known_watches is not None else getattr(
+            settings, 'COUNTER_BUFFER_KNOWN_WATCHES', 10000)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._pending = self._empty()
+        self._flushing = self._empty()  # Incrementos em gravação: ainda contam nas leituras
+        self._events = 0
+        # (user_id, movie_id) -> [id da linha, watch_count gravado] das linhas que já existem
+        self._watch_rows = OrderedDict()
+
+        self._flushes = 0
+        self._flushed_events = 0
+        self._errors = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._last_flush_at = None
+
+    @staticmethod
+    def _empty():
+        return {'watches': {}, 'stats': {}, 'preferences': {}, 'trending': {}}
+
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+    def _add(self, kind, key, delta, field=None):
+        def add():
+            with self._lock:
+                bucket = self._pending[kind]
+                if kind == 'preferences':
+                    _extend_runs(bucket.setdefault(key, []), [delta])
+                elif field is None:
+                    bucket[key] = bucket.get(key, 0) + delta
+                else:
+                    fields = bucket.setdefault(key, {})
+                    fields[field] = fields.get(field, 0) + delta
+                self._events += 1
+                full = self._events >= self.max_events
+            self._start()
+            if full:
+                self._wakeup.set()
+
+        transaction.on_commit(add)
+
+    def add_watch(self, user_id, movie_id, pk):
+        """
+        Soma uma assistência na linha pk de WatchedMovie, que já existe (ver known_watch).
+        """
+        self._add('watches', (user_id, movie_id, pk), 1)
+
+    def add_movie_stats(self, movie_id, deltas):
+        for field, delta in deltas.items():
+            if delta:
+                self._add('stats', movie_id, delta, field)
+
+    def add_preferences(self, user_id, genre_ids, delta):
+        for genre_id in set(genre_ids):
+            self._add('preferences', (user_id, genre_id), delta)
+
+    def add_trending(self, movie_id, delta, epoch):
+        """
+        :param delta: Pontuação já multiplicada por forward_weight (api/trending.py).
+        :param epoch: Época usada no fator; o flush reescala se ela tiver avançado.
+        """
+        self._add('trending', (movie_id, epoch), delta)
+
+    # ------------------------------------------------------------------
+    # Linhas de WatchedMovie conhecidas: só elas recebem assistências pelo buffer
+    # ------------------------------------------------------------------
+    def known_watch(self, user_id, movie_id):
+        """
+        :return: (id da linha, watch_count gravado) se a linha existe, ou None.
+        """
+        with self._lock:
+            row = self._watch_rows.get((user_id, movie_id))
+            if row is None:
+                return None
+            self._watch_rows.move_to_end((user_id, movie_id))
+            return tuple(row)
+
+    def remember_watch(self, user_id, movie_id, pk, watch_count):
+        """
+        Guarda a linha depois do commit que a gravou; as mais antigas saem quando
+        passa de known_watches.
+        """
+        def remember():
+            with self._lock:
+                self._watch_rows[(user_id, movie_id)] = [pk, watch_count]
+                self._watch_rows.move_to_end((user_id, movie_id))
+                while len(self._watch_rows) > self.known_watches:
+                    self._watch_rows.popitem(last=False)
+
+        transaction.on_commit(remember)
+
+    def forget_watch(self, user_id, movie_id):
+        with self._lock:
+            self._watch_rows.pop((user_id, movie_id), None)
+
+    # ------------------------------------------------------------------
+    # Leitura dos valores pendentes
+    # ------------------------------------------------------------------
+    def _pending_value(self, kind, key):
+        with self._lock:
+            return self._pending[kind].get(key, 0) + self._flushing[kind].get(key, 0)
+
+    def pending_watches(self, user_id, movie_id, pk):
+        return self._pending_value('watches', (user_id, movie_id, pk))
+
+    def pending_priority(self, user_id, genre_id, priority):
+        """
+        Prioridade gravada com os ajustes ainda não gravados aplicados em ordem
+        (cada um limitado a 0..5, como no flush).
+        """
+        from .utils import MAX_PREFERENCE_PRIORITY, MIN_PREFERENCE_PRIORITY
+
+        with self._lock:
+            runs = self._flushing['preferences'].get((user_id, genre_id), []) \
+                + self._pending['preferences'].get((user_id, genre_id), [])
+        for delta in runs:
+            priority = min(max(priority + delta, MIN_PREFERENCE_PRIORITY), MAX_PREFERENCE_PRIORITY)
+        return priority
+
+    def pending_movie_stats(self, movie_id):
+        """
+        :return: Dicionário {campo: incremento} ainda não gravado do filme.
+        """
+        totals = {}
+        with self._lock:
+            for pending in (self._flushing, self._pending):
+                for field, delta in pending['stats'].get(movie_id, {}).items():
+                    totals[field] = totals.get(field, 0) + delta
+        return totals
+
+    # ------------------------------------------------------------------
+    # Flush
+    # ------------------------------------------------------------------
+    def _start(self):
+        if self._thread is not None or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='counter-buffer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                self.flush()
+        finally:
+            # A thread abre sua própria conexão; fecha para não deixá-la pendurada
+            connection.close()
+
+    def flush(self):
+        """
+        Grava os incrementos pendentes numa transação: um UPDATE ... CASE para as
+        assistências, um para MovieStats, um upsert por (usuário, ajuste) nas
+        preferências e um UPDATE ... CASE por tabela de tendência.
+
+        :return: Número de incrementos gravados.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, self._empty()
+                events, self._events = self._events, 0
+                self._flushing = batch
+            if not events:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                stored = self._write(batch)
+            except Exception:
+                logger.exception('Falha ao gravar %s incrementos do buffer de contadores', events)
+                with self._lock:
+                    self._merge_back(batch, events)
+                    self._flushing = self._empty()
+                    self._errors += 1
+                return 0
+
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                # Novo watch_count gravado das linhas; as que sumiram (apagadas) são esquecidas
+                for user_id, movie_id, pk in batch['watches']:
+                    row = self._watch_rows.get((user_id, movie_id))
+                    if pk not in stored:
+                        self._watch_rows.pop((user_id, movie_id), None)
+                    elif row is not None and row[0] == pk:
+                        row[1] = stored[pk]
+                self._flushing = self._empty()
+                self._flushes += 1
+                self._flushed_events += events
+                self._last_flush_ms = elapsed
+                self._max_flush_ms = max(self._max_flush_ms, elapsed)
+                self._total_flush_ms += elapsed
+                self._last_flush_at = timezone.now()
+            return events
+
+    def _merge_back(self, batch, events):
+        for kind, bucket in batch.items():
+            pending = self._pending[kind]
+            for key, value in bucket.items():
+                if kind == 'preferences':
+                    # Os ajustes do lote que falhou vieram antes dos que chegaram durante o flush
+                    pending[key] = _extend_runs(list(value), pending.get(key, []))
+                elif kind == 'stats':
+                    fields = pending.setdefault(key, {})
+                    for field, delta in value.items():
+                        fields[field] = fields.get(field, 0) + delta
+                else:
+                    pending[key] = pending.get(key, 0) + value
+        self._events += events
+
+    def _write(self, batch):
+        from django.contrib.auth.models import User
+
+        from .models import Genre, Movie, WatchedMovie
+        from .recommendations import schedule_refresh
+        from .stats import bulk_update_movie_stats
+        from .trending import apply_trending_deltas
+        from .utils import bulk_adjust_preferences
+
+        with transaction.atomic():
+            stored = {}
+            watches = {pk: count for (_, _, pk), count in batch['watches'].items()}
+            pks = sorted(watches)
+            # Em blocos, para não passar do limite de parâmetros por comando do banco
+            for start in range(0, len(pks), 250):
+                chunk = pks[start:start + 250]
+                WatchedMovie.objects.filter(pk__in=chunk).update(watch_count=F('watch_count') + Case(
+                    *[When(pk=pk, then=Value(watches[pk])) for pk in chunk],
+                    default=Value(0), output_field=IntegerField(),
+                ))
+                stored.update(WatchedMovie.objects.filter(pk__in=chunk).values_list('pk', 'watch_count'))
+
+            # Filmes, gêneros e usuários apagados depois do incremento ficam de fora (a chave estrangeira falharia)
+            movie_ids = set(batch['stats']) | {movie_id for movie_id, _ in batch['trending']}
+            movies = set(Movie.objects.filter(pk__in=movie_ids).values_list('pk', flat=True))
+            bulk_update_movie_stats({movie_id: deltas for movie_id, deltas in batch['stats'].items()
+                                     if movie_id in movies})
+
+            # Rodada i aplica o i-ésimo ajuste de cada (usuário, gênero), na ordem em que chegaram;
+            # dentro da rodada, um upsert por usuário e valor (bulk_adjust_preferences limita a prioridade)
+            users = set(User.objects.filter(pk__in={user_id for user_id, _ in batch['preferences']})
+                        .values_list('pk', flat=True))
+            genres = set(Genre.objects.filter(pk__in={genre_id for _, genre_id in batch['preferences']})
+                         .values_list('pk', flat=True))
+            rounds = []
+            for (user_id, genre_id), runs in batch['preferences'].items():
+                if user_id in users and genre_id in genres:
+                    for position, delta in enumerate(runs):
+                        if position == len(rounds):
+                            rounds.append({})
+                        rounds[position].setdefault((user_id, delta), []).append(genre_id)
+            for groups in rounds:
+                for (user_id, delta), genre_ids in sorted(groups.items()):
+                    bulk_adjust_preferences(user_id, genre_ids, delta)
+            for user_id in {user_id for groups in rounds for user_id, _ in groups}:
+                schedule_refresh(user_id)
+
+            trending = {}
+            for (movie_id, epoch), delta in batch['trending'].items():
+                if movie_id in movies:
+                    trending.setdefault(epoch, {})[movie_id] = delta
+            for epoch, deltas in trending.items():
+                apply_trending_deltas(deltas, epoch)
+        return stored
+
+    def close(self):
+        """
+        Para a thread de flush e grava o que estiver pendente (fim do worker).
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=max(self.flush_interval * 10, 5))
+        return self.flush()
+
+    def metrics(self):
+        """
+        Profundidade do buffer e latência dos flushes deste processo.
+        """
+        with self._lock:
+            depth = {kind: len(bucket) for kind, bucket in self._pending.items()}
+            return {
+                'mode': counter_buffer_mode(),
+                'pending_events': self._events,
+                'depth': depth,
+                'known_watches': len(self._watch_rows),
+                'flush_interval_ms': round(self.flush_interval * 1000),
+                'max_events': self.max_events,
+                'flushes': self._flushes,
+                'flushed_events': self._flushed_events,
+                'errors': self._errors,
+                'last_flush_ms': round(self._last_flush_ms, 2),
+                'max_flush_ms': round(self._max_flush_ms, 2),
+                'avg_flush_ms': round(self._total_flush_ms / self._flushes, 2) if self._flushes else 0.0,
+                'last_flush_at': self._last_flush_at,
+            }
+
+
+def _extend_runs(runs, deltas):
+    """
+    Acrescenta ajustes de preferência a runs, somando ao último os de mesmo
+    sinal: limitar a 0..5 depois de cada um ou só depois da soma dá o mesmo.
+    """
+    for delta in deltas:
+        if not delta:
+            continue
+        if runs and (runs[-1] > 0) == (delta > 0):
+            runs[-1] += delta
+        else:
+            runs.append(delta)
+    return runs
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_counter_buffer():
+    """
+    Retorna o CounterBuffer do processo (criado na primeira chamada, gravado no atexit).
+    """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = CounterBuffer()
+                atexit.register(_buffer.close)
+    return _buffer
+
+
+def counter_buffer():
+    """
+    O CounterBuffer do processo no modo 'buffered', ou None no modo 'direct'.
+    """
+    if counter_buffer_mode() != 'buffered':
+        return None
+    return get_counter_buffer()
+
+
+def flush_counter_buffer():
+    """
+    Grava o buffer do processo, se existir (fim de worker, testes).
+    """
+    return _buffer.flush() if _buffer is not None else 0
@@ -0,0 +1,121 @@
+# dashboard.py - agregados do dashboard pré-calculados em DashboardSnapshot
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Avg, Count, Q, Sum
+from django.utils import timezone
+
+from .models import DashboardSnapshot, Genre, MovieStats, Preference
+from .serializers import GenreSerializer
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY = 'dashboard'
+
+
+def max_age():
+    """
+    DASHBOARD_SNAPSHOT_MAX_AGE: idade, em segundos, a partir da qual um request
+    agenda o recálculo do snapshot (a resposta continua vindo do snapshot atual).
+    """
+    return getattr(settings, 'DASHBOARD_SNAPSHOT_MAX_AGE', 300)
+
+
+def compute_dashboard():
+    """
+    Calcula os agregados do dashboard com consultas agrupadas (sem percorrer
+    linhas no Python): contadores somados de MovieStats, média das avaliações
+    por gênero a partir de MovieStats, distribuição de filmes por gênero e as
+    preferências resumidas por gênero.
+    """
+    genres = GenreSerializer(Genre.objects.order_by('id'), many=True).data
+
+    # Média por gênero = soma das notas / número de avaliações dos filmes do gênero
+    ratings = [
+        {'genre': row['name'], 'avgRating': float(row['rating_sum']) / row['ratings_count']}
+        for row in Genre.objects.values('name').annotate(
+            rating_sum=Sum('movies__stats__rating_sum'), ratings_count=Sum('movies__stats__ratings_count'),
+        ).filter(ratings_count__gt=0).order_by('name')
+    ]
+
+    totals = MovieStats.objects.aggregate(
+        likes=Sum('likes'), dislikes=Sum('dislikes'), favorites=Sum('favorites'), watched=Sum('watched')
+    )
+    interactions = {key: value or 0 for key, value in totals.items()}
+
+    genre_distribution = [
+        {'name': row['name'], 'value': row['value']}
+        for row in Genre.objects.values('name').annotate(value=Count('movies')).order_by('name')
+    ]
+
+    preferences = [
+        {
+            'genre': {'id': row['genre_id'], 'name': row['genre__name']},
+            'users': row['users'],
+            'favorites': row['favorites'],
+            'avoids': row['avoids'],
+            'avgPriority': round(row['avg_priority'] or 0, 2),
+        }
+        for row in Preference.objects.values('genre_id', 'genre__name').annotate(
+            users=Count('id'),
+            favorites=Count('id', filter=Q(preference_type='favorite')),
+            avoids=Count('id', filter=Q(preference_type='avoid')),
+            avg_priority=Avg('priority'),
+        ).order_by('-users', 'genre__name')
+    ]
+
+    return {
+        'genres': genres,
+        'ratings': ratings,
+        'interactions': interactions,
+        'genreDistribution': genre_distribution,
+        'preferences': preferences,
+    }
+
+
+def refresh_dashboard_snapshot():
+    """
+    Recalcula e grava o snapshot do dashboard.
+
+    :return: DashboardSnapshot gravado.
+    """
+    started = time.perf_counter()
+    data = compute_dashboard()
+    snapshot, _ = DashboardSnapshot.objects.update_or_create(key=SNAPSHOT_KEY, defaults={
+        'data': data,
+        'refreshed_at': timezone.now(),
+        'build_seconds': round(time.perf_counter() - started, 3),
+    })
+    return snapshot
+
+
+_refresh_lock = threading.Lock()
+
+
+def _refresh_job():
+    try:
+        refresh_dashboard_snapshot()
+    except Exception:
+        logger.exception('Falha ao atualizar o snapshot do dashboard')
+    finally:
+        _refresh_lock.release()
+        # A thread abre sua própria conexão; fecha para não deixá-la pendurada
+        connection.close()
+
+
+def get_dashboard_snapshot():
+    """
+    Snapshot atual do dashboard (uma leitura por chave). Sem snapshot, calcula na
+    hora; com um snapshot mais velho que DASHBOARD_SNAPSHOT_MAX_AGE, agenda um
+    recálculo em segundo plano (um por processo de cada vez) e devolve o atual.
+    """
+    snapshot = DashboardSnapshot.objects.filter(key=SNAPSHOT_KEY).first()
+    if snapshot is None:
+        return refresh_dashboard_snapshot()
+    stale = (timezone.now() - snapshot.refreshed_at).total_seconds() > max_age()
+    if stale and _refresh_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_job, name='dashboard-refresh', daemon=True).start()
+    return snapshot
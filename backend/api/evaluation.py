@@ -0,0 +1,363 @@
+# evaluation.py - avaliação offline dos recomendadores (dados sintéticos, divisão temporal e métricas)
+import datetime
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import FavoriteMovie, Genre, LikeDislike, Movie, Preference, Rating, WatchedMovie
+
+POSITIVE_EVENTS = ('like', 'favorite', 'watched', 'rating_high')
+
+
+# ----------------------------------------------------------------------
+# Dados sintéticos
+# ----------------------------------------------------------------------
+def generate_events(n_users=1000, n_movies=2000, n_genres=20, events_per_user=40, skew=1.1, seed=42):
+    """
+    Gera catálogo e histórico de interações em memória, sem tocar no banco.
+
+    - Popularidade dos filmes segue uma lei de potência (Zipf com expoente `skew`):
+      poucos filmes concentram a maior parte das interações.
+    - Cada usuário tem 2-3 gêneros favoritos; filmes desses gêneros têm mais chance de serem escolhidos.
+    - O número de interações por usuário também é assimétrico (lognormal).
+    - Cada interação tem um instante em [0, 1), usado na divisão temporal.
+
+    :return: Dicionário com 'movie_genres' (lista de listas de índices de gênero),
+             'user_genres', 'events' (array estruturado user, movie, time, kind, value).
+    """
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, n_movies + 1) ** skew
+    rng.shuffle(popularity)
+
+    movie_genres = [rng.choice(n_genres, size=rng.integers(1, 4), replace=False) for _ in range(n_movies)]
+    membership = np.zeros((n_movies, n_genres), dtype=np.float32)
+    for movie, genres in enumerate(movie_genres):
+        membership[movie, genres] = 1
+
+    user_genres = [rng.choice(n_genres, size=rng.integers(2, 4), replace=False) for _ in range(n_users)]
+    counts = np.clip(rng.lognormal(np.log(events_per_user), 0.6, size=n_users).astype(int), 3, n_movies // 2)
+
+    users, movies, times, kinds, values = [], [], [], [], []
+    for user in range(n_users):
+        taste = np.zeros(n_genres, dtype=np.float32)
+        taste[user_genres[user]] = 1
+        affinity = membership @ taste
+        weights = popularity * (1 + 4 * affinity)
+        chosen = rng.choice(n_movies, size=counts[user], replace=False, p=weights / weights.sum())
+        chosen_times = rng.random(len(chosen))
+        liked = affinity[chosen] > 0
+        for movie, moment, likes_genre in zip(chosen, chosen_times, liked):
+            users.append(user); movies.append(movie); times.append(moment); kinds.append('watched')
+            values.append(rng.integers(1, 4))
+            if rng.random() < (0.6 if likes_genre else 0.15):
+                users.append(user); movies.append(movie); times.append(moment); kinds.append('like'); values.append(1)
+            elif rng.random() < (0.05 if likes_genre else 0.3):
+                users.append(user); movies.append(movie); times.append(moment); kinds.append('dislike'); values.append(1)
+            if likes_genre and rng.random() < 0.15:
+                users.append(user); movies.append(movie); times.append(moment); kinds.append('favorite'); values.append(1)
+            if rng.random() < 0.3:
+                rating = rng.integers(4, 6) if likes_genre else rng.integers(1, 4)
+                users.append(user); movies.append(movie); times.append(moment)
+                kinds.append('rating_high' if rating >= 4 else 'rating'); values.append(rating)
+
+    events = np.rec.fromarrays(
+        [np.array(users), np.array(movies), np.array(times), np.array(kinds), np.array(values)],
+        names=['user', 'movie', 'time', 'kind', 'value'],
+    )
+    return {
+        'n_users': n_users, 'n_movies': n_movies, 'n_genres': n_genres, 'seed': seed,
+        'movie_genres': movie_genres, 'user_genres': user_genres, 'events': events,
+    }
+
+
+def temporal_split(events, test_fraction=0.2):
+    """
+    Divide o histórico pelo tempo: tudo antes do quantil (1 - test_fraction) é treino,
+    o restante é teste. Assim nenhum modelo vê interações "do futuro".
+    """
+    cutoff = np.quantile(events.time, 1 - test_fraction)
+    return events[events.time < cutoff], events[events.time >= cutoff]
+
+
+@contextmanager
+def isolated_database(alias=DEFAULT_DB_ALIAS):
+    """
+    Troca a conexão por um banco descartável, criado como o dos testes (com as
+    migrações aplicadas), e o apaga no final. O banco configurado não é lido nem
+    escrito: os motores leem tabelas inteiras e alguns treinos as reescrevem
+    (ContentEngine recria MovieSimilarity), e uma transação longa desfeita no
+    final seguraria o lock de escrita do SQLite durante toda a avaliação.
+    """
+    connection = connections[alias]
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    previous_test_name = test_settings.get('NAME')
+    name = f'evaluation_{os.getpid()}'
+    # Nome próprio para não apagar o banco de uma execução de testes em andamento
+    test_settings['NAME'] = (str(Path(old_name).with_name(f'{name}.sqlite3'))
+                             if connection.vendor == 'sqlite' else name)
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield connection
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        test_settings['NAME'] = previous_test_name
+
+
+def write_dataset(data, train_events, batch_size=5000):
+    """
+    Grava no banco o catálogo sintético e somente as interações de treino.
+    Deve ser chamada dentro de isolated_database, nunca no banco configurado.
+
+    :return: (ids dos usuários por índice, ids dos filmes por índice).
+    """
+    seed = data['seed']
+    words = [f'palavra{seed}x{index}' for index in range(data['n_genres'] * 8)]
+    genres = Genre.objects.bulk_create([
+        Genre(name=f'Sintético {seed}-{index}', slug=f'sintetico-{seed}-{index}') for index in range(data['n_genres'])
+    ])
+    rng = np.random.default_rng(seed)
+    movies = Movie.objects.bulk_create([
+        Movie(
+            title=f'Filme sintético {index}', slug=f'filme-sintetico-{seed}-{index}',
+            description=' '.join(words[genre * 8 + rng.integers(8)] for genre in movie_genres for _ in range(3)),
+            release_date=datetime.date(2000, 1, 1), duration=100,
+        )
+        for index, movie_genres in enumerate(data['movie_genres'])
+    ], batch_size=batch_size)
+    Movie.genres.through.objects.bulk_create([
+        Movie.genres.through(movie_id=movies[index].id, genre_id=genres[genre].id)
+        for index, movie_genres in enumerate(data['movie_genres']) for genre in movie_genres
+    ], batch_size=batch_size)
+
+    password = make_password(None)
+    users = User.objects.bulk_create([
+        User(username=f'sintetico_{seed}_{index}', password=password) for index in range(data['n_users'])
+    ], batch_size=batch_size)
+    Preference.objects.bulk_create([
+        Preference(user_id=users[user].id, genre_id=genres[genre].id, preference_type='favorite',
+                   priority=int(rng.integers(1, 6)))
+        for user, user_genres in enumerate(data['user_genres']) for genre in user_genres
+    ], batch_size=batch_size)
+
+    user_ids = np.array([user.id for user in users])
+    movie_ids = np.array([movie.id for movie in movies])
+    rows = {kind: [] for kind in ('watched', 'like', 'dislike', 'favorite', 'rating')}
+    for event in train_events:
+        kind = 'rating' if event.kind.startswith('rating') else event.kind
+        rows[kind].append((int(user_ids[event.user]), int(movie_ids[event.movie]), int(event.value)))
+
+    WatchedMovie.objects.bulk_create([WatchedMovie(user_id=u, movie_id=m, watch_count=v) for u, m, v in rows['watched']],
+                                     batch_size=batch_size, ignore_conflicts=True)
+    # like e dislike do mesmo par não acontecem (gerador escolhe um ou outro)
+    LikeDislike.objects.bulk_create(
+        [LikeDislike(user_id=u, movie_id=m, action='like') for u, m, _ in rows['like']]
+        + [LikeDislike(user_id=u, movie_id=m, action='dislike') for u, m, _ in rows['dislike']],
+        batch_size=batch_size, ignore_conflicts=True)
+    FavoriteMovie.objects.bulk_create([FavoriteMovie(user_id=u, movie_id=m) for u, m, _ in rows['favorite']],
+                                      batch_size=batch_size, ignore_conflicts=True)
+    Rating.objects.bulk_create([Rating(user_id=u, movie_id=m, rating=v) for u, m, v in rows['rating']],
+                               batch_size=batch_size, ignore_conflicts=True)
+    return user_ids, movie_ids
+
+
+def relevant_items(test_events, user_ids, movie_ids):
+    """
+    Filmes relevantes de cada usuário no período de teste (like, favorito,
+    assistido ou nota >= 4), já com os ids do banco.
+
+    :return: {user_id: set(movie_id)}.
+    """
+    relevant = {}
+    positive = np.isin(test_events.kind, POSITIVE_EVENTS)
+    for event in test_events[positive]:
+        relevant.setdefault(int(user_ids[event.user]), set()).add(int(movie_ids[event.movie]))
+    return relevant
+
+
+# ----------------------------------------------------------------------
+# Motores avaliados
+# ----------------------------------------------------------------------
+class Engine:
+    """
+    Adaptador de um recomendador para a avaliação: train() prepara o modelo a
+    partir do banco; recommend(user_id, k) retorna uma lista de movie_ids.
+    """
+    name = None
+
+    def train(self):
+        pass
+
+    def recommend(self, user_id, k):
+        raise NotImplementedError
+
+
+class GenreSQLEngine(Engine):
+    """Pontuação por gêneros no banco (PersonalizedRecommendationsViewOrdeby, engine=sql)."""
+    name = 'genre_sql'
+
+    def recommend(self, user_id, k):
+        from .utils import recommend_movies_by_genre_preferences
+
+        return list(recommend_movies_by_genre_preferences(user_id).values_list('id', flat=True)[:k])
+
+
+class GenreIndexEngine(Engine):
+    """Mesma pontuação com o índice esparso em memória (engine=index)."""
+    name = 'genre_index'
+
+    def train(self):
+        from .genre_index import GenreScoringIndex
+
+        self.index = GenreScoringIndex().load()
+
+    def recommend(self, user_id, k):
+        return [movie_id for movie_id, _ in self.index.recommend(user_id, k)[0]]
+
+
+class PopularityEngine(Engine):
+    """Linha de base: filmes com mais interações positivas no treino, exceto os já vistos."""
+    name = 'popularity'
+
+    def train(self):
+        from .machineLern import DEFAULT_IMPLICIT_WEIGHTS, build_interaction_matrix
+
+        self.interactions = build_interaction_matrix(implicit_weights=DEFAULT_IMPLICIT_WEIGHTS)
+        counts = np.asarray((self.interactions.matrix > 0).sum(axis=0)).ravel()
+        self.ranking = self.interactions.movie_ids[np.argsort(-counts, kind='stable')]
+
+    def recommend(self, user_id, k):
+        row = self.interactions.user_row(user_id)
+        seen = set(self.interactions.movie_ids[row.indices].tolist()) if row is not None else set()
+        result = []
+        for movie_id in self.ranking:
+            if movie_id not in seen:
+                result.append(int(movie_id))
+                if len(result) == k:
+                    break
+        return result
+
+
+class KNNEngine(Engine):
+    """KNN usuário-usuário de machineLern.py (busca exata ou LSH)."""
+
+    def __init__(self, algorithm='brute'):
+        self.algorithm = algorithm
+        self.name = 'knn' if algorithm == 'brute' else f'knn_{algorithm}'
+
+    def train(self):
+        from .machineLern import DEFAULT_IMPLICIT_WEIGHTS, build_interaction_matrix, build_knn_model
+
+        self.interactions = build_interaction_matrix(implicit_weights=DEFAULT_IMPLICIT_WEIGHTS)
+        self.knn = build_knn_model(self.interactions, n_neighbors=20, algorithm=self.algorithm)
+
+    def recommend(self, user_id, k):
+        from .machineLern import recommend_movies_collaborative
+
+        return recommend_movies_collaborative(user_id, self.interactions, self.knn, top_n=k, n_neighbors=20)
+
+
+class ALSEngine(Engine):
+    """Fatoração implícita (api/als.py)."""
+    name = 'als'
+
+    def __init__(self, factors=32, iterations=10):
+        self.factors = factors
+        self.iterations = iterations
+
+    def train(self):
+        from .als import train_als
+        from .machineLern import DEFAULT_IMPLICIT_WEIGHTS, build_interaction_matrix
+
+        self.interactions = build_interaction_matrix(implicit_weights=DEFAULT_IMPLICIT_WEIGHTS, use_watch_count=True)
+        self.user_factors, self.item_factors = train_als(
+            self.interactions.matrix, factors=self.factors, iterations=self.iterations)
+
+    def recommend(self, user_id, k):
+        from .als import top_k_batch
+
+        row = self.interactions.user_index.get(user_id)
+        if row is None:
+            return []
+        _, columns, scores = next(top_k_batch(self.user_factors[row:row + 1], self.item_factors, k=k,
+                                              exclude=self.interactions.matrix[row:row + 1]))
+        return self.interactions.movie_ids[columns[0][np.isfinite(scores[0])]].tolist()
+
+
+class ContentEngine(Engine):
+    """Vizinhos por conteúdo (TF-IDF) a partir do que o usuário gostou (api/content.py)."""
+    name = 'content'
+
+    def train(self):
+        from .content import rebuild_movie_similarities
+
+        rebuild_movie_similarities(k=20)
+
+    def recommend(self, user_id, k):
+        from .content import recommend_movies_content_for_user
+
+        return [movie_id for movie_id, _ in recommend_movies_content_for_user(user_id, limit=k)]
+
+
+def default_engines():
+    """
+    Registro dos motores avaliados por padrão: nome -> fábrica.
+    """
+    return {
+        'genre_sql': GenreSQLEngine,
+        'genre_index': GenreIndexEngine,
+        'popularity': PopularityEngine,
+        'knn': KNNEngine,
+        'knn_lsh': lambda: KNNEngine(algorithm='lsh'),
+        'als': ALSEngine,
+        'content': ContentEngine,
+    }
+
+
+# ----------------------------------------------------------------------
+# Métricas
+# ----------------------------------------------------------------------
+def evaluate_engine(engine, relevant, n_movies, k=10):
+    """
+    Treina o motor e mede qualidade e desempenho para os usuários de teste.
+
+    :return: Dicionário com precision@k, recall@k, coverage, train_seconds,
+             p50/p99 de latência por usuário (ms) e pico de memória no treino (MB).
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    engine.train()
+    train_seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    precisions, recalls, latencies = [], [], []
+    recommended_items = set()
+    for user_id, items in relevant.items():
+        started = time.perf_counter()
+        recommendations = list(engine.recommend(user_id, k))[:k]
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits = len(items.intersection(recommendations))
+        precisions.append(hits / k)
+        recalls.append(hits / len(items))
+        recommended_items.update(recommendations)
+
+    return {
+        f'precision@{k}': round(float(np.mean(precisions)), 4) if precisions else 0.0,
+        f'recall@{k}': round(float(np.mean(recalls)), 4) if recalls else 0.0,
+        'coverage': round(len(recommended_items) / n_movies, 4) if n_movies else 0.0,
+        'train_seconds': round(train_seconds, 3),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3) if latencies else None,
+        'latency_p99_ms': round(float(np.percentile(latencies, 99)), 3) if latencies else None,
+        'peak_memory_mb': round(peak / 1e6, 2),
+        'users_evaluated': len(relevant),
+    }
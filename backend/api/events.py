@@ -0,0 +1,121 @@
+# events.py - histórico de interações somente de inserção e leitura incremental por checkpoint
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import EventCheckpoint, InteractionEvent
+
+
+def log_event(user_id, movie_id, event_type, value=1.0):
+    """
+    Acrescenta uma interação ao histórico. Deve ser chamada na mesma transação
+    que grava a tabela de estado (LikeDislike, WatchedMovie, ...).
+    """
+    return InteractionEvent.objects.create(user_id=user_id, movie_id=movie_id,
+                                           event_type=event_type, value=float(value))
+
+
+def log_events(user_id, events):
+    """
+    Versão em lote de log_event: um único INSERT.
+
+    :param events: Iterável de (movie_id, event_type, value), na ordem em que aconteceram.
+    :return: Número de eventos gravados.
+    """
+    now = timezone.now()
+    rows = [InteractionEvent(user_id=user_id, movie_id=movie_id, event_type=event_type,
+                             value=float(value), created_at=now)
+            for movie_id, event_type, value in events]
+    return len(InteractionEvent.objects.bulk_create(rows)) if rows else 0
+
+
+def settle_seconds():
+    # Eventos mais novos que isso ficam para a próxima leitura: uma transação ainda
+    # aberta pode gravar um id menor que o de outra que já terminou
+    return getattr(settings, 'EVENT_LOG_SETTLE_SECONDS', 5)
+
+
+class EventCursor:
+    """
+    Leitor incremental do histórico para um consumidor (job de treino, agregação):
+    percorre, em ordem de id, os eventos depois do seu checkpoint. O checkpoint
+    só avança com advance(), depois que o consumidor gravou o resultado; se o job
+    falhar, a próxima execução relê os mesmos eventos.
+
+        cursor = EventCursor('train_knn')
+        until = cursor.high_water_mark()
+        for batch in cursor.batches(until_id=until):
+            ...
+        cursor.advance(until)
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def position(self):
+        """
+        Id do último evento processado (0 se o consumidor nunca rodou).
+        """
+        return EventCheckpoint.objects.filter(name=self.name).values_list('last_event_id', flat=True).first() or 0
+
+    def high_water_mark(self):
+        """
+        Maior id que pode ser lido com segurança agora (eventos com mais de
+        EVENT_LOG_SETTLE_SECONDS); fixa o fim de uma leitura.
+
+        A idade vem de created_at, gravado no INSERT, e não do commit: um evento
+        de uma transação aberta há mais de EVENT_LOG_SETTLE_SECONDS que ainda não
+        terminou fica abaixo da marca sem estar visível, e o checkpoint passa por
+        ele. Por isso a janela tem que ser maior que a transação mais longa que
+        grava no histórico (as dos requests de interação duram milissegundos).
+        No SQLite as transações de escrita são serializadas (BEGIN IMMEDIATE) e
+        os ids ficam visíveis em ordem.
+        """
+        cutoff = timezone.now() - timedelta(seconds=settle_seconds())
+        return InteractionEvent.objects.filter(created_at__lte=cutoff).aggregate(last=Max('id'))['last'] or 0
+
+    def batches(self, batch_size=10000, until_id=None, event_types=None):
+        """
+        Gera listas de até batch_size tuplas (id, user_id, movie_id, event_type,
+        value, created_at) com os eventos depois do checkpoint, paginando pelo id
+        (sem OFFSET).
+
+        :param until_id: Último id incluído (padrão: high_water_mark()).
+        :param event_types: Lista de tipos a ler (padrão: todos).
+        """
+        until_id = self.high_water_mark() if until_id is None else until_id
+        after_id = self.position
+        queryset = InteractionEvent.objects.filter(id__lte=until_id)
+        if event_types:
+            queryset = queryset.filter(event_type__in=event_types)
+        while after_id < until_id:
+            batch = list(queryset.filter(id__gt=after_id).order_by('id').values_list(
+                'id', 'user_id', 'movie_id', 'event_type', 'value', 'created_at')[:batch_size])
+            if not batch:
+                break
+            yield batch
+            after_id = batch[-1][0]
+
+    def changed_users(self, until_id=None, batch_size=10000):
+        """
+        Ids dos usuários com eventos depois do checkpoint (linhas a refazer na matriz de interações).
+        """
+        users = set()
+        for batch in self.batches(batch_size, until_id):
+            users.update(row[1] for row in batch)
+        return users
+
+    def pending(self):
+        return InteractionEvent.objects.filter(id__gt=self.position).count()
+
+    def advance(self, event_id):
+        """
+        Grava o checkpoint: eventos até event_id foram processados.
+        """
+        EventCheckpoint.objects.update_or_create(name=self.name, defaults={'last_event_id': event_id})
+
+    def reset(self):
+        EventCheckpoint.objects.filter(name=self.name).delete()
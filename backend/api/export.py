@@ -0,0 +1,124 @@
+# export.py - exportação em streaming (NDJSON ou CSV) das interações, com memória constante
+import csv
+import json
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import FavoriteMovie, InteractionEvent, LikeDislike, Preference, Rating, WatchedMovie
+
+# Conjunto exportado -> (modelo, colunas, campo de data usado pelo filtro since ou None)
+EXPORTS = {
+    'ratings': (Rating, ('id', 'user_id', 'movie_id', 'rating', 'created_at'), 'created_at'),
+    'likes': (LikeDislike, ('id', 'user_id', 'movie_id', 'action', 'created_at'), 'created_at'),
+    'favorites': (FavoriteMovie, ('id', 'user_id', 'movie_id', 'added_at'), 'added_at'),
+    'watched': (WatchedMovie, ('id', 'user_id', 'movie_id', 'watch_count'), None),
+    'preferences': (Preference, ('id', 'user_id', 'genre_id', 'preference_type', 'priority'), None),
+    # Histórico completo (api/events.py): inclui alterações e exclusões, ao contrário das tabelas de estado
+    'events': (InteractionEvent, ('id', 'user_id', 'movie_id', 'event_type', 'value', 'created_at'), 'created_at'),
+}
+
+OUTPUT_FORMATS = ('ndjson', 'csv')
+
+
+class ExportError(ValueError):
+    """
+    Parâmetros de exportação inválidos (conjunto desconhecido, since sem campo de data).
+    """
+
+
+def export_columns(name):
+    if name not in EXPORTS:
+        raise ExportError(f'Conjunto desconhecido: {name}. Opções: {", ".join(EXPORTS)}.')
+    return EXPORTS[name][1]
+
+
+def parse_since(text):
+    """
+    Lê o filtro since (AAAA-MM-DD ou data e hora ISO 8601); sem fuso, vale o fuso do projeto.
+
+    :return: datetime com fuso, ou None se o texto não for uma data.
+    """
+    try:
+        value = parse_datetime(text)
+        day = parse_date(text) if value is None else None
+    except ValueError:  # Formato certo, data inexistente (ex.: 2024-02-30)
+        return None
+    if value is None:
+        if day is None:
+            return None
+        value = datetime.combine(day, time.min)
+    return value if timezone.is_aware(value) else timezone.make_aware(value)
+
+
+def iter_export_rows(name, since=None, after_id=None, chunk_size=2000):
+    """
+    Percorre as linhas do conjunto em ordem de id com iterator(chunk_size) (cursor
+    no servidor no PostgreSQL): só um bloco fica em memória.
+
+    :param since: Só linhas criadas a partir desta data (conjuntos com campo de data).
+                  Alterações de linhas antigas aparecem no conjunto 'events'.
+    :param after_id: Só linhas com id maior (continuação de uma exportação anterior).
+    :return: Gerador de tuplas na ordem de export_columns(name).
+    """
+    columns = export_columns(name)
+    model, _, date_field = EXPORTS[name]
+    queryset = model.objects.all()
+    if since is not None:
+        if date_field is None:
+            raise ExportError(f'O conjunto {name} não tem data; use after_id para exportações incrementais.')
+        queryset = queryset.filter(**{f'{date_field}__gte': since})
+    if after_id is not None:
+        queryset = queryset.filter(id__gt=after_id)
+    return queryset.order_by('id').values_list(*columns).iterator(chunk_size=chunk_size)
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def iter_ndjson(columns, rows):
+    """
+    Uma linha JSON por registro.
+    """
+    for row in rows:
+        yield json.dumps(dict(zip(columns, map(_plain, row))), ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """
+    "Arquivo" cujo write devolve o texto: o csv.writer gera as linhas sem acumulá-las.
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(columns, rows):
+    """
+    Cabeçalho seguido de uma linha CSV por registro.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_plain(value) for value in row])
+
+
+def iter_export(name, output='ndjson', **filters):
+    """
+    Exportação completa em pedaços de texto, prontos para StreamingHttpResponse ou arquivo.
+
+    :param output: 'ndjson' ou 'csv'.
+    :param filters: since, after_id e chunk_size de iter_export_rows.
+    """
+    if output not in OUTPUT_FORMATS:
+        raise ExportError(f'Formato desconhecido: {output}. Opções: {", ".join(OUTPUT_FORMATS)}.')
+    columns = export_columns(name)
+    rows = iter_export_rows(name, **filters)
+    return iter_csv(columns, rows) if output == 'csv' else iter_ndjson(columns, rows)
@@ -0,0 +1,388 @@
+# genre_index.py - índice em memória para pontuação vetorizada das recomendações por gênero
+import sys
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+
+from .models import LikeDislike, Movie, MovieStats, Preference, WatchedMovie
+
+# Mesmos pesos de recommend_movies_by_genre_preferences (utils.py)
+GENRE_PRIORITY_WEIGHT = 2
+LIKED_BONUS = 3
+
+STATS_FIELDS = ('likes', 'dislikes', 'favorites', 'watched')
+
+
+class GenreScoringIndex:
+    """
+    Índice residente no processo que pontua o catálogo inteiro para um usuário
+    com um único produto matriz esparsa × vetor.
+
+    Guarda:
+      - matriz esparsa CSR filmes × gêneros (1 onde o filme tem o gênero);
+      - vetores de estatísticas por filme (likes, dislikes, favoritos, assistidos);
+      - mapas compactos id do filme -> linha e id do gênero -> coluna.
+
+    O vetor do usuário vem das suas linhas de Preference favoritas
+    (2 * prioridade por gênero), e a pontuação é a mesma do motor SQL:
+    filmes assistidos ou descurtidos são mascarados, +3 para filmes curtidos,
+    e o top-K é obtido com ordenação parcial (argpartition), desempate por id.
+
+    Atualização incremental: os sinais de Movie/Genre (api/signals.py) marcam
+    filmes como sujos neste processo, e a cada refresh_interval segundos o índice
+    também procura filmes com updated_at mais recente, para captar mudanças feitas
+    por outros processos. Só as linhas dos filmes alterados são reconstruídas.
+    """
+
+    def __init__(self, refresh_interval=30, stats_ttl=60):
+        self.refresh_interval = refresh_interval
+        self.stats_ttl = stats_ttl
+        self._lock = threading.RLock()
+        self._needs_full_load = True
+        self._dirty_movie_ids = set()
+        self._last_sync = None
+        self._last_poll = 0.0
+        self._stats_loaded_at = 0.0
+        self.build_seconds = None
+        self._reset()
+
+    def _reset(self):
+        self.movie_ids = np.empty(0, dtype=np.int64)  # linha -> id do filme
+        self.genre_ids = np.empty(0, dtype=np.int64)  # coluna -> id do gênero
+        self.movie_rows = {}  # id do filme -> linha
+        self.genre_cols = {}  # id do gênero -> coluna
+        self.active = np.empty(0, dtype=bool)  # False para filmes removidos
+        self._entry_rows = np.empty(0, dtype=np.int32)  # Pares (linha, coluna) da matriz
+        self._entry_cols = np.empty(0, dtype=np.int32)
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self.stats = {field: np.empty(0, dtype=np.int32) for field in STATS_FIELDS}
+
+    # ------------------------------------------------------------------
+    # Construção e atualização
+    # ------------------------------------------------------------------
+    def load(self):
+        """
+        Constrói o índice completo a partir do banco.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            sync_started = Movie.objects.order_by('-updated_at').values_list('updated_at', flat=True).first()
+            self._reset()
+            movie_ids = np.fromiter(Movie.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+            self._add_movie_rows(movie_ids)
+
+            pairs = Movie.genres.through.objects.values_list('movie_id', 'genre_id')
+            self._set_entries([(self.movie_rows[movie_id], genre_id) for movie_id, genre_id in pairs
+                               if movie_id in self.movie_rows])
+            self._load_stats()
+
+            self._needs_full_load = False
+            self._dirty_movie_ids.clear()
+            self._last_sync = sync_started
+            self._last_poll = time.monotonic()
+        self.build_seconds = time.perf_counter() - started
+        return self
+
+    def mark_dirty(self, movie_ids):
+        """
+        Marca filmes cujas linhas devem ser reconstruídas no próximo refresh.
+        """
+        with self._lock:
+            self._dirty_movie_ids.update(movie_ids)
+
+    def mark_stale(self):
+        """
+        Força uma reconstrução completa (ex.: um gênero foi removido).
+        """
+        with self._lock:
+            self._needs_full_load = True
+
+    def refresh(self):
+        """
+        Aplica as mudanças pendentes: reconstrução completa se necessário,
+        senão apenas as linhas dos filmes marcados ou alterados desde o último sync.
+        """
+        with self._lock:
+            if self._needs_full_load:
+                return self.load()
+
+            now = time.monotonic()
+            poll = now - self._last_poll >= self.refresh_interval
+            if poll:
+                self._last_poll = now
+                changed = Movie.objects.all()
+                if self._last_sync is not None:
+                    changed = changed.filter(updated_at__gt=self._last_sync)
+                for movie_id, updated_at in changed.values_list('id', 'updated_at'):
+                    self._dirty_movie_ids.add(movie_id)
+                    self._last_sync = max(self._last_sync, updated_at) if self._last_sync else updated_at
+
+            if self._dirty_movie_ids:
+                self._apply_movie_updates(self._dirty_movie_ids)
+                self._dirty_movie_ids = set()
+
+            # Remoções feitas por outros processos não alteram updated_at: detecta pela contagem
+            if poll and Movie.objects.count() != int(self.active.sum()):
+                return self.load()
+
+            if now - self._stats_loaded_at >= self.stats_ttl:
+                self._load_stats()
+        return self
+
+    def _apply_movie_updates(self, movie_ids):
+        movie_ids = np.fromiter(movie_ids, dtype=np.int64)
+        existing = set(Movie.objects.filter(id__in=movie_ids.tolist()).values_list('id', flat=True))
+
+        new_ids = np.array(sorted(movie_id for movie_id in existing if movie_id not in self.movie_rows), dtype=np.int64)
+        self._add_movie_rows(new_ids)
+
+        rows = np.array([self.movie_rows[movie_id] for movie_id in movie_ids.tolist() if movie_id in self.movie_rows],
+                        dtype=np.int32)
+        self.active[rows] = [int(self.movie_ids[row]) in existing for row in rows]
+
+        # Remove as entradas antigas das linhas alteradas e adiciona as atuais
+        keep = ~np.isin(self._entry_rows, rows)
+        self._entry_rows, self._entry_cols = self._entry_rows[keep], self._entry_cols[keep]
+        pairs = Movie.genres.through.objects.filter(movie_id__in=list(existing)).values_list('movie_id', 'genre_id')
+        self._set_entries([(self.movie_rows[movie_id], genre_id) for movie_id, genre_id in pairs], append=True)
+
+        stats = MovieStats.objects.filter(movie_id__in=list(existing)).values_list('movie_id', *STATS_FIELDS)
+        for movie_id, *values in stats:
+            for field, value in zip(STATS_FIELDS, values):
+                self.stats[field][self.movie_rows[movie_id]] = value
+
+    def _add_movie_rows(self, new_ids):
+        if not len(new_ids):
+            return
+        start = len(self.movie_ids)
+        self.movie_ids = np.concatenate([self.movie_ids, new_ids])
+        self.active = np.concatenate([self.active, np.ones(len(new_ids), dtype=bool)])
+        for field in STATS_FIELDS:
+            self.stats[field] = np.concatenate([self.stats[field], np.zeros(len(new_ids), dtype=np.int32)])
+        self.movie_rows.update((int(movie_id), start + offset) for offset, movie_id in enumerate(new_ids.tolist()))
+
+    def _set_entries(self, row_genre_pairs, append=False):
+        cols = []
+        for _, genre_id in row_genre_pairs:
+            if genre_id not in self.genre_cols:
+                self.genre_cols[genre_id] = len(self.genre_cols)
+            cols.append(self.genre_cols[genre_id])
+        self.genre_ids = np.fromiter(self.genre_cols.keys(), dtype=np.int64, count=len(self.genre_cols))
+
+        rows = np.fromiter((row for row, _ in row_genre_pairs), dtype=np.int32, count=len(row_genre_pairs))
+        cols = np.array(cols, dtype=np.int32)
+        if append:
+            rows = np.concatenate([self._entry_rows, rows])
+            cols = np.concatenate([self._entry_cols, cols])
+        self._entry_rows, self._entry_cols = rows, cols
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(self.movie_ids), len(self.genre_cols)),
+        )
+
+    def _load_stats(self):
+        for field in STATS_FIELDS:
+            self.stats[field] = np.zeros(len(self.movie_ids), dtype=np.int32)
+        for movie_id, *values in MovieStats.objects.values_list('movie_id', *STATS_FIELDS):
+            row = self.movie_rows.get(movie_id)
+            if row is None:
+                continue
+            for field, value in zip(STATS_FIELDS, values):
+                self.stats[field][row] = value
+        self._stats_loaded_at = time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Pontuação
+    # ------------------------------------------------------------------
+    def get_user_signals(self, user):
+        """
+        Lê do banco os sinais do usuário usados na pontuação.
+
+        :return: (lista de (genre_id, priority) favoritos, ids curtidos, ids descurtidos, ids assistidos)
+        """
+        preferences = list(
+            Preference.objects.filter(user=user, preference_type='favorite').values_list('genre_id', 'priority')
+        )
+        liked, disliked = [], []
+        actions = LikeDislike.objects.filter(user=user, action__in=['like', 'dislike']).values_list('movie_id', 'action')
+        for movie_id, action in actions:
+            (liked if action == 'like' else disliked).append(movie_id)
+        watched = list(WatchedMovie.objects.filter(user=user).values_list('movie_id', flat=True))
+        return preferences, liked, disliked, watched
+
+    def score_user(self, preferences, liked=(), disliked=(), watched=()):
+        """
+        Calcula a pontuação de todos os filmes do catálogo para um usuário.
+
+        :return: Vetor float32 (uma posição por linha do índice), com -inf nos filmes
+                 que não são candidatos (sem gênero favorito, assistidos, descurtidos ou removidos).
+        """
+        user_vector = np.zeros(len(self.genre_cols), dtype=np.float32)
+        favorite_mask = np.zeros(len(self.genre_cols), dtype=np.float32)
+        for genre_id, priority in preferences:
+            col = self.genre_cols.get(genre_id)
+            if col is not None:
+                user_vector[col] += GENRE_PRIORITY_WEIGHT * priority
+                favorite_mask[col] = 1
+
+        scores = self.matrix @ user_vector
+        # Candidato = tem algum gênero favorito (como a junção do SQL), mesmo com prioridade 0
+        candidates = ((self.matrix @ favorite_mask) > 0) & self.active
+
+        liked_rows = self._rows_for(liked)
+        scores[liked_rows] += LIKED_BONUS
+        candidates[self._rows_for(disliked)] = False
+        candidates[self._rows_for(watched)] = False
+
+        scores[~candidates] = -np.inf
+        return scores
+
+    def _rows_for(self, movie_ids):
+        return np.array([self.movie_rows[movie_id] for movie_id in movie_ids if movie_id in self.movie_rows],
+                        dtype=np.intp)
+
+    def rank(self, user):
+        """
+        Pontua o catálogo para o usuário e retorna um RankedMovies (ainda não ordenado).
+        """
+        signals = self.get_user_signals(user)
+        self.refresh()
+        with self._lock:
+            return RankedMovies(self.score_user(*signals), self.movie_ids)
+
+    def recommend(self, user, k=10, offset=0):
+        """
+        Retorna (lista de (movie_id, score), total de candidatos) para o usuário.
+        """
+        ranked = self.rank(user)
+        return ranked.top_k(k, offset), ranked.count()
+
+    # ------------------------------------------------------------------
+    # Diagnóstico
+    # ------------------------------------------------------------------
+    def memory_usage(self):
+        """
+        Retorna o consumo de memória aproximado do índice, em bytes, por componente.
+        """
+        usage = {
+            'matrix': self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes,
+            'entries': self._entry_rows.nbytes + self._entry_cols.nbytes,
+            'ids': self.movie_ids.nbytes + self.genre_ids.nbytes + self.active.nbytes,
+            'stats': sum(vector.nbytes for vector in self.stats.values()),
+            'maps': sys.getsizeof(self.movie_rows) + sys.getsizeof(self.genre_cols),
+        }
+        usage['total'] = sum(usage.values())
+        return usage
+
+    def describe(self):
+        return {
+            'movies': int(self.active.sum()),
+            'genres': len(self.genre_cols),
+            'nnz': int(self.matrix.nnz),
+            'build_seconds': self.build_seconds,
+            'pending_updates': len(self._dirty_movie_ids),
+            'memory_bytes': self.memory_usage(),
+        }
+
+
+class RankedMovies:
+    """
+    Resultado da pontuação de um usuário: vetor de scores e o mapa linha -> id do
+    filme no momento da pontuação (os arrays do índice são substituídos, não
+    alterados, quando filmes são adicionados, então a referência é estável).
+    """
+
+    def __init__(self, scores, movie_ids):
+        self.scores = scores
+        self.movie_ids = movie_ids
+
+    def count(self):
+        return int(np.isfinite(self.scores).sum())
+
+    def top_k(self, k, offset=0):
+        """
+        Seleciona as posições [offset, offset + k) do ranking por (-score, id do filme)
+        usando ordenação parcial, sem ordenar o catálogo inteiro.
+
+        :return: Lista de tuplas (movie_id, score).
+        """
+        scores, movie_ids = self.scores, self.movie_ids
+        candidate_rows = np.flatnonzero(np.isfinite(scores))
+        needed = min(offset + k, len(candidate_rows))
+        if needed <= offset:
+            return []
+
+        candidate_scores = scores[candidate_rows]
+        if needed < len(candidate_rows):
+            part = np.argpartition(-candidate_scores, needed - 1)[:needed]
+            threshold = candidate_scores[part].min()
+            # Empates no limite são resolvidos por id, como no ORDER BY -score, id
+            above = candidate_rows[candidate_scores > threshold]
+            ties = candidate_rows[candidate_scores == threshold]
+            missing = needed - len(above)
+            if missing < len(ties):
+                ties = ties[np.argpartition(movie_ids[ties], missing - 1)[:missing]]
+            selected = np.concatenate([above, ties])
+        else:
+            selected = candidate_rows
+
+        order = np.lexsort((movie_ids[selected], -scores[selected]))
+        selected = selected[order][offset:offset + k]
+        return [(int(movie_ids[row]), float(scores[row])) for row in selected]
+
+
+class IndexedRecommendations:
+    """
+    Sequência preguiçosa sobre um RankedMovies, compatível com MoviePagination:
+    o paginador chama count() e depois pede uma fatia, e só os filmes dessa
+    fatia são selecionados (top-K parcial) e carregados do banco.
+    """
+
+    def __init__(self, ranked):
+        self.ranked = ranked
+
+    def count(self):
+        return self.ranked.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        start = item.start or 0
+        stop = item.stop if item.stop is not None else self.count()
+        pairs = self.ranked.top_k(stop - start, start)
+        movies = Movie.objects.prefetch_related('genres').in_bulk([movie_id for movie_id, _ in pairs])
+        result = []
+        for movie_id, score in pairs:
+            movie = movies.get(movie_id)
+            if movie is not None:
+                movie.score = int(score)
+                result.append(movie)
+        return result
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_genre_index():
+    """
+    Retorna o índice do processo, criando-o na primeira chamada (carregamento preguiçoso).
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = GenreScoringIndex()
+    return _index
+
+
+def peek_genre_index():
+    """
+    Retorna o índice do processo apenas se já tiver sido criado (usado pelos sinais).
+    """
+    return _index
@@ -0,0 +1,185 @@
+# hybrid.py - recomendação híbrida: fontes de candidatos em paralelo, com orçamento de tempo, e mistura ponderada
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+from .content import recommend_movies_content_for_user
+from .machineLern import recommend_movies_from_neighbours
+from .model_store import get_model_registry
+from .models import LikeDislike, WatchedMovie
+from .utils import recommend_movies_by_genre_preferences
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HYBRID_WEIGHTS = {'collaborative': 1.0, 'content': 1.0, 'genre': 1.0}
+
+
+def collaborative_candidates(user_id, limit):
+    """
+    Filmes dos vizinhos do usuário (tabela de vizinhos do modelo 'knn' ativo).
+    """
+    artifact = get_model_registry().get('knn')
+    if artifact is None:
+        return None
+    return recommend_movies_from_neighbours(user_id, artifact, top_n=limit)
+
+
+def content_candidates(user_id, limit):
+    """
+    Filmes parecidos com os que o usuário gostou (tabela MovieSimilarity).
+    """
+    return recommend_movies_content_for_user(user_id, limit=limit)
+
+
+def genre_candidates(user_id, limit):
+    """
+    Pontuação por gêneros favoritos, calculada no banco.
+    """
+    movies = recommend_movies_by_genre_preferences(user_id).values_list('id', 'score')[:limit]
+    return [(movie_id, float(score)) for movie_id, score in movies]
+
+
+# Fontes disponíveis: nome -> função(user_id, limite) que retorna [(movie_id, pontuação)]
+# ou None quando a fonte não está disponível (ex.: modelo não treinado)
+CANDIDATE_SOURCES = {
+    'collaborative': collaborative_candidates,
+    'content': content_candidates,
+    'genre': genre_candidates,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'HYBRID_WORKERS', 8),
+                    thread_name_prefix='hybrid',
+                )
+    return _executor
+
+
+class SourceTimeout(Exception):
+    """
+    A fonte passou do prazo do request: nem começou a tempo ou teve a consulta interrompida.
+    """
+
+
+@contextmanager
+def _query_deadline(deadline):
+    """
+    Interrompe as consultas desta thread que passarem do prazo (time.perf_counter()),
+    para que uma fonte atrasada devolva sua thread do pool logo depois do orçamento:
+    no SQLite, um progress handler aborta a consulta em andamento; no PostgreSQL,
+    statement_timeout com o tempo restante (a conexão é fechada ao fim da fonte).
+    """
+    connection.ensure_connection()
+    if connection.vendor == 'sqlite':
+        connection.connection.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+        try:
+            yield
+        finally:
+            connection.connection.set_progress_handler(None, 1000)
+        return
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SET statement_timeout = %s', [max(int((deadline - time.perf_counter()) * 1000), 1)])
+    yield
+
+
+def _run_source(name, user_id, limit, deadline):
+    started = time.perf_counter()
+    if started >= deadline:
+        raise SourceTimeout(name)  # Esperou na fila do pool além do orçamento
+    try:
+        with _query_deadline(deadline):
+            return CANDIDATE_SOURCES[name](user_id, limit), time.perf_counter() - started
+    except OperationalError as error:
+        if time.perf_counter() >= deadline:
+            raise SourceTimeout(name) from error
+        raise
+    finally:
+        # Cada thread do pool usa sua própria conexão; fecha ao terminar
+        connection.close()
+
+
+def blend(candidates, weights, limit):
+    """
+    Mistura as listas das fontes: as pontuações de cada fonte são normalizadas
+    pelo maior valor da fonte (0..1) e somadas com o peso da fonte.
+
+    :param candidates: {fonte: [(movie_id, pontuação), ...]}.
+    :return: Lista de (movie_id, pontuação, [fontes]) em ordem decrescente.
+    """
+    blended = {}
+    for name, rows in candidates.items():
+        rows = [(movie_id, score) for movie_id, score in rows if score > 0]
+        if not rows:
+            continue
+        top = max(score for _, score in rows)
+        for movie_id, score in rows:
+            entry = blended.setdefault(movie_id, [0.0, []])
+            entry[0] += weights.get(name, 0) * score / top
+            entry[1].append(name)
+    ranked = sorted(blended.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+    return [(movie_id, round(score, 4), sources) for movie_id, (score, sources) in ranked]
+
+
+def hybrid_recommendations(user_id, limit=20, weights=None, budget=None):
+    """
+    Executa as fontes com peso > 0 em paralelo e mistura os resultados. Fontes que
+    passam do orçamento (em segundos) ficam de fora da resposta; as que terminam
+    a tempo entram. Filmes assistidos ou descurtidos são removidos no final.
+
+    :return: (lista de (movie_id, pontuação, [fontes]), {fonte: {'status', 'ms', 'count'}}).
+    """
+    weights = weights or getattr(settings, 'HYBRID_WEIGHTS', DEFAULT_HYBRID_WEIGHTS)
+    budget = budget if budget is not None else getattr(settings, 'HYBRID_BUDGET_MS', 300) / 1000
+    names = [name for name in CANDIDATE_SOURCES if weights.get(name, 0) > 0]
+
+    # Pede mais candidatos que o limite: parte deles será descartada como já vista
+    started = time.perf_counter()
+    deadline = started + budget
+    futures = {_get_executor().submit(_run_source, name, user_id, limit * 2, deadline): name for name in names}
+    done, not_done = wait(futures, timeout=budget)
+
+    candidates = {}
+    sources = {}
+    for future, name in futures.items():
+        if future in not_done:
+            # Se ainda não começou, nem roda; se já começou, a consulta é interrompida no
+            # prazo (_query_deadline) e o resultado é ignorado
+            future.cancel()
+            sources[name] = {'status': 'timeout', 'ms': round((time.perf_counter() - started) * 1000, 1)}
+            continue
+        try:
+            rows, elapsed = future.result()
+        except SourceTimeout:
+            sources[name] = {'status': 'timeout', 'ms': round((time.perf_counter() - started) * 1000, 1)}
+            continue
+        except Exception:
+            logger.exception('Falha na fonte de recomendação %s', name)
+            sources[name] = {'status': 'error'}
+            continue
+        if rows is None:
+            sources[name] = {'status': 'unavailable', 'ms': round(elapsed * 1000, 1)}
+            continue
+        candidates[name] = rows
+        sources[name] = {'status': 'ok' if rows else 'empty', 'ms': round(elapsed * 1000, 1), 'count': len(rows)}
+
+    excluded = set(WatchedMovie.objects.filter(user_id=user_id).values_list('movie_id', flat=True))
+    excluded.update(LikeDislike.objects.filter(user_id=user_id, action='dislike').values_list('movie_id', flat=True))
+    candidates = {
+        name: [(movie_id, score) for movie_id, score in rows if movie_id not in excluded]
+        for name, rows in candidates.items()
+    }
+    return blend(candidates, weights, limit), sources
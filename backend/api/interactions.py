@@ -0,0 +1,215 @@
+# interactions.py - gravação de interações: contagem atômica de assistências e lote (/api/interactions/batch/)
+from django.db import connection, transaction
+from django.db.models import F
+
+from .counters import counter_buffer
+from .events import log_event, log_events
+from .models import FavoriteMovie, LikeDislike, Rating, WatchedMovie
+from .outbox import enqueue_interactions
+from .recommendations import remove_user_recommendations, schedule_refresh
+from .stats import like_action_deltas
+from .trending import record_event, record_events, trending_transition
+from .utils import preference_for_rating
+
+LIKE_TYPES = ('like', 'dislike', 'none')
+EVENT_TYPES = LIKE_TYPES + ('watched', 'favorite', 'rating')
+
+# Ajuste de preferência de cada ação de like/dislike ('none' não ajusta)
+LIKE_PREFERENCES = {'like': ('favorite', 1), 'dislike': ('avoid', -1)}
+
+
+def upsert_watches(user_id, increments):
+    """
+    Cria ou incrementa WatchedMovie.watch_count de vários filmes em um único comando,
+    com a soma feita pelo banco (sem ler a linha antes, sem perder incrementos
+    concorrentes):
+
+        INSERT ... VALUES (...), (...) ON CONFLICT (user_id, movie_id)
+        DO UPDATE SET watch_count = watch_count + EXCLUDED.watch_count
+        RETURNING id, movie_id, watch_count
+
+    Outros bancos usam bulk_create com ignore_conflicts, UPDATE com F() e uma leitura.
+    Não dispara post_save: quem chama aplica os efeitos (ver record_watch).
+
+    :param increments: Dicionário {movie_id: assistências a somar (>= 1)}.
+    :return: Dicionário {movie_id: (id da linha, novo watch_count, criada)}. A linha
+             foi criada agora se o novo valor é igual ao incremento (linhas existentes
+             já tinham pelo menos 1).
+    """
+    movie_ids = sorted(increments)  # Ordem fixa: transações concorrentes travam as linhas na mesma ordem
+    if not movie_ids:
+        return {}
+
+    if connection.vendor in ('postgresql', 'sqlite'):
+        quote = connection.ops.quote_name
+        table = quote(WatchedMovie._meta.db_table)
+        values = ', '.join(['(%s, %s, %s)'] * len(movie_ids))
+        params = []
+        for movie_id in movie_ids:
+            params.extend([user_id, movie_id, increments[movie_id]])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({quote("user_id")}, {quote("movie_id")}, {quote("watch_count")}) '
+                f'VALUES {values} ON CONFLICT ({quote("user_id")}, {quote("movie_id")}) DO UPDATE SET '
+                f'{quote("watch_count")} = {table}.{quote("watch_count")} + EXCLUDED.{quote("watch_count")} '
+                f'RETURNING {quote("id")}, {quote("movie_id")}, {quote("watch_count")}',
+                params,
+            )
+            rows = cursor.fetchall()
+    else:
+        with transaction.atomic():
+            # Linhas novas nascem com 0 e recebem o incremento no UPDATE, como as existentes
+            WatchedMovie.objects.bulk_create(
+                [WatchedMovie(user_id=user_id, movie_id=movie_id, watch_count=0) for movie_id in movie_ids],
+                ignore_conflicts=True,
+            )
+            for movie_id in movie_ids:
+                WatchedMovie.objects.filter(user_id=user_id, movie_id=movie_id) \
+                    .update(watch_count=F('watch_count') + increments[movie_id])
+            rows = WatchedMovie.objects.filter(user_id=user_id, movie_id__in=movie_ids) \
+                .values_list('id', 'movie_id', 'watch_count')
+    return {movie_id: (pk, count, count == increments[movie_id]) for pk, movie_id, count in rows}
+
+
+def record_watch(user_id, movie_id):
+    """
+    Registra uma assistência: cria ou incrementa a linha com upsert_watches e
+    aplica os mesmos efeitos do post_save de WatchedMovie (api/signals.py):
+    tira o filme da lista materializada, agenda o recálculo e grava o evento no
+    histórico. Cada assistência é um evento novo (watch_count + 1), então soma
+    na tendência aqui mesmo, sem passar pelo outbox.
+
+    No modo 'buffered' (api/counters.py), linhas que o processo já sabe que existem
+    recebem a assistência pelo buffer, sem comando no banco; o watch_count
+    devolvido soma o valor gravado com o que ainda está pendente.
+
+    :return: (WatchedMovie com o watch_count atualizado, criado).
+    """
+    buffer = counter_buffer()
+    known = buffer.known_watch(user_id, movie_id) if buffer is not None else None
+    if known is not None:
+        pk, stored = known
+        # O incremento só entra no buffer no commit: soma-o aqui
+        watch_count = stored + buffer.pending_watches(user_id, movie_id, pk) + 1
+        buffer.add_watch(user_id, movie_id, pk)
+        created = False
+    else:
+        pk, watch_count, created = upsert_watches(user_id, {movie_id: 1})[movie_id]
+        if buffer is not None:
+            buffer.remember_watch(user_id, movie_id, pk, watch_count)
+    remove_user_recommendations(user_id, [movie_id])
+    schedule_refresh(user_id)
+    record_event(movie_id, 'watch')
+    log_event(user_id, movie_id, 'watch')
+    return WatchedMovie(pk=pk, user_id=user_id, movie_id=movie_id, watch_count=watch_count), created
+
+
+def apply_interaction_batch(user_id, events):
+    """
+    Grava um lote de interações do usuário em uma única transação: lê o estado
+    atual de cada tabela com uma consulta (linhas travadas, como em
+    like_dislike_action), aplica os eventos em ordem na memória e grava o estado
+    final com um upsert por tabela; assistências são somadas pelo banco
+    (upsert_watches). Contadores e preferências vão para o outbox num único
+    INSERT, junto com as mudanças de estado para a tendência (trending_transition);
+    os eventos vão para o histórico (api/events.py) em outro INSERT. Assistências
+    somam na tendência na hora, como em record_watch, e a lista materializada é
+    atualizada como nos receptores de api/signals.py (bulk_create não dispara post_save).
+
+    Vários eventos do mesmo filme no lote valem na ordem em que chegaram
+    (ex.: like seguido de dislike termina em dislike).
+
+    :param events: Lista de dicionários validados {'type', 'movie_id', 'rating'}
+                   com filmes existentes.
+    :return: Lista com o resultado de cada evento: 'created', 'updated' ou 'unchanged'.
+    """
+    def movies_of(types):
+        return sorted({event['movie_id'] for event in events if event['type'] in types})
+
+    with transaction.atomic():
+        likes = dict(LikeDislike.objects.select_for_update()
+                     .filter(user_id=user_id, movie_id__in=movies_of(LIKE_TYPES)).values_list('movie_id', 'action'))
+        favorites = set(FavoriteMovie.objects.select_for_update()
+                        .filter(user_id=user_id, movie_id__in=movies_of(['favorite'])).values_list('movie_id', flat=True))
+        ratings = dict(Rating.objects.select_for_update()
+                       .filter(user_id=user_id, movie_id__in=movies_of(['rating'])).values_list('movie_id', 'rating'))
+
+        like_rows, watch_rows, favorite_rows, rating_rows = {}, {}, [], {}
+        effects = []  # (movie_id, incrementos de MovieStats, ajuste de preferência, tendência) para o outbox
+        trending = []  # Assistências (movie_id, 'watch', 1.0) para api/trending.py
+        history = []  # (movie_id, tipo, valor) para o histórico (api/events.py)
+        results = []
+        for event in events:
+            kind, movie_id = event['type'], event['movie_id']
+            if kind in LIKE_TYPES:
+                previous = likes.get(movie_id)
+                results.append('created' if previous is None else 'unchanged' if previous == kind else 'updated')
+                likes[movie_id] = like_rows[movie_id] = kind
+                effects.append((movie_id, like_action_deltas(previous, kind), LIKE_PREFERENCES.get(kind),
+                                trending_transition('like', previous, kind)))
+                history.append((movie_id, kind, 1.0))
+            elif kind == 'watched':
+                # O resultado depende do upsert (linha criada ou não), definido abaixo
+                results.append(None)
+                watch_rows.setdefault(movie_id, []).append(len(results) - 1)
+                trending.append((movie_id, 'watch', 1.0))
+                history.append((movie_id, 'watch', 1.0))
+            elif kind == 'favorite':
+                if movie_id in favorites:
+                    results.append('unchanged')
+                    continue
+                results.append('created')
+                favorites.add(movie_id)
+                favorite_rows.append(movie_id)
+                effects.append((movie_id, {'favorites': 1}, ('favorite', 1), trending_transition('favorite', False, True)))
+                history.append((movie_id, 'favorite', 1.0))
+            else:
+                rating = event['rating']
+                previous = ratings.get(movie_id)
+                if previous is None:
+                    results.append('created')
+                    stats = {'ratings_count': 1, 'rating_sum': rating}
+                else:
+                    results.append('unchanged' if previous == rating else 'updated')
+                    stats = {'rating_sum': rating - previous}
+                ratings[movie_id] = rating_rows[movie_id] = rating
+                effects.append((movie_id, stats, preference_for_rating(rating, created=previous is None),
+                                trending_transition('rating', previous, rating)))
+                history.append((movie_id, 'rating', rating))
+
+        # Um upsert por tabela com o estado final de cada filme
+        if like_rows:
+            LikeDislike.objects.bulk_create(
+                [LikeDislike(user_id=user_id, movie_id=movie_id, action=action) for movie_id, action in like_rows.items()],
+                update_conflicts=True, unique_fields=['user', 'movie'], update_fields=['action'],
+            )
+        watches = upsert_watches(user_id, {movie_id: len(indexes) for movie_id, indexes in watch_rows.items()})
+        buffer = counter_buffer()
+        if buffer is not None:
+            for movie_id, (pk, watch_count, _) in watches.items():
+                buffer.remember_watch(user_id, movie_id, pk, watch_count)
+        for movie_id, indexes in watch_rows.items():
+            created = watches[movie_id][2]
+            for position, index in enumerate(indexes):
+                results[index] = 'created' if created and not position else 'updated'
+            if created:
+                effects.append((movie_id, {'watched': 1}, ('favorite', 1), None))
+        if favorite_rows:
+            FavoriteMovie.objects.bulk_create(
+                [FavoriteMovie(user_id=user_id, movie_id=movie_id) for movie_id in favorite_rows],
+                ignore_conflicts=True,
+            )
+        if rating_rows:
+            Rating.objects.bulk_create(
+                [Rating(user_id=user_id, movie_id=movie_id, rating=rating) for movie_id, rating in rating_rows.items()],
+                update_conflicts=True, unique_fields=['user', 'movie'], update_fields=['rating'],
+            )
+
+        enqueue_interactions(user_id, effects)
+        record_events(trending)
+        log_events(user_id, history)
+        removed = list(watch_rows) + [movie_id for movie_id, action in like_rows.items() if action == 'dislike']
+        if removed:
+            remove_user_recommendations(user_id, removed)
+        schedule_refresh(user_id)
+    return results
@@ -1,108 +1,555 @@
 # /machineLern.py
 import numpy as np
-import pandas as pd
+from scipy import sparse
 from sklearn.neighbors import NearestNeighbors
 from sklearn.metrics.pairwise import cosine_similarity
-from .models import Rating, Movie
+from .ann import RandomProjectionLSH
+from .models import Rating, Movie, LikeDislike, FavoriteMovie, WatchedMovie
 from sklearn.feature_extraction.text import TfidfVectorizer
 
+# Pesos padrão dos sinais implícitos somados à avaliação explícita na matriz de interações
+DEFAULT_IMPLICIT_WEIGHTS = {
+    'like': 1.0,
+    'dislike': -1.0,
+    'favorite': 2.0,
+    'watched': 1.0,
+}
+
+
+class InteractionMatrix:
+    """
+    Matriz esparsa (CSR) usuários x filmes com os mapas id <-> linha/coluna.
+
+    :param matrix: scipy.sparse.csr_matrix de forma (n_usuarios, n_filmes).
+    :param user_ids: Array com o id do usuário de cada linha.
+    :param movie_ids: Array com o id do filme de cada coluna.
+    """
+
+    def __init__(self, matrix, user_ids, movie_ids, index=True):
+        self.matrix = matrix
+        self.user_ids = user_ids
+        self.movie_ids = movie_ids
+        self.user_index = {int(user_id): row for row, user_id in enumerate(user_ids.tolist())} if index else {}
+        self.movie_index = {int(movie_id): col for col, movie_id in enumerate(movie_ids.tolist())} if index else {}
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def user_row(self, user_id):
+        """
+        Retorna a linha do usuário (matriz esparsa 1 x n_filmes) ou None se ele não tiver interações.
+        """
+        row = self.user_index.get(user_id)
+        if row is None:
+            return None
+        return self.matrix[row]
+
+    def memory_usage(self):
+        """
+        Bytes ocupados pela matriz e pelos arrays de ids.
+        """
+        return (self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes
+                + self.user_ids.nbytes + self.movie_ids.nbytes)
+
+
+def _as_sparse(interaction_matrix):
+    """
+    Aceita InteractionMatrix, matriz scipy.sparse ou DataFrame (formato antigo) e
+    retorna a matriz usada pelo KNN, sem densificar matrizes esparsas.
+    """
+    if isinstance(interaction_matrix, InteractionMatrix):
+        return interaction_matrix.matrix
+    if sparse.issparse(interaction_matrix):
+        return interaction_matrix.tocsr()
+    return interaction_matrix.to_numpy()
+
+
+def _as_interaction_matrix(interaction_matrix):
+    """
+    Aceita InteractionMatrix ou DataFrame usuários x filmes (formato antigo, índice = user_id).
+    """
+    if isinstance(interaction_matrix, InteractionMatrix):
+        return interaction_matrix
+    return InteractionMatrix(
+        sparse.csr_matrix(interaction_matrix.to_numpy(dtype=np.float32)),
+        np.asarray(interaction_matrix.index),
+        np.asarray(interaction_matrix.columns),
+    )
+
+
 def recommend_movies_user_based(user_id, interaction_matrix, knn_model, n_recommendations=10):
     """
     Recomenda filmes com base em usuários similares (KNN).
     
     :param user_id: ID do usuário para quem gerar recomendações.
-    :param interaction_matrix: Matriz de interações (usuários x filmes).
+    :param interaction_matrix: InteractionMatrix (usuários x filmes), ou DataFrame no formato antigo.
     :param knn_model: Modelo KNN já treinado.
     :param n_recommendations: Número de filmes a recomendar.
-    :return: Lista de IDs de filmes recomendados.
+    :return: Lista de IDs de filmes recomendados, do mais relevante ao menos relevante.
     """
-    try:
-        # Verificar se o usuário está na matriz de interações
-        user_index = interaction_matrix.index.get_loc(user_id)
-    except KeyError:
-        # Usuário não possui interações, retornar lista vazia
-        return []
-
-    # Obter os usuários mais próximos
-    user_interactions = interaction_matrix.iloc[user_index].values.reshape(1, -1)
-    distances, indices = knn_model.kneighbors(user_interactions, n_neighbors=6)  # Incluir 5 vizinhos + usuário atual
+    recommendations = recommend_movies_user_based_batch([user_id], interaction_matrix, knn_model,
+                                                        n_recommendations=n_recommendations, n_neighbors=5)
+    # Filmes em ordem de pontuação (interações dos 5 vizinhos ponderadas pela similaridade)
+    return [movie_id for movie_id, _ in recommendations[user_id]]
 
-    # Excluir o próprio usuário dos resultados
-    similar_users = indices.flatten()[1:]
 
-    # Obter os filmes que esses usuários interagiram positivamente
-    recommended_movies = set()
-    for similar_user_index in similar_users:
-        similar_user_id = interaction_matrix.index[similar_user_index]
-        similar_user_movies = interaction_matrix.loc[similar_user_id]
-        
-        # Filmes que o usuário similar avaliou positivamente (ou interagiu)
-        liked_movies = similar_user_movies[similar_user_movies > 0].index
-        recommended_movies.update(liked_movies)
+def _iter_chunks(queryset, fields, chunk_size, user_ids=None):
+    """
+    Percorre o queryset em blocos de chunk_size tuplas, com iterator() (cursor no servidor).
 
-    # Remover filmes que o usuário já interagiu
-    user_watched_movies = interaction_matrix.loc[user_id]
-    already_watched = set(user_watched_movies[user_watched_movies > 0].index)
-    recommended_movies -= already_watched
+    :param user_ids: Se informado, só as linhas desses usuários (filtradas em grupos de ids).
+    """
+    if user_ids is None:
+        querysets = [queryset]
+    else:
+        user_ids = [int(user_id) for user_id in user_ids]
+        querysets = [queryset.filter(user_id__in=user_ids[start:start + 10000])
+                     for start in range(0, len(user_ids), 10000)]
 
-    # Retornar apenas os primeiros `n_recommendations` filmes
-    return list(recommended_movies)[:n_recommendations]
+    chunk = []
+    for scoped in querysets:
+        for row in scoped.values_list(*fields).order_by().iterator(chunk_size=chunk_size):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
 
 
 # Função para construir a matriz de interação
-def build_interaction_matrix():
+def build_interaction_matrix(chunk_size=50000, implicit_weights=None, dtype=np.float32, use_watch_count=False,
+                             user_ids=None):
+    """
+    Constrói a matriz esparsa de interações usuários x filmes.
+
+    As avaliações são lidas em blocos de tuplas (user_id, movie_id, rating), sem
+    DataFrame nem pivot_table denso. Opcionalmente soma sinais implícitos de
+    LikeDislike, FavoriteMovie e WatchedMovie com os pesos informados.
+
+    :param chunk_size: Número de linhas lidas do banco por bloco.
+    :param implicit_weights: Dicionário com os pesos de 'like', 'dislike', 'favorite'
+                             e 'watched' (ex.: DEFAULT_IMPLICIT_WEIGHTS). None usa só Rating.
+    :param dtype: Tipo dos valores da matriz.
+    :param use_watch_count: Se True, o peso de 'watched' é multiplicado por WatchedMovie.watch_count.
+    :param user_ids: Se informado, só as linhas desses usuários (ver update_interaction_matrix).
+    :return: InteractionMatrix.
+    """
+    scope = None if user_ids is None else list(user_ids)  # user_ids é reaproveitado nos blocos abaixo
+    user_blocks, movie_blocks, value_blocks = [], [], []
+
+    def add_block(user_ids, movie_ids, values):
+        user_blocks.append(np.asarray(user_ids, dtype=np.int64))
+        movie_blocks.append(np.asarray(movie_ids, dtype=np.int64))
+        value_blocks.append(np.asarray(values, dtype=dtype))
+
     # Obtendo as avaliações dos usuários para construir a matriz de interação
-    ratings = Rating.objects.all().select_related('user', 'movie')
-    
-    # Construir um DataFrame com as avaliações
-    ratings_data = pd.DataFrame(list(ratings.values('user_id', 'movie_id', 'rating')))
-    
-    # Criar a matriz de interações (usuário x filme)
-    interaction_matrix = ratings_data.pivot_table(index='user_id', columns='movie_id', values='rating').fillna(0)
-    return interaction_matrix
+    for chunk in _iter_chunks(Rating.objects.all(), ('user_id', 'movie_id', 'rating'), chunk_size, scope):
+        user_ids, movie_ids, ratings = zip(*chunk)
+        add_block(user_ids, movie_ids, [float(rating) for rating in ratings])
+
+    if implicit_weights:
+        like_weight = implicit_weights.get('like', 0)
+        dislike_weight = implicit_weights.get('dislike', 0)
+        likes = LikeDislike.objects.filter(action__in=['like', 'dislike'])
+        for chunk in _iter_chunks(likes, ('user_id', 'movie_id', 'action'), chunk_size, scope):
+            user_ids, movie_ids, actions = zip(*chunk)
+            add_block(user_ids, movie_ids, [like_weight if action == 'like' else dislike_weight for action in actions])
+
+        favorite_weight = implicit_weights.get('favorite', 0)
+        if favorite_weight:
+            for chunk in _iter_chunks(FavoriteMovie.objects.all(), ('user_id', 'movie_id'), chunk_size, scope):
+                user_ids, movie_ids = zip(*chunk)
+                add_block(user_ids, movie_ids, np.full(len(chunk), favorite_weight))
+
+        watched_weight = implicit_weights.get('watched', 0)
+        if watched_weight:
+            watched = WatchedMovie.objects.all()
+            for chunk in _iter_chunks(watched, ('user_id', 'movie_id', 'watch_count'), chunk_size, scope):
+                user_ids, movie_ids, watch_counts = zip(*chunk)
+                if use_watch_count:
+                    add_block(user_ids, movie_ids, watched_weight * np.asarray(watch_counts, dtype=dtype))
+                else:
+                    add_block(user_ids, movie_ids, np.full(len(chunk), watched_weight))
+
+    if not user_blocks:
+        empty = np.empty(0, dtype=np.int64)
+        return InteractionMatrix(sparse.csr_matrix((0, 0), dtype=dtype), empty, empty)
+
+    # Ids compactos: linha/coluna = posição do id na lista ordenada de ids distintos
+    user_ids, user_rows = np.unique(np.concatenate(user_blocks), return_inverse=True)
+    movie_ids, movie_cols = np.unique(np.concatenate(movie_blocks), return_inverse=True)
+    values = np.concatenate(value_blocks)
+
+    # coo -> csr soma entradas repetidas do mesmo (usuário, filme), ex.: avaliação + like
+    matrix = sparse.coo_matrix(
+        (values, (user_rows.astype(np.int32), movie_cols.astype(np.int32))),
+        shape=(len(user_ids), len(movie_ids)),
+    ).tocsr()
+    matrix.eliminate_zeros()
+    return InteractionMatrix(matrix, user_ids, movie_ids)
+
+def update_interaction_matrix(interactions, user_ids, chunk_size=50000, implicit_weights=None):
+    """
+    Refaz, a partir das tabelas de interação, só as linhas dos usuários informados
+    (ex.: os que têm eventos novos no histórico, api/events.py) e as junta às
+    demais linhas da matriz. Usuários e filmes novos entram nas posições da ordem
+    crescente de ids, como em build_interaction_matrix.
+
+    :param interactions: InteractionMatrix atual.
+    :param user_ids: Ids dos usuários alterados.
+    :return: (InteractionMatrix atualizada, array com a nova linha de cada linha antiga).
+    """
+    changed = np.unique(np.asarray(list(user_ids), dtype=np.int64))
+    fresh = build_interaction_matrix(chunk_size=chunk_size, implicit_weights=implicit_weights,
+                                     dtype=interactions.matrix.dtype, user_ids=changed)
+
+    # Usuários alterados sem nenhuma interação ficam com a linha vazia até o próximo treino completo
+    all_users = np.union1d(interactions.user_ids, changed)
+    all_movies = np.union1d(interactions.movie_ids, fresh.movie_ids)
+    user_map = np.searchsorted(all_users, interactions.user_ids)
+    movie_map = np.searchsorted(all_movies, interactions.movie_ids)
+
+    old = interactions.matrix.tocoo()
+    keep = ~np.isin(interactions.user_ids[old.row], changed)
+    new = fresh.matrix.tocoo()
+    rows = np.concatenate([user_map[old.row[keep]], np.searchsorted(all_users, fresh.user_ids)[new.row]])
+    cols = np.concatenate([movie_map[old.col[keep]], np.searchsorted(all_movies, fresh.movie_ids)[new.col]])
+    values = np.concatenate([old.data[keep], new.data]).astype(interactions.matrix.dtype, copy=False)
+
+    matrix = sparse.coo_matrix(
+        (values, (rows.astype(np.int32), cols.astype(np.int32))),
+        shape=(len(all_users), len(all_movies)),
+    ).tocsr()
+    return InteractionMatrix(matrix, all_users, all_movies, index=False), user_map
+
 
 # Função para construir o modelo KNN (colaborativo)
-def build_knn_model(interaction_matrix, n_neighbors=3):
-    # Convertendo a matriz para NumPy
-    interaction_matrix_np = interaction_matrix.to_numpy()
+def build_knn_model(interaction_matrix, n_neighbors=3, algorithm='brute', **ann_params):
+    """
+    :param algorithm: 'brute' (NearestNeighbors exato, varre todos os usuários) ou
+                      'lsh' (índice aproximado RandomProjectionLSH, mesma interface kneighbors).
+    :param ann_params: Parâmetros do índice aproximado (n_tables, n_bits, probes, max_candidates).
+    """
+    # Usa a matriz esparsa diretamente (o KNN com métrica cosseno aceita CSR)
+    interaction_matrix_np = _as_sparse(interaction_matrix)
 
-    # Inicializando o modelo KNN (k=3)
-    knn = NearestNeighbors(metric='cosine', algorithm='brute', n_neighbors=n_neighbors)
+    if algorithm == 'lsh':
+        knn = RandomProjectionLSH(n_neighbors=n_neighbors, **ann_params)
+    else:
+        # Inicializando o modelo KNN (k=3)
+        knn = NearestNeighbors(metric='cosine', algorithm='brute', n_neighbors=n_neighbors)
     knn.fit(interaction_matrix_np)
     
     return knn
 
+def train_knn_artifacts(n_neighbors=20, implicit_weights=None, chunk_size=50000, batch_size=1000,
+                        algorithm='brute', **ann_params):
+    """
+    Treina o modelo KNN usuário-usuário e gera os arrays persistidos no ModelStore:
+    a matriz de interações (CSR desmontada), os mapas de ids e a tabela de
+    vizinhos pré-calculada (n_usuarios x n_neighbors) com as similaridades.
+
+    :return: (arrays, metadata) para ModelStore.save.
+    """
+    interactions = build_interaction_matrix(chunk_size=chunk_size, implicit_weights=implicit_weights)
+    matrix = interactions.matrix
+    n_users = matrix.shape[0]
+    k = min(n_neighbors + 1, n_users)  # +1 porque o próprio usuário aparece entre os vizinhos
+
+    neighbours = np.zeros((n_users, max(k - 1, 0)), dtype=np.int32)
+    similarity = np.zeros((n_users, max(k - 1, 0)), dtype=np.float32)
+    if k > 1:
+        knn = build_knn_model(interactions, n_neighbors=k, algorithm=algorithm, **ann_params)
+        _fill_neighbours(knn, matrix, np.arange(n_users), k, neighbours, similarity, batch_size)
+
+    return _knn_arrays(interactions, neighbours, similarity), {
+        'n_users': int(n_users),
+        'n_movies': int(matrix.shape[1]),
+        'nnz': int(matrix.nnz),
+        'n_neighbors': int(max(k - 1, 0)),
+        'implicit_weights': implicit_weights,
+        'algorithm': algorithm,
+        'ann_params': ann_params,
+    }
+
+
+def _fill_neighbours(knn, matrix, rows, k, neighbours, similarity, batch_size):
+    """
+    Calcula os k - 1 vizinhos das linhas informadas e grava em neighbours/similarity.
+    """
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        distances, indices = knn.kneighbors(matrix[batch], n_neighbors=k)
+        # Remove o próprio usuário de cada linha, mantendo a ordem dos demais
+        is_self = indices == batch[:, None]
+        order = np.argsort(is_self, axis=1, kind='stable')[:, :k - 1]
+        neighbours[batch] = np.take_along_axis(indices, order, axis=1)
+        similarity[batch] = 1 - np.take_along_axis(distances, order, axis=1)
+
+
+def _knn_arrays(interactions, neighbours, similarity):
+    matrix = interactions.matrix
+    return {
+        'matrix_data': matrix.data,
+        'matrix_indices': matrix.indices,
+        'matrix_indptr': matrix.indptr,
+        'user_ids': interactions.user_ids,
+        'movie_ids': interactions.movie_ids,
+        'neighbours': neighbours,
+        'neighbour_similarity': similarity,
+    }
+
+
+def update_knn_artifacts(artifact, user_ids, chunk_size=50000, batch_size=1000):
+    """
+    Treino incremental do KNN: parte do artefato ativo, refaz as linhas dos
+    usuários alterados (update_interaction_matrix) e recalcula só os vizinhos
+    deles. Os vizinhos dos demais usuários continuam os do último treino (com os
+    índices remapeados); um treino completo periódico corrige as similaridades
+    que mudaram para eles.
+
+    :param artifact: Artefato 'knn' ativo (ModelStore).
+    :param user_ids: Ids dos usuários com interações novas.
+    :return: (arrays, metadata) para ModelStore.save, ou None se a tabela de
+             vizinhos precisa de um treino completo (ex.: poucos usuários no último treino).
+    """
+    metadata = dict(artifact.metadata)
+    n_neighbors = metadata.get('n_neighbors', 0)
+    if not n_neighbors or artifact['neighbours'].shape[1] != n_neighbors:
+        return None
+
+    interactions, user_map = update_interaction_matrix(
+        load_interaction_matrix(artifact, index=False), user_ids,
+        chunk_size=chunk_size, implicit_weights=metadata.get('implicit_weights'))
+    matrix = interactions.matrix
+    n_users = matrix.shape[0]
+    k = n_neighbors + 1
+
+    neighbours = np.zeros((n_users, n_neighbors), dtype=np.int32)
+    similarity = np.zeros((n_users, n_neighbors), dtype=np.float32)
+    neighbours[user_map] = user_map[np.asarray(artifact['neighbours'])]
+    similarity[user_map] = artifact['neighbour_similarity']
+
+    # Usuários alterados e os que não estavam no último treino
+    rows = np.union1d(np.searchsorted(interactions.user_ids, np.unique(np.asarray(list(user_ids), dtype=np.int64))),
+                      np.setdiff1d(np.arange(n_users), user_map))
+    knn = build_knn_model(interactions, n_neighbors=k, algorithm=metadata.get('algorithm', 'brute'),
+                          **(metadata.get('ann_params') or {}))
+    _fill_neighbours(knn, matrix, rows, k, neighbours, similarity, batch_size)
+
+    metadata.update({
+        'n_users': int(n_users),
+        'n_movies': int(matrix.shape[1]),
+        'nnz': int(matrix.nnz),
+        'incremental_from': artifact.version,
+        'updated_users': int(len(rows)),
+    })
+    return _knn_arrays(interactions, neighbours, similarity), metadata
+
+
+def load_interaction_matrix(artifact, index=True):
+    """
+    Remonta a InteractionMatrix a partir de um artefato do ModelStore, sem copiar
+    os arrays mapeados em memória.
+
+    :param index: Se False, não monta os dicionários id -> linha/coluna (caro para
+                  muitos usuários quando só se precisa da matriz).
+    """
+    shape = (len(artifact['user_ids']), len(artifact['movie_ids']))
+    matrix = sparse.csr_matrix(
+        (artifact['matrix_data'], artifact['matrix_indices'], artifact['matrix_indptr']),
+        shape=shape, copy=False,
+    )
+    return InteractionMatrix(matrix, artifact['user_ids'], artifact['movie_ids'], index=index)
+
+
+def _rank_neighbour_movies_batch(interaction_matrix, user_rows, neighbour_rows, similarities, top_n):
+    """
+    Versão em lote da agregação por vizinhos. Para b usuários com k vizinhos cada:
+      - monta a matriz esparsa de pesos W (b x n_usuarios) com as similaridades
+        (o próprio usuário recebe peso 0);
+      - pontuações = W @ matriz de interações (b x n_filmes), um único produto esparso;
+      - zera os filmes que cada usuário já viu e seleciona os top_n por linha.
+
+    :return: Lista (uma por usuário) de listas de (movie_id, pontuação) em ordem decrescente.
+    """
+    matrix = interaction_matrix.matrix
+    user_rows = np.asarray(user_rows)
+    neighbour_rows = np.asarray(neighbour_rows, dtype=np.int64)
+    similarities = np.array(similarities, dtype=np.float32)
+    similarities[neighbour_rows == user_rows[:, None]] = 0
+    n_batch, k = neighbour_rows.shape
+
+    weights = sparse.csr_matrix(
+        (similarities.ravel(), neighbour_rows.ravel(), np.arange(0, n_batch * k + 1, k)),
+        shape=(n_batch, matrix.shape[0]),
+    )
+    scores = (weights @ matrix).tocsr()
+    seen = matrix[user_rows]
+    seen.data = np.ones_like(seen.data)
+    scores = (scores - scores.multiply(seen)).tocsr()
+
+    results = []
+    for row in range(n_batch):
+        low, high = scores.indptr[row], scores.indptr[row + 1]
+        columns, values = scores.indices[low:high], scores.data[low:high]
+        positive = values > 0
+        columns, values = columns[positive], values[positive]
+        if len(values) > top_n:
+            # Mantém também os empates com o n-ésimo valor, desempatados pelo id abaixo
+            threshold = -np.partition(-values, top_n - 1)[top_n - 1]
+            keep = values >= threshold
+            columns, values = columns[keep], values[keep]
+        order = np.lexsort((columns, -values))[:top_n]
+        results.append([(int(interaction_matrix.movie_ids[column]), float(value))
+                        for column, value in zip(columns[order], values[order])])
+    return results
+
+
+def _rank_neighbour_movies(interaction_matrix, user_row, neighbour_rows, similarities, top_n):
+    """
+    Soma as interações dos vizinhos ponderadas pela similaridade, descarta o que o
+    usuário já viu e devolve os top_n (movie_id, pontuação) em ordem decrescente.
+    """
+    if not len(neighbour_rows):
+        return []
+    return _rank_neighbour_movies_batch(interaction_matrix, [user_row], [neighbour_rows], [similarities], top_n)[0]
+
+
+def recommend_movies_user_based_batch(user_ids, interaction_matrix, knn_model, n_recommendations=10,
+                                      n_neighbors=5, batch_size=1000):
+    """
+    Recomendações por vizinhança para vários usuários de uma vez: uma chamada
+    a kneighbors por lote e agregação com produto de matrizes esparsas.
+
+    :param user_ids: IDs dos usuários.
+    :param interaction_matrix: InteractionMatrix (ou DataFrame no formato antigo).
+    :param knn_model: Modelo com kneighbors treinado na mesma matriz.
+    :return: Dicionário {user_id: [(movie_id, pontuação), ...]} ordenado por pontuação;
+             usuários sem interações recebem lista vazia.
+    """
+    interaction_matrix = _as_interaction_matrix(interaction_matrix)
+    results = {}
+    known = []
+    for user_id in user_ids:
+        row = interaction_matrix.user_index.get(user_id)
+        if row is None:
+            results[user_id] = []
+        else:
+            known.append((user_id, row))
+
+    k = min(n_neighbors + 1, interaction_matrix.shape[0])  # +1: o próprio usuário volta entre os vizinhos
+    for start in range(0, len(known), batch_size):
+        batch = known[start:start + batch_size]
+        rows = np.array([row for _, row in batch])
+        distances, indices = knn_model.kneighbors(interaction_matrix.matrix[rows], n_neighbors=k)
+        ranked = _rank_neighbour_movies_batch(interaction_matrix, rows, indices, 1 - distances, n_recommendations)
+        for (user_id, _), recommendations in zip(batch, ranked):
+            results[user_id] = recommendations
+    return results
+
+
 # Função para recomendar filmes colaborativos
-def recommend_movies_collaborative(user_id, interaction_matrix, knn, top_n=3):
-    user_index = user_id - 1  # Ajuste de índice se user_id começar de 1
-    distances, indices = knn.kneighbors([interaction_matrix.iloc[user_index]], n_neighbors=top_n)
-    
-    recommended_movie_ids = set()
-    
-    for i in indices[0]:
-        # Pegando os filmes que o usuário similar assistiu (com avaliação > 0)
-        similar_user_ratings = interaction_matrix.iloc[i]
-        recommended_movies = similar_user_ratings[similar_user_ratings > 0].index.tolist()
-        recommended_movie_ids.update(recommended_movies)
-    
-    return recommended_movie_ids
+def recommend_movies_collaborative(user_id, interaction_matrix, knn, top_n=3, n_neighbors=10, with_scores=False):
+    """
+    Recomenda filmes dos usuários mais parecidos, ponderados pela similaridade.
+
+    :param interaction_matrix: InteractionMatrix (ou DataFrame no formato antigo).
+    :param knn: Modelo com kneighbors (NearestNeighbors ou RandomProjectionLSH) treinado na mesma matriz.
+    :return: Lista de IDs de filmes em ordem de relevância (ou de (id, pontuação) com with_scores).
+    """
+    interaction_matrix = _as_interaction_matrix(interaction_matrix)
+    user_row = interaction_matrix.user_index.get(user_id)
+    if user_row is None:
+        return []
+
+    n_neighbors = min(n_neighbors + 1, interaction_matrix.shape[0])
+    distances, indices = knn.kneighbors(interaction_matrix.matrix[user_row], n_neighbors=n_neighbors)
+    recommendations = _rank_neighbour_movies(interaction_matrix, user_row, indices[0], 1 - distances[0], top_n)
+    return recommendations if with_scores else [movie_id for movie_id, _ in recommendations]
+
+
+def recommend_movies_from_neighbours(user_id, artifact, top_n=10):
+    """
+    Igual a recommend_movies_collaborative, mas usando a tabela de vizinhos
+    pré-calculada do artefato 'knn' do ModelStore (sem busca de vizinhos no request).
+
+    :return: Lista de (movie_id, pontuação) em ordem de relevância.
+    """
+    user_ids = artifact['user_ids']
+    user_row = int(np.searchsorted(user_ids, user_id))  # user_ids vem ordenado (np.unique)
+    if user_row >= len(user_ids) or user_ids[user_row] != user_id:
+        return []
+    interaction_matrix = load_interaction_matrix(artifact, index=False)
+    return _rank_neighbour_movies(interaction_matrix, user_row, artifact['neighbours'][user_row],
+                                  artifact['neighbour_similarity'][user_row], top_n)
+
+
+def recommend_movies_from_neighbours_batch(user_ids, artifact, top_n=10):
+    """
+    Versão em lote de recommend_movies_from_neighbours (pré-cálculo noturno).
+
+    :return: Dicionário {user_id: [(movie_id, pontuação), ...]}.
+    """
+    stored_ids = artifact['user_ids']
+    user_ids = np.asarray(list(user_ids), dtype=np.int64)
+    rows = np.searchsorted(stored_ids, user_ids)
+    known = (rows < len(stored_ids)) & (stored_ids[np.minimum(rows, len(stored_ids) - 1)] == user_ids)
+
+    results = {int(user_id): [] for user_id in user_ids}
+    if known.any() and artifact['neighbours'].shape[1]:
+        interaction_matrix = load_interaction_matrix(artifact, index=False)
+        rows = rows[known]
+        ranked = _rank_neighbour_movies_batch(interaction_matrix, rows, artifact['neighbours'][rows],
+                                              artifact['neighbour_similarity'][rows], top_n)
+        for user_id, recommendations in zip(user_ids[known].tolist(), ranked):
+            results[user_id] = recommendations
+    return results
+
 
 # Função para recomendar filmes baseados em conteúdo
-def recommend_movies_content_based(movie_id, cosine_sim, movies_df, top_n=3):
-    movie_index = movies_df[movies_df['movie_id'] == movie_id].index[0]
-    
-    # Obter os filmes mais similares
-    sim_scores = list(enumerate(cosine_sim[movie_index]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-    
-    # Obter os top_n filmes mais similares
-    sim_scores = sim_scores[1:top_n+1]  # Exclui o filme que foi passado como entrada
-    movie_indices = [i[0] for i in sim_scores]
-    
-    return movies_df['title'].iloc[movie_indices]
+def recommend_movies_content_based(movie_id, cosine_sim=None, movies_df=None, top_n=3):
+    """
+    Filmes mais parecidos com movie_id.
+
+    Sem cosine_sim, lê os vizinhos pré-calculados de MovieSimilarity (manage.py
+    build_similar_movies). Com cosine_sim/movies_df (formato antigo), usa a linha
+    da matriz com seleção parcial em vez de ordenar a linha inteira.
+
+    :return: Lista de IDs de filmes em ordem de similaridade.
+    """
+    if cosine_sim is None:
+        from .content import get_similar_movies
+
+        return [similarity.similar_movie_id for similarity in get_similar_movies(movie_id, top_n)]
+
+    matches = np.flatnonzero(movies_df['movie_id'].to_numpy() == movie_id)
+    if not len(matches):
+        return []
+    movie_index = matches[0]
+
+    # Obter os filmes mais similares, excluindo o filme que foi passado como entrada
+    sim_scores = np.asarray(cosine_sim[movie_index], dtype=np.float32).copy()
+    sim_scores[movie_index] = -np.inf
+    top_n = min(top_n, len(sim_scores) - 1)
+    if top_n <= 0:
+        return []
+    movie_indices = np.argpartition(-sim_scores, top_n - 1)[:top_n]
+    movie_indices = movie_indices[np.argsort(-sim_scores[movie_indices], kind='stable')]
+
+    return movies_df['movie_id'].iloc[movie_indices].tolist()
 
 # Função para recomendar filmes híbridos (colaborativo + conteúdo)
-def recommend_movies_hybrid(user_id, movie_id, interaction_matrix, knn, cosine_sim, movies_df, top_n=3):
+def recommend_movies_hybrid(user_id, movie_id, interaction_matrix, knn, cosine_sim=None, movies_df=None, top_n=3):
+    """
+    União das recomendações colaborativas e de conteúdo, sem duplicatas e
+    preservando a ordem (colaborativas primeiro). A versão ponderada, com
+    orçamento de tempo por fonte, está em api/hybrid.py.
+
+    :return: Lista de IDs de filmes.
+    """
     # Recomendação colaborativa
     collaborative_recommendations = recommend_movies_collaborative(user_id, interaction_matrix, knn, top_n)
     
@@ -110,6 +557,4 @@ def recommend_movies_hybrid(user_id, movie_id, interaction_matrix, knn, cosine_s
     content_based_recommendations = recommend_movies_content_based(movie_id, cosine_sim, movies_df, top_n)
     
     # Combine as recomendações (evitando duplicatas)
-    all_recommendations = set(collaborative_recommendations).union(set(content_based_recommendations))
-    
-    return all_recommendations
+    return list(dict.fromkeys(collaborative_recommendations + content_based_recommendations))
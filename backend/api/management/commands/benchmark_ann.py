@@ -0,0 +1,113 @@
+import json
+import time
+
+import numpy as np
+from scipy import sparse
+from django.core.management.base import BaseCommand
+from sklearn.neighbors import NearestNeighbors
+
+from api.ann import RandomProjectionLSH
+
+
+def synthetic_interactions(n_users, n_items, per_user, n_clusters, seed):
+    """
+    Gera uma matriz usuários x filmes esparsa com grupos de gosto: cada usuário
+    pertence a um grupo e escolhe a maior parte dos filmes entre os populares do
+    grupo (distribuição de Zipf), o resto ao acaso. Assim os vizinhos verdadeiros existem.
+    """
+    rng = np.random.default_rng(seed)
+    cluster_items = rng.integers(0, n_items, size=(n_clusters, max(per_user * 20, 200)))
+    zipf = 1.0 / np.arange(1, cluster_items.shape[1] + 1)
+    zipf /= zipf.sum()
+
+    clusters = rng.integers(0, n_clusters, size=n_users)
+    rows = np.repeat(np.arange(n_users), per_user)
+    from_cluster = rng.random(n_users * per_user) < 0.8
+    picks = rng.choice(cluster_items.shape[1], size=n_users * per_user, p=zipf)
+    cols = np.where(from_cluster, cluster_items[np.repeat(clusters, per_user), picks],
+                    rng.integers(0, n_items, size=n_users * per_user))
+    values = rng.integers(1, 6, size=n_users * per_user).astype(np.float32)
+    matrix = sparse.csr_matrix((values, (rows, cols)), shape=(n_users, n_items), dtype=np.float32)
+    matrix.sum_duplicates()
+    return matrix
+
+
+def timed_queries(model, queries, k):
+    latencies = []
+    results = []
+    for row in range(queries.shape[0]):
+        started = time.perf_counter()
+        _, indices = model.kneighbors(queries[row], n_neighbors=k)
+        latencies.append(time.perf_counter() - started)
+        results.append(indices[0])
+    return np.array(results), np.array(latencies) * 1000
+
+
+class Command(BaseCommand):
+    help = 'Compara o índice aproximado (LSH) com o KNN exato: recall@k e latência p50/p99 por consulta.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                            help='Números de usuários sintéticos.')
+        parser.add_argument('--items', type=int, default=20000, help='Número de filmes.')
+        parser.add_argument('--per-user', type=int, default=30, help='Interações por usuário.')
+        parser.add_argument('--clusters', type=int, default=200, help='Grupos de gosto.')
+        parser.add_argument('--queries', type=int, default=200, help='Consultas medidas por tamanho.')
+        parser.add_argument('--k', type=int, default=10, help='Vizinhos por consulta.')
+        parser.add_argument('--tables', type=int, default=16)
+        parser.add_argument('--bits', type=int, default=8)
+        parser.add_argument('--probes', type=int, default=3)
+        parser.add_argument('--max-candidates', type=int, default=None)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON.')
+
+    def handle(self, *args, **options):
+        k = options['k']
+        report = []
+        for n_users in options['sizes']:
+            matrix = synthetic_interactions(n_users, options['items'], options['per_user'],
+                                            options['clusters'], options['seed'])
+            rng = np.random.default_rng(options['seed'])
+            queries = matrix[rng.choice(n_users, size=min(options['queries'], n_users), replace=False)]
+
+            started = time.perf_counter()
+            brute = NearestNeighbors(metric='cosine', algorithm='brute').fit(matrix)
+            brute_build = time.perf_counter() - started
+
+            started = time.perf_counter()
+            lsh = RandomProjectionLSH(n_tables=options['tables'], n_bits=options['bits'],
+                                      probes=options['probes'], max_candidates=options['max_candidates'],
+                                      random_state=options['seed']).fit(matrix)
+            lsh_build = time.perf_counter() - started
+
+            exact, brute_ms = timed_queries(brute, queries, k)
+            approx, lsh_ms = timed_queries(lsh, queries, k)
+            recall = np.mean([len(np.intersect1d(a, e)) / k for a, e in zip(approx, exact)])
+
+            result = {
+                'users': n_users,
+                'k': k,
+                f'recall@{k}': round(float(recall), 4),
+                'brute': {
+                    'build_seconds': round(brute_build, 3),
+                    'p50_ms': round(float(np.percentile(brute_ms, 50)), 3),
+                    'p99_ms': round(float(np.percentile(brute_ms, 99)), 3),
+                },
+                'lsh': {
+                    'build_seconds': round(lsh_build, 3),
+                    'p50_ms': round(float(np.percentile(lsh_ms, 50)), 3),
+                    'p99_ms': round(float(np.percentile(lsh_ms, 99)), 3),
+                    'index_mb': round(lsh.memory_usage() / 1e6, 1),
+                },
+            }
+            report.append(result)
+            if not options['json']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{n_users} usuários: recall@{k}={result[f"recall@{k}"]} | '
+                    f'exato p50={result["brute"]["p50_ms"]}ms p99={result["brute"]["p99_ms"]}ms | '
+                    f'LSH p50={result["lsh"]["p50_ms"]}ms p99={result["lsh"]["p99_ms"]}ms '
+                    f'(construção {result["lsh"]["build_seconds"]}s, {result["lsh"]["index_mb"]} MB)'
+                ))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api.content import rebuild_movie_similarities
+
+
+class Command(BaseCommand):
+    help = 'Recalcula a tabela MovieSimilarity (top-K filmes parecidos por TF-IDF de título, gêneros e descrição).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=20, help='Vizinhos guardados por filme.')
+        parser.add_argument('--block-size', type=int, default=1000, help='Filmes por bloco do produto esparso.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Linhas por bulk_create.')
+        parser.add_argument('--max-features', type=int, default=50000, help='Tamanho máximo do vocabulário.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Calculando filmes similares...'))
+        started = time.perf_counter()
+        movies, rows = rebuild_movie_similarities(
+            k=options['k'], block_size=options['block_size'],
+            batch_size=options['batch_size'], max_features=options['max_features'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'{rows} vizinhos gravados para {movies} filmes em {elapsed:.1f}s.'))
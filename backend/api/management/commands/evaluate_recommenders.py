@@ -0,0 +1,70 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from api.evaluation import (default_engines, evaluate_engine, generate_events, isolated_database, relevant_items,
+                            temporal_split, write_dataset)
+
+
+class Command(BaseCommand):
+    help = ('Gera dados sintéticos, divide as interações pelo tempo e compara os recomendadores '
+            '(precision@k, recall@k, cobertura, tempo de treino, latência e memória) em JSON. '
+            'Os dados são gravados num banco descartável, criado e apagado pelo comando; '
+            'o banco configurado não é tocado.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engines', nargs='+', default=None,
+                            help=f'Motores a avaliar ({", ".join(default_engines())}). Padrão: todos.')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--movies', type=int, default=2000)
+        parser.add_argument('--genres', type=int, default=20)
+        parser.add_argument('--events-per-user', type=int, default=40, help='Mediana de filmes por usuário.')
+        parser.add_argument('--skew', type=float, default=1.1, help='Expoente da lei de potência da popularidade.')
+        parser.add_argument('--test-fraction', type=float, default=0.2, help='Fração final do tempo usada como teste.')
+        parser.add_argument('--eval-users', type=int, default=500, help='Usuários de teste amostrados.')
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Arquivo onde gravar o JSON (padrão: saída padrão).')
+
+    def handle(self, *args, **options):
+        registry = default_engines()
+        names = options['engines'] or list(registry)
+        unknown = [name for name in names if name not in registry]
+        if unknown:
+            raise CommandError(f'Motor(es) desconhecido(s): {", ".join(unknown)}')
+
+        started = time.perf_counter()
+        data = generate_events(options['users'], options['movies'], options['genres'],
+                               options['events_per_user'], options['skew'], options['seed'])
+        train_events, test_events = temporal_split(data['events'], options['test_fraction'])
+        self.stderr.write(f'{len(data["events"])} interações geradas em {time.perf_counter() - started:.1f}s '
+                          f'({len(train_events)} treino, {len(test_events)} teste).')
+
+        report = {
+            'config': {key: options[key] for key in ('users', 'movies', 'genres', 'events_per_user', 'skew',
+                                                     'test_fraction', 'eval_users', 'k', 'seed')},
+            'data': {'train_events': len(train_events), 'test_events': len(test_events)},
+            'engines': {},
+        }
+        with isolated_database():
+            user_ids, movie_ids = write_dataset(data, train_events)
+            relevant = relevant_items(test_events, user_ids, movie_ids)
+            if len(relevant) > options['eval_users']:
+                rng = np.random.default_rng(options['seed'])
+                sample = rng.choice(sorted(relevant), size=options['eval_users'], replace=False)
+                relevant = {int(user_id): relevant[int(user_id)] for user_id in sample}
+            report['data']['test_users'] = len(relevant)
+
+            for name in names:
+                self.stderr.write(f'Avaliando {name}...')
+                report['engines'][name] = evaluate_engine(registry[name](), relevant, len(movie_ids),
+                                                          k=options['k'])
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+            self.stdout.write(self.style.SUCCESS(f'Resultado gravado em {options["output"]}'))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from api.export import EXPORTS, OUTPUT_FORMATS, ExportError, iter_export, parse_since
+
+
+class Command(BaseCommand):
+    help = ('Exporta interações (avaliações, likes, favoritos, assistidos, preferências ou o histórico de '
+            'eventos) em NDJSON ou CSV, em streaming, para um arquivo ou para a saída padrão.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(EXPORTS), help='Conjunto a exportar.')
+        parser.add_argument('--output', choices=OUTPUT_FORMATS, default='ndjson', help='Formato de saída.')
+        parser.add_argument('--file', help='Arquivo de destino (padrão: saída padrão).')
+        parser.add_argument('--since', help='Só linhas criadas a partir desta data (AAAA-MM-DD ou ISO 8601).')
+        parser.add_argument('--after-id', type=int, help='Só linhas com id maior (continua uma exportação).')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Linhas lidas do banco por bloco.')
+
+    def handle(self, *args, **options):
+        filters = {'after_id': options['after_id'], 'chunk_size': options['chunk_size']}
+        if options['since']:
+            filters['since'] = parse_since(options['since'])
+            if filters['since'] is None:
+                raise CommandError(f'Data inválida em --since: {options["since"]}')
+
+        try:
+            chunks = iter_export(options['dataset'], options['output'], **filters)
+        except ExportError as error:
+            raise CommandError(str(error))
+
+        destination = open(options['file'], 'w', newline='', encoding='utf-8') if options['file'] else sys.stdout
+        lines = 0
+        try:
+            for chunk in chunks:
+                destination.write(chunk)
+                lines += 1
+        finally:
+            if options['file']:
+                destination.close()
+        if options['file']:
+            self.stdout.write(self.style.SUCCESS(f'{lines} linha(s) gravada(s) em {options["file"]}.'))
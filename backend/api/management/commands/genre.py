@@ -3,6 +3,7 @@ from django.core.management.base import BaseCommand
 from django.utils.text import slugify
 from django.db import IntegrityError
 from api.models import Movie, Genre
+from api.catalog import import_catalog
 import ast
 import math
 from datetime import datetime
@@ -10,6 +11,32 @@ from datetime import datetime
 class Command(BaseCommand):
     help = 'Importa filmes e seus gêneros a partir de um arquivo CSV.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default='movies_metadata.csv', help='Caminho do arquivo CSV')
+        parser.add_argument('--limit', type=int, default=10000, help='Número máximo de linhas (0 = arquivo inteiro)')
+        parser.add_argument(
+            '--bulk', action='store_true',
+            help='Importação em blocos com bulk_create e upsert por external_id (sem apagar os gêneros)',
+        )
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Linhas por bloco/transação no modo --bulk')
+
+    def handle_bulk(self, file_path, limit, chunk_size):
+        """
+        Modo --bulk (api/catalog.py): idempotente, pode ser repetido para atualizar o catálogo.
+        """
+        def progress(totals):
+            self.stdout.write(
+                f"{totals['rows']} linhas ({totals['created']} novos, {totals['updated']} atualizados, "
+                f"{totals['skipped']} ignorados) - {totals['rows_per_second']:.0f} linhas/s"
+            )
+
+        totals = import_catalog(file_path, chunk_size=chunk_size, limit=limit or None, progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals['rows']} linhas importadas em {totals['seconds']:.1f}s "
+            f"({totals['rows_per_second']:.0f} linhas/s): {totals['created']} filmes novos, "
+            f"{totals['updated']} atualizados, {totals['skipped']} ignorados."
+        ))
+
     def get_or_create_genres(self, genres_list):
         """
         Função que obtém ou cria gêneros para o filme a partir de uma lista de gêneros.
@@ -100,8 +127,13 @@ class Command(BaseCommand):
         movie.save()
 
     def handle(self, *args, **kwargs):
-        # Define o caminho fixo para o arquivo CSV
-        file_path = 'movies_metadata.csv'  # Caminho para o arquivo CSV
+        file_path = kwargs['file']  # Caminho para o arquivo CSV
+        if kwargs['bulk']:
+            try:
+                self.handle_bulk(file_path, kwargs['limit'], kwargs['chunk_size'])
+            except FileNotFoundError:
+                self.stdout.write(self.style.ERROR(f'Arquivo não encontrado: {file_path}'))
+            return
         #Movie.objects.update(genre=None)  # Aqui, você desvincula todos os filmes de seus gêneros
 
             # Agora, você pode excluir todos os objetos de Genre
@@ -109,7 +141,7 @@ class Command(BaseCommand):
         try:
             # Lê o arquivo CSV
             df = pd.read_csv(file_path, low_memory=False)
-            df_movies = df.head(10000)  # Limita a 10000 filmes para a importação
+            df_movies = df.head(kwargs['limit']) if kwargs['limit'] else df  # Limita a 10000 filmes por padrão
             
             for _, row in df_movies.iterrows():
                 # Cria ou atualiza o filme com seus gêneros
@@ -0,0 +1,87 @@
+import signal
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.counters import flush_counter_buffer
+from api.outbox import outbox_lag, process_batch, purge_processed, replay_exhausted
+
+
+class Command(BaseCommand):
+    help = ('Worker do outbox: aplica em lotes os efeitos das interações (contadores, preferências '
+            'e recálculo das recomendações) gravados pelos endpoints.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Eventos por transação.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Espera, em segundos, com a fila vazia.')
+        parser.add_argument('--once', action='store_true', help='Esvazia a fila e termina.')
+        parser.add_argument('--lag', action='store_true', help='Só mostra o estado da fila.')
+        parser.add_argument('--replay', nargs='*', type=int, metavar='ID',
+                            help='Devolve à fila os eventos que esgotaram as tentativas (todos, ou só os IDs '
+                                 'informados) e termina.')
+        parser.add_argument('--report-interval', type=float, default=10.0,
+                            help='Intervalo, em segundos, entre os relatórios de atraso.')
+        parser.add_argument('--purge-hours', type=float, default=24.0,
+                            help='Apaga eventos processados há mais de N horas (0 desativa).')
+
+    def handle(self, *args, **options):
+        if options['replay'] is not None:
+            replayed = replay_exhausted(options['replay'] or None)
+            self.stdout.write(self.style.SUCCESS(f'Eventos devolvidos à fila: {replayed}.'))
+            self.report()
+            return
+        if options['lag']:
+            self.report()
+            return
+
+        # SIGTERM (parada do serviço) encerra como o Ctrl+C: o buffer de contadores é gravado antes de sair
+        signal.signal(signal.SIGTERM, self.stop)
+        self.stdout.write(self.style.SUCCESS('Processando o outbox...'))
+        self.report()
+        processed = failed = 0
+        last_report = last_purge = time.monotonic()
+        try:
+            while True:
+                close_old_connections()
+                done, errors = process_batch(options['batch_size'])
+                processed += done
+                failed += errors
+
+                now = time.monotonic()
+                if now - last_report >= options['report_interval']:
+                    self.report(processed, failed)
+                    last_report = now
+                if done:
+                    continue
+                if errors:
+                    # Lote só com falhas (ex.: dependência fora do ar): os eventos já esperam o
+                    # backoff, e o worker também pausa antes do próximo lote
+                    time.sleep(options['sleep'])
+                    continue
+
+                # Fila vazia
+                if options['purge_hours'] and now - last_purge >= 60:
+                    purge_processed(timedelta(hours=options['purge_hours']))
+                    last_purge = now
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            flushed = flush_counter_buffer()
+            if flushed:
+                self.stdout.write(self.style.SUCCESS(f'Buffer de contadores gravado: {flushed} incrementos.'))
+        self.report(processed, failed)
+
+    def stop(self, signum, frame):
+        raise KeyboardInterrupt
+
+    def report(self, processed=None, failed=None):
+        lag = outbox_lag()
+        message = (f"Pendentes: {lag['pending']} ({lag['retrying']} aguardando nova tentativa), "
+                   f"atraso: {lag['lag_seconds']}s, esgotados: {lag['failed']}")
+        if processed is not None:
+            message = f'Aplicados: {processed}, falhas: {failed}. ' + message
+        self.stdout.write(self.style.SUCCESS(message) if not lag['failed'] else self.style.WARNING(message))
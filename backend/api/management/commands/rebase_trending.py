@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+from api.trending import current_epoch, rebase_trending
+
+
+class Command(BaseCommand):
+    help = 'Avança a época das tendências e reescala as pontuações gravadas (MovieTrending e GenreTrending).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--epoch', help='Nova época (data e hora ISO 8601). Padrão: agora.')
+
+    def handle(self, *args, **options):
+        new_epoch = None
+        if options['epoch']:
+            new_epoch = parse_datetime(options['epoch'])
+            if new_epoch is None or new_epoch.tzinfo is None:
+                self.stdout.write(self.style.ERROR(
+                    'Informe --epoch com data, hora e fuso (ex.: 2026-01-01T00:00:00+00:00).'))
+                return
+        previous = current_epoch()
+        epoch = rebase_trending(new_epoch)
+        if epoch == previous:
+            self.stdout.write(self.style.WARNING(f'A época já é {epoch.isoformat()}: nada a fazer.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Época das tendências: {previous.isoformat()} -> {epoch.isoformat()}.'))
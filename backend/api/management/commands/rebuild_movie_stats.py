@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.stats import rebuild_movie_stats
+
+
+class Command(BaseCommand):
+    help = 'Recalcula do zero a tabela MovieStats (likes, dislikes, favoritos, assistidos e avaliações por filme).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Linhas por bulk_create.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Recalculando estatísticas dos filmes...'))
+        total = rebuild_movie_stats(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{total} linhas de MovieStats reconstruídas com sucesso!'))
@@ -0,0 +1,48 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connections
+from api.recommendations import materialized_limit, rebuild_shard
+
+
+class Command(BaseCommand):
+    help = 'Recalcula as listas de recomendação materializadas (UserRecommendation) de todos os usuários.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Processos em paralelo.')
+        parser.add_argument('--shard-size', type=int, default=500, help='Usuários por tarefa enviada ao pool.')
+        parser.add_argument('--limit', type=int, default=None, help='Recomendações por usuário.')
+
+    def handle(self, *args, **options):
+        limit = options['limit'] or materialized_limit()
+        user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+        shard_size = options['shard_size']
+        shards = [user_ids[start:start + shard_size] for start in range(0, len(user_ids), shard_size)]
+        self.stdout.write(self.style.SUCCESS(
+            f'Recalculando recomendações de {len(user_ids)} usuários em {len(shards)} lote(s)...'))
+
+        started = time.perf_counter()
+        users = written = 0
+        if options['workers'] <= 1:
+            for shard in shards:
+                done, rows = rebuild_shard(shard, limit)
+                users += done
+                written += rows
+        else:
+            # Os processos filhos não podem herdar conexões abertas do pai
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            with ProcessPoolExecutor(max_workers=options['workers'], mp_context=context) as pool:
+                futures = [pool.submit(rebuild_shard, shard, limit) for shard in shards]
+                for future in as_completed(futures):
+                    done, rows = future.result()
+                    users += done
+                    written += rows
+                    self.stdout.write(f'{users}/{len(user_ids)} usuários')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{written} recomendações gravadas para {users} usuários em {elapsed:.1f}s.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.trending import rebuild_trending
+
+
+class Command(BaseCommand):
+    help = 'Recalcula do zero as tendências por filme e por gênero (MovieTrending e GenreTrending).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Linhas por leitura e por bulk_create.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Recalculando tendências...'))
+        movies, genres = rebuild_trending(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Tendências reconstruídas: {movies} filmes e {genres} gêneros.'))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.dashboard import refresh_dashboard_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Recalcula o snapshot dos agregados do dashboard (uma vez, ou a cada --interval segundos).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Repete a cada N segundos até ser interrompido (0 = uma vez, para o cron).')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                close_old_connections()
+                snapshot = refresh_dashboard_snapshot()
+                self.stdout.write(self.style.SUCCESS(
+                    f'Snapshot do dashboard atualizado em {snapshot.build_seconds}s '
+                    f'({len(snapshot.data["preferences"])} gêneros com preferências).'
+                ))
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
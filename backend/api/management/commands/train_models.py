@@ -0,0 +1,122 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.aimovies import train_svd_artifacts
+from api.als import train_als_artifacts
+from api.events import EventCursor
+from api.machineLern import DEFAULT_IMPLICIT_WEIGHTS, train_knn_artifacts, update_knn_artifacts
+from api.model_store import ModelStore
+
+
+def train_knn(options):
+    weights = None if options['ratings_only'] else DEFAULT_IMPLICIT_WEIGHTS
+    algorithm = options['algorithm'] or getattr(settings, 'KNN_ALGORITHM', 'brute')
+    ann_params = getattr(settings, 'KNN_ANN_PARAMS', {}) if algorithm == 'lsh' else {}
+    return train_knn_artifacts(n_neighbors=options['neighbors'], implicit_weights=weights,
+                               chunk_size=options['chunk_size'], algorithm=algorithm, **ann_params)
+
+
+def train_als(options):
+    return train_als_artifacts(factors=options['factors'], regularization=options['regularization'],
+                               alpha=options['alpha'], iterations=options['iterations'],
+                               chunk_size=options['chunk_size'])
+
+
+def train_svd(options):
+    return train_svd_artifacts(ratings_csv=options['ratings_csv'], factors=options['svd_factors'],
+                               epochs=options['epochs'], backend=options['svd_backend'],
+                               chunk_size=options['chunk_size'])
+
+
+# Modelos disponíveis: nome -> função que recebe as opções e retorna (arrays, metadata)
+TRAINERS = {
+    'knn': train_knn,
+    'als': train_als,
+    'svd': train_svd,
+}
+
+
+def update_knn(artifact, user_ids, options):
+    return update_knn_artifacts(artifact, user_ids, chunk_size=options['chunk_size'])
+
+
+# Modelos com treino incremental (--incremental): nome -> função que recebe o artefato
+# ativo, os usuários com eventos novos e as opções, e retorna (arrays, metadata) ou None
+INCREMENTAL_TRAINERS = {
+    'knn': update_knn,
+}
+
+
+class Command(BaseCommand):
+    help = 'Treina os modelos de recomendação offline e grava artefatos versionados no MODEL_DIR.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help=f'Modelos a treinar ({", ".join(TRAINERS)}). Padrão: todos.')
+        parser.add_argument('--neighbors', type=int, default=20, help='Vizinhos por usuário na tabela do KNN.')
+        parser.add_argument('--algorithm', choices=['brute', 'lsh'],
+                            help='Busca de vizinhos do KNN (padrão: settings.KNN_ALGORITHM).')
+        parser.add_argument('--factors', type=int, default=64, help='Fatores latentes do ALS.')
+        parser.add_argument('--iterations', type=int, default=15, help='Iterações do ALS.')
+        parser.add_argument('--alpha', type=float, default=40.0, help='Escala da confiança do ALS (1 + alpha * r).')
+        parser.add_argument('--regularization', type=float, default=0.1, help='Regularização L2 do ALS.')
+        parser.add_argument('--svd-factors', type=int, default=100, help='Fatores latentes do SVD.')
+        parser.add_argument('--epochs', type=int, default=20, help='Épocas do SVD.')
+        parser.add_argument('--ratings-csv', help='CSV de avaliações (userId,movieId,rating) para o SVD, em vez do banco.')
+        parser.add_argument('--svd-backend', choices=['auto', 'surprise', 'numpy'], default='auto',
+                            help='Implementação do SVD (auto usa scikit-surprise se estiver instalado).')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Linhas lidas do banco por bloco.')
+        parser.add_argument('--ratings-only', action='store_true', help='Usa apenas Rating, sem sinais implícitos.')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Parte da versão ativa e refaz só os usuários com eventos novos no histórico '
+                                 f'(modelos: {", ".join(INCREMENTAL_TRAINERS)}; os demais treinam do zero).')
+        parser.add_argument('--keep', type=int, default=3, help='Versões antigas mantidas por modelo.')
+        parser.add_argument('--status', action='store_true', help='Apenas mostra as versões ativas.')
+
+    def handle(self, *args, **options):
+        store = ModelStore()
+        if options['status']:
+            return self.show_status(store)
+
+        names = options['models'] or list(TRAINERS)
+        unknown = [name for name in names if name not in TRAINERS]
+        if unknown:
+            raise CommandError(f'Modelo(s) desconhecido(s): {", ".join(unknown)}')
+
+        for name in names:
+            # Checkpoint no histórico de interações: o próximo --incremental começa daqui
+            cursor = EventCursor(f'train_{name}')
+            until = cursor.high_water_mark()
+            started = time.perf_counter()
+            result = None
+            if options['incremental'] and name in INCREMENTAL_TRAINERS and store.current_version(name):
+                users = cursor.changed_users(until)
+                if not users:
+                    self.stdout.write(self.style.SUCCESS(f'{name}: nenhum evento novo desde o último treino.'))
+                    continue
+                self.stdout.write(self.style.SUCCESS(f'Atualizando {name} ({len(users)} usuário(s) com eventos novos)...'))
+                result = INCREMENTAL_TRAINERS[name](store.load(name), users, options)
+                if result is None:
+                    self.stdout.write(self.style.WARNING(f'{name}: a versão ativa exige um treino completo.'))
+            if result is None:
+                self.stdout.write(self.style.SUCCESS(f'Treinando {name}...'))
+                result = TRAINERS[name](options)
+
+            arrays, metadata = result
+            metadata['train_seconds'] = round(time.perf_counter() - started, 3)
+            metadata['event_checkpoint'] = until
+            version = store.save(name, arrays, metadata)
+            cursor.advance(until)
+            artifact = store.load(name, version)
+            removed = store.prune(name, keep=options['keep'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{name} {version}: {artifact.size_bytes / 1e6:.1f} MB, treino {metadata["train_seconds"]}s, '
+                f'carga {artifact.load_seconds * 1000:.1f} ms, {len(removed)} versão(ões) antiga(s) removida(s).'
+            ))
+
+    def show_status(self, store):
+        for name in store.models():
+            version = store.current_version(name)
+            artifact = store.load(name, version) if version else None
+            size = f'{artifact.size_bytes / 1e6:.1f} MB' if artifact else '-'
+            self.stdout.write(f'{name}: ativa={version} tamanho={size} versões={len(store.versions(name))}')
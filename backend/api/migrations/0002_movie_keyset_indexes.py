@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['created_at', 'id'], name='movie_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['release_date', 'id'], name='movie_release_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['title', 'id'], name='movie_title_id_idx'),
+        ),
+        # Índice (genre_id, movie_id) na tabela de junção filme-gênero: o filtro por
+        # gênero com paginação por cursor percorre os filmes do gênero em ordem de id.
+        migrations.RunSQL(
+            sql='CREATE INDEX api_movie_genres_genre_movie_idx ON api_movie_genres (genre_id, movie_id);',
+            reverse_sql='DROP INDEX api_movie_genres_genre_movie_idx;',
+        ),
+    ]
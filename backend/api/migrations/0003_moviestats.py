@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_movie_stats(apps, schema_editor):
+    """
+    Preenche MovieStats a partir das interações já existentes
+    (equivalente ao comando rebuild_movie_stats).
+    """
+    Movie = apps.get_model('api', 'Movie')
+    MovieStats = apps.get_model('api', 'MovieStats')
+    LikeDislike = apps.get_model('api', 'LikeDislike')
+    FavoriteMovie = apps.get_model('api', 'FavoriteMovie')
+    WatchedMovie = apps.get_model('api', 'WatchedMovie')
+    Rating = apps.get_model('api', 'Rating')
+
+    totals = {movie_id: {} for movie_id in Movie.objects.values_list('id', flat=True)}
+    likes = LikeDislike.objects.values('movie_id').annotate(
+        likes=Count('id', filter=Q(action='like')), dislikes=Count('id', filter=Q(action='dislike'))
+    ).order_by()
+    for row in likes:
+        totals[row['movie_id']].update(likes=row['likes'], dislikes=row['dislikes'])
+    for row in FavoriteMovie.objects.values('movie_id').annotate(total=Count('id')).order_by():
+        totals[row['movie_id']]['favorites'] = row['total']
+    for row in WatchedMovie.objects.values('movie_id').annotate(total=Count('id')).order_by():
+        totals[row['movie_id']]['watched'] = row['total']
+    for row in Rating.objects.values('movie_id').annotate(total=Count('id'), rating_sum=Sum('rating')).order_by():
+        totals[row['movie_id']].update(ratings_count=row['total'], rating_sum=row['rating_sum'] or 0)
+
+    MovieStats.objects.bulk_create(
+        [MovieStats(movie_id=movie_id, **fields) for movie_id, fields in totals.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_movie_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieStats',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='api.movie')),
+                ('likes', models.IntegerField(default=0)),
+                ('dislikes', models.IntegerField(default=0)),
+                ('favorites', models.IntegerField(default=0)),
+                ('watched', models.IntegerField(default=0)),
+                ('ratings_count', models.IntegerField(default=0)),
+                ('rating_sum', models.DecimalField(decimal_places=1, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_movie_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_moviestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='api.movie')),
+                ('similar_movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.movie')),
+            ],
+            options={
+                'unique_together': {('movie', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_userrecommendation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenreTrending',
+            fields=[
+                ('genre', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='api.genre')),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MovieTrending',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='api.movie')),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='movie_trending_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:36
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_outboxevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InteractionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('watch', 'Watch'), ('unwatch', 'Unwatch'), ('like', 'Like'), ('dislike', 'Dislike'), ('none', 'None'), ('favorite', 'Favorite'), ('unfavorite', 'Unfavorite'), ('rating', 'Rating'), ('unrate', 'Unrate')], max_length=16)),
+                ('value', models.FloatField(default=1.0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('movie', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.movie')),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at', 'id'], name='interaction_event_time_idx'), models.Index(fields=['user', 'created_at'], name='interaction_event_user_idx')],
+            },
+        ),
+    ]
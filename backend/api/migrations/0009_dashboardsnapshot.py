@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_interactionevent_eventcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(default='dashboard', max_length=32, unique=True)),
+                ('data', models.JSONField(default=dict)),
+                ('refreshed_at', models.DateTimeField()),
+                ('build_seconds', models.FloatField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_dashboardsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='genre',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='external_id',
+            field=models.PositiveIntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_external_ids'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRecommendationState',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('model_version', models.CharField(max_length=64)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:17
+
+import datetime
+import os
+
+from django.db import migrations, models
+
+
+def seed_epoch(apps, schema_editor):
+    # Pontuações já gravadas usam a época da antiga variável TRENDING_EPOCH (padrão 2024-01-01)
+    epoch = datetime.datetime.fromisoformat(os.environ.get('TRENDING_EPOCH', '2024-01-01'))
+    if epoch.tzinfo is None:
+        epoch = epoch.replace(tzinfo=datetime.timezone.utc)
+    TrendingEpoch = apps.get_model('api', 'TrendingEpoch')
+    TrendingEpoch.objects.get_or_create(key='trending', defaults={'epoch': epoch})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_userrecommendationstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(default='trending', max_length=50, unique=True)),
+                ('epoch', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_epoch, migrations.RunPython.noop),
+    ]
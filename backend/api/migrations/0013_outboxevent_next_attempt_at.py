@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_trendingepoch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,236 @@
+# model_store.py - armazenamento versionado de artefatos de modelos (arrays .npy mapeados em memória)
+import json
+import os
+import secrets
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+
+
+class ModelArtifact:
+    """
+    Uma versão carregada de um modelo: arrays (memmap somente leitura) e manifesto.
+    """
+
+    def __init__(self, name, version, path, arrays, manifest, load_seconds):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.arrays = arrays
+        self.manifest = manifest
+        self.metadata = manifest.get('metadata', {})
+        self.load_seconds = load_seconds
+        self.loaded_at = timezone.now()
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def __contains__(self, key):
+        return key in self.arrays
+
+    @property
+    def size_bytes(self):
+        return sum(info['bytes'] for info in self.manifest.get('arrays', {}).values())
+
+    def describe(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'created_at': self.manifest.get('created_at'),
+            'loaded_at': self.loaded_at.isoformat(),
+            'load_seconds': self.load_seconds,
+            'size_bytes': self.size_bytes,
+            'arrays': sorted(self.arrays),
+            'metadata': self.metadata,
+        }
+
+
+class ModelStore:
+    """
+    Diretório de artefatos: <raiz>/<modelo>/<versão>/{manifest.json, *.npy}.
+
+    Cada versão é gravada em um diretório temporário e renomeada de uma vez;
+    a versão ativa fica no arquivo <raiz>/<modelo>/CURRENT, substituído com
+    os.replace. Leitores nunca veem uma versão pela metade.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or getattr(settings, 'MODEL_DIR', Path(settings.BASE_DIR) / 'model_store'))
+
+    def model_dir(self, name):
+        return self.root / name
+
+    def save(self, name, arrays, metadata=None, activate=True):
+        """
+        Grava uma nova versão do modelo e (por padrão) a torna ativa.
+
+        :param arrays: Dicionário {nome: np.ndarray}.
+        :param metadata: Dicionário serializável em JSON com informações do treino.
+        :return: Nome da versão criada.
+        """
+        model_dir = self.model_dir(name)
+        model_dir.mkdir(parents=True, exist_ok=True)
+        version = timezone.now().strftime('%Y%m%dT%H%M%S%f') + '-' + secrets.token_hex(3)
+        tmp_dir = model_dir / f'.tmp-{version}'
+        tmp_dir.mkdir()
+
+        manifest = {
+            'name': name,
+            'version': version,
+            'created_at': timezone.now().isoformat(),
+            'arrays': {},
+            'metadata': metadata or {},
+        }
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            np.save(tmp_dir / f'{key}.npy', array, allow_pickle=False)
+            manifest['arrays'][key] = {
+                'shape': list(array.shape),
+                'dtype': str(array.dtype),
+                'bytes': int(array.nbytes),
+            }
+        with open(tmp_dir / MANIFEST_FILE, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+        os.replace(tmp_dir, model_dir / version)
+        if activate:
+            self.activate(name, version)
+        return version
+
+    def activate(self, name, version):
+        """
+        Aponta CURRENT para a versão informada (troca atômica).
+        """
+        if not (self.model_dir(name) / version / MANIFEST_FILE).exists():
+            raise FileNotFoundError(f'Versão {version} do modelo {name} não encontrada.')
+        tmp_file = self.model_dir(name) / f'.{CURRENT_FILE}.{secrets.token_hex(4)}'
+        tmp_file.write_text(version)
+        os.replace(tmp_file, self.model_dir(name) / CURRENT_FILE)
+
+    def current_version(self, name):
+        try:
+            return (self.model_dir(name) / CURRENT_FILE).read_text().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def versions(self, name):
+        model_dir = self.model_dir(name)
+        if not model_dir.exists():
+            return []
+        return sorted(path.name for path in model_dir.iterdir()
+                      if path.is_dir() and not path.name.startswith('.'))
+
+    def models(self):
+        if not self.root.exists():
+            return []
+        return sorted(path.name for path in self.root.iterdir() if path.is_dir() and not path.name.startswith('.'))
+
+    def load(self, name, version=None, mmap=True):
+        """
+        Carrega uma versão (a ativa, se version for None). Com mmap=True os arrays
+        são abertos com np.load(mmap_mode='r'): vários workers do gunicorn que
+        carregam a mesma versão compartilham as mesmas páginas do cache do SO.
+        """
+        version = version or self.current_version(name)
+        if version is None:
+            return None
+        started = time.perf_counter()
+        path = self.model_dir(name) / version
+        with open(path / MANIFEST_FILE) as manifest_file:
+            manifest = json.load(manifest_file)
+        arrays = {
+            key: np.load(path / f'{key}.npy', mmap_mode='r' if mmap else None, allow_pickle=False)
+            for key in manifest['arrays']
+        }
+        return ModelArtifact(name, version, path, arrays, manifest, time.perf_counter() - started)
+
+    def prune(self, name, keep=3):
+        """
+        Remove versões antigas, mantendo as `keep` mais recentes e a ativa.
+        """
+        current = self.current_version(name)
+        removed = []
+        for version in self.versions(name)[:-keep] if keep else self.versions(name):
+            if version != current:
+                shutil.rmtree(self.model_dir(name) / version, ignore_errors=True)
+                removed.append(version)
+        return removed
+
+
+class ModelRegistry:
+    """
+    Cache por processo das versões ativas. A cada check_interval segundos
+    confere o arquivo CURRENT de cada modelo; se a versão mudou, carrega a nova
+    e troca a referência, sem reiniciar o worker. Requisições em andamento
+    continuam usando o artefato antigo até terminarem.
+    """
+
+    def __init__(self, store=None, check_interval=None):
+        self.store = store or ModelStore()
+        self.check_interval = check_interval if check_interval is not None else getattr(
+            settings, 'MODEL_CHECK_INTERVAL', 5)
+        self._artifacts = {}
+        self._checked_at = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """
+        Retorna o artefato ativo do modelo (ou None se nunca foi treinado).
+        """
+        now = time.monotonic()
+        artifact = self._artifacts.get(name)
+        if artifact is not None and now - self._checked_at.get(name, 0) < self.check_interval:
+            return artifact
+
+        with self._lock:
+            self._checked_at[name] = now
+            version = self.store.current_version(name)
+            artifact = self._artifacts.get(name)
+            if version is None:
+                self._artifacts.pop(name, None)
+                return None
+            if artifact is None or artifact.version != version:
+                artifact = self.store.load(name, version)
+                self._artifacts[name] = artifact
+            return artifact
+
+    def status(self):
+        """
+        Versão ativa, tempo de carga e tamanho de cada modelo conhecido.
+        """
+        status = []
+        for name in self.store.models():
+            artifact = self.get(name)
+            entry = {
+                'name': name,
+                'active_version': self.store.current_version(name),
+                'versions': self.store.versions(name),
+            }
+            if artifact is not None:
+                entry.update(artifact.describe())
+            status.append(entry)
+        return status
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """
+    Retorna o ModelRegistry do processo (criado na primeira chamada).
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 
 
@@ -8,6 +9,7 @@ class Genre(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
     slug = models.SlugField(unique=True, blank=True, null=True)  # Slug para URLs amigáveis
+    external_id = models.PositiveIntegerField(unique=True, blank=True, null=True)  # Id no catálogo importado (TMDB)
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -30,6 +32,15 @@ class Movie(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)  # Data de criação
     updated_at = models.DateTimeField(auto_now=True)  # Data da última atualização
     users_watched = models.ManyToManyField(User, related_name='watched_movies', blank=True)  # Relacionamento com usuários que assistiram ao filme
+    external_id = models.PositiveIntegerField(unique=True, blank=True, null=True)  # Id no catálogo importado (TMDB)
+
+    class Meta:
+        # Índices (campo, id) usados pela paginação por cursor (MovieKeysetPagination)
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='movie_created_id_idx'),
+            models.Index(fields=['release_date', 'id'], name='movie_release_id_idx'),
+            models.Index(fields=['title', 'id'], name='movie_title_id_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -102,20 +113,32 @@ class WatchedMovie(models.Model):
     def increment_watch_count(self):
         """
         Incrementa o contador de assistências (watch_count) para o filme do usuário.
+        A soma é feita pelo banco num único comando (api/interactions.py, record_watch),
+        sem perder incrementos concorrentes; self.watch_count recebe o novo valor.
         """
-        self.watch_count += 1
-        self.save()
+        from .interactions import record_watch
+
+        watched, _ = record_watch(self.user_id, self.movie_id)
+        self.pk = watched.pk
+        self.watch_count = watched.watch_count
 
     @staticmethod
     def get_watch_count(user, movie):
         """
         Método para obter a contagem de assistências de um usuário para um filme.
         """
+        from .counters import counter_buffer
+
         try:
             watched_movie = WatchedMovie.objects.get(user=user, movie=movie)
-            return watched_movie.watch_count
         except WatchedMovie.DoesNotExist:
             return 0
+        buffer = counter_buffer()
+        if buffer is None:
+            return watched_movie.watch_count
+        # Soma as assistências deste processo que ainda não foram gravadas
+        return watched_movie.watch_count + buffer.pending_watches(
+            watched_movie.user_id, watched_movie.movie_id, watched_movie.pk)
 
 
 
@@ -129,4 +152,181 @@ class LikeDislike(models.Model):
         unique_together = ('user', 'movie')  # Garantir que um usuário só possa interagir com um filme uma vez (like ou dislike)
 
     def __str__(self):
-        return f'{self.user.username} {self.action}d {self.movie.title}'
\ No newline at end of file
+        return f'{self.user.username} {self.action}d {self.movie.title}'
+
+# Contadores desnormalizados por filme, mantidos a cada escrita de interação (ver api/stats.py)
+class MovieStats(models.Model):
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    likes = models.IntegerField(default=0)
+    dislikes = models.IntegerField(default=0)
+    favorites = models.IntegerField(default=0)
+    watched = models.IntegerField(default=0)  # Número de usuários que assistiram ao filme
+    ratings_count = models.IntegerField(default=0)
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=1, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def rating_avg(self):
+        """
+        Média das avaliações do filme (None se ainda não houver avaliações).
+        """
+        if not self.ratings_count:
+            return None
+        return self.rating_sum / self.ratings_count
+
+    def __str__(self):
+        return f'{self.movie_id}: {self.likes} likes, {self.dislikes} dislikes, {self.favorites} favoritos'
+
+
+# Vizinhos por conteúdo pré-calculados (top-K por filme, ver api/content.py)
+class MovieSimilarity(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='similarities')
+    similar_movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()  # Similaridade cosseno entre os vetores TF-IDF
+    rank = models.PositiveSmallIntegerField()  # 1 = mais parecido
+
+    class Meta:
+        unique_together = ('movie', 'rank')  # Também serve de índice para a leitura por filme em ordem de rank
+
+    def __str__(self):
+        return f'{self.movie_id} ~ {self.similar_movie_id} ({self.score:.3f})'
+
+
+# Lista de recomendações materializada por usuário (ver api/recommendations.py)
+class UserRecommendation(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveIntegerField()  # 1 = primeira recomendação
+    model_version = models.CharField(max_length=64)  # Modelo/versão que gerou a lista
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user', 'rank')  # Também serve de índice para a leitura da lista em ordem
+
+    def __str__(self):
+        return f'{self.user_id} #{self.rank}: {self.movie_id} ({self.score:.2f})'
+
+
+# Último cálculo da lista de cada usuário: distingue "calculada e vazia" de "nunca calculada"
+class UserRecommendationState(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    model_version = models.CharField(max_length=64)
+    size = models.PositiveIntegerField(default=0)  # Recomendações gravadas no último cálculo
+    refreshed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.user_id}: {self.size} ({self.model_version})'
+
+
+# Pontuações de tendência com decaimento exponencial (ver api/trending.py). O valor gravado
+# é a soma de peso * exp(λ * (t_evento - época)) ("forward decay"): cada evento só soma na
+# linha e a ordem por score já é a ordem da tendência atual. A época fica em TrendingEpoch.
+class MovieTrending(models.Model):
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['-score'], name='movie_trending_score_idx')]
+
+    def __str__(self):
+        return f'{self.movie_id}: {self.score:.3g}'
+
+
+class GenreTrending(models.Model):
+    genre = models.OneToOneField(Genre, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.genre_id}: {self.score:.3g}'
+
+
+# Época das pontuações de tendência (linha única). rebase_trending a avança e divide as
+# pontuações na mesma transação, antes que exp(λ * (t - época)) passe do limite do float.
+class TrendingEpoch(models.Model):
+    key = models.CharField(max_length=50, unique=True, default='trending')
+    epoch = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.key}: {self.epoch.isoformat()}'
+
+
+# Outbox transacional: efeitos colaterais das interações (contadores, preferências) gravados na
+# mesma transação da interação e aplicados depois pelo worker (manage.py process_outbox)
+class OutboxEvent(models.Model):
+    kind = models.CharField(max_length=32)  # Tipo do evento (ver api/outbox.py, HANDLERS)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)  # None = pendente
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)  # Após uma falha: espera antes da nova tentativa
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Só os pendentes entram no índice: a fila continua pequena mesmo com o histórico
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({"processado" if self.processed_at else "pendente"})'
+
+
+class InteractionEvent(models.Model):
+    """
+    Histórico somente de inserção das interações (api/events.py): cada like, assistência,
+    favorito ou avaliação vira uma linha, gravada na mesma transação das tabelas de estado.
+    Sem chave estrangeira no banco: o histórico sobrevive à exclusão do usuário ou do filme.
+    """
+    EVENT_TYPES = [
+        ('watch', 'Watch'), ('unwatch', 'Unwatch'),
+        ('like', 'Like'), ('dislike', 'Dislike'), ('none', 'None'),
+        ('favorite', 'Favorite'), ('unfavorite', 'Unfavorite'),
+        ('rating', 'Rating'), ('unrate', 'Unrate'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    movie = models.ForeignKey(Movie, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    event_type = models.CharField(max_length=16, choices=EVENT_TYPES)
+    value = models.FloatField(default=1.0)  # Nota nas avaliações; 1 nos demais
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Leituras por intervalo de tempo (análises) e histórico de um usuário
+            models.Index(fields=['created_at', 'id'], name='interaction_event_time_idx'),
+            models.Index(fields=['user', 'created_at'], name='interaction_event_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.event_type} #{self.pk} (user {self.user_id}, movie {self.movie_id})'
+
+
+class EventCheckpoint(models.Model):
+    """
+    Último InteractionEvent processado por cada consumidor do histórico (ver EventCursor).
+    """
+    name = models.CharField(max_length=64, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} @ {self.last_event_id}'
+
+
+class DashboardSnapshot(models.Model):
+    """
+    Agregados do dashboard calculados fora do request (api/dashboard.py); o
+    DashboardView só lê a linha.
+    """
+    key = models.CharField(max_length=32, unique=True, default='dashboard')
+    data = models.JSONField(default=dict)
+    refreshed_at = models.DateTimeField()
+    build_seconds = models.FloatField(default=0)
+
+    def __str__(self):
+        return f'{self.key} @ {self.refreshed_at:%Y-%m-%d %H:%M:%S}'
@@ -0,0 +1,239 @@
+# outbox.py - outbox transacional: efeitos colaterais das interações aplicados por um worker local
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Genre, OutboxEvent
+from .stats import update_movie_stats
+from .trending import record_events
+from .utils import adjust_user_preferences
+
+logger = logging.getLogger(__name__)
+
+INTERACTION_EVENT = 'interaction'
+
+
+def outbox_mode():
+    """
+    OUTBOX_MODE: 'worker' (eventos ficam na fila até o process_outbox, padrão) ou
+    'sync' (aplicados logo após o commit do próprio request, útil sem worker e em testes).
+    """
+    return getattr(settings, 'OUTBOX_MODE', 'worker')
+
+
+def max_attempts():
+    return getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    """
+    Espera antes da próxima tentativa de um evento que já falhou `attempts` vezes:
+    OUTBOX_RETRY_BASE_SECONDS dobrando a cada falha, até OUTBOX_RETRY_MAX_SECONDS.
+    """
+    base = getattr(settings, 'OUTBOX_RETRY_BASE_SECONDS', 5)
+    ceiling = getattr(settings, 'OUTBOX_RETRY_MAX_SECONDS', 3600)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), ceiling))
+
+
+def _interaction_payload(movie_id, stats=None, preference=None, trending=None):
+    stats = {field: str(delta) if isinstance(delta, Decimal) else delta
+             for field, delta in (stats or {}).items() if delta}
+    trending = [[kind, value] for kind, value in trending or () if value]
+    if not stats and not preference and not trending:
+        return None
+    payload = {'movie_id': movie_id}
+    if stats:
+        payload['stats'] = stats
+    if preference:
+        payload['preference'] = list(preference)
+    if trending:
+        payload['trending'] = trending
+    return payload
+
+
+def _after_commit(event_ids):
+    if event_ids and outbox_mode() == 'sync':
+        transaction.on_commit(lambda: process_events(event_ids))
+
+
+def enqueue_interaction(user_id, movie_id, stats=None, preference=None, trending=None):
+    """
+    Registra os efeitos de uma interação para o worker. Deve ser chamada na mesma
+    transação que grava a interação: ou as duas linhas existem, ou nenhuma.
+
+    :param stats: Incrementos de MovieStats (ex.: {'likes': 1, 'dislikes': -1}).
+    :param preference: (ação, peso) para adjust_user_preferences, ou None.
+    :param trending: Eventos de tendência (tipo, valor) da transição, de trending_transition.
+    :return: O OutboxEvent criado, ou None se não houver nada a fazer.
+    """
+    payload = _interaction_payload(movie_id, stats, preference, trending)
+    if payload is None:
+        return None
+    event = OutboxEvent.objects.create(kind=INTERACTION_EVENT, user_id=user_id, payload=payload)
+    _after_commit([event.pk])
+    return event
+
+
+def enqueue_interactions(user_id, interactions):
+    """
+    Versão em lote de enqueue_interaction: um único INSERT para todos os eventos.
+
+    :param interactions: Iterável de (movie_id, stats, preference, trending).
+    :return: Número de eventos criados.
+    """
+    events = []
+    for movie_id, stats, preference, trending in interactions:
+        payload = _interaction_payload(movie_id, stats, preference, trending)
+        if payload is not None:
+            events.append(OutboxEvent(kind=INTERACTION_EVENT, user_id=user_id, payload=payload))
+    if not events:
+        return 0
+    events = OutboxEvent.objects.bulk_create(events)
+    if events[0].pk is not None:
+        _after_commit([event.pk for event in events])
+    elif outbox_mode() == 'sync':
+        # Banco sem RETURNING no bulk_create: processa o que estiver pendente do usuário
+        transaction.on_commit(lambda: process_events(list(
+            _pending().filter(user_id=user_id).values_list('pk', flat=True))))
+    return len(events)
+
+
+def handle_interaction(event):
+    """
+    Aplica os contadores do filme, a tendência e o ajuste de preferências de
+    gênero do usuário. A tendência usa o instante da interação (criação do evento).
+    """
+    movie_id = event.payload['movie_id']
+    stats = event.payload.get('stats')
+    if stats:
+        # rating_sum vai como texto no JSON para não perder a precisão decimal
+        update_movie_stats(movie_id, **{
+            field: Decimal(delta) if field == 'rating_sum' else delta for field, delta in stats.items()
+        })
+    preference = event.payload.get('preference')
+    if preference:
+        action, weight = preference
+        adjust_user_preferences(event.user_id, Genre.objects.filter(movies=movie_id), action, weight)
+    trending = event.payload.get('trending')
+    if trending:
+        record_events([(movie_id, kind, value) for kind, value in trending], when=event.created_at)
+
+
+# Tipo do evento -> função que aplica o evento (recebe o OutboxEvent)
+HANDLERS = {
+    INTERACTION_EVENT: handle_interaction,
+}
+
+
+def _apply(events):
+    """
+    Aplica cada evento em uma savepoint própria: a falha de um não desfaz os
+    outros. Os aplicados são marcados na mesma transação dos seus efeitos; os que
+    falharam só voltam à fila depois de retry_delay (backoff exponencial).
+    """
+    now = timezone.now()
+    done = []
+    failed = []
+    for event in events:
+        try:
+            with transaction.atomic():
+                HANDLERS[event.kind](event)
+        except Exception as error:
+            logger.exception('Falha ao processar o evento %s do outbox', event.pk)
+            event.attempts += 1
+            event.last_error = f'{type(error).__name__}: {error}'[:1000]
+            event.next_attempt_at = now + retry_delay(event.attempts)
+            failed.append(event)
+        else:
+            done.append(event.pk)
+
+    if done:
+        OutboxEvent.objects.filter(pk__in=done).update(processed_at=now, attempts=F('attempts') + 1)
+    if failed:
+        OutboxEvent.objects.bulk_update(failed, ['attempts', 'last_error', 'next_attempt_at'])
+    return len(done), len(failed)
+
+
+def _queued():
+    # Não processados e com tentativas sobrando, inclusive os que esperam o backoff
+    return OutboxEvent.objects.filter(processed_at__isnull=True, attempts__lt=max_attempts())
+
+
+def _exhausted():
+    return OutboxEvent.objects.filter(processed_at__isnull=True, attempts__gte=max_attempts())
+
+
+def _pending():
+    # Prontos para uma tentativa agora
+    return _queued().filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=timezone.now()))
+
+
+def process_batch(batch_size=100):
+    """
+    Reserva até batch_size eventos pendentes, em ordem de criação, e os aplica.
+
+    A reserva usa SELECT ... FOR UPDATE SKIP LOCKED (no PostgreSQL): vários
+    workers não pegam os mesmos eventos. Efeitos e marcação de processado são
+    gravados no mesmo commit; se o worker cair antes dele, nada foi aplicado e o
+    evento volta para a fila (entrega pelo menos uma vez, efeito uma única vez).
+    Um evento que falha espera retry_delay antes de ser pego de novo; os que
+    falham OUTBOX_MAX_ATTEMPTS vezes ficam de fora da fila até replay_exhausted.
+
+    :return: (eventos aplicados, eventos com falha).
+    """
+    with transaction.atomic():
+        events = list(_pending().select_for_update(skip_locked=True).order_by('id')[:batch_size])
+        return _apply(events)
+
+
+def process_events(event_ids):
+    """
+    Aplica eventos específicos (modo 'sync'); os já processados são ignorados.
+    """
+    with transaction.atomic():
+        events = list(_pending().select_for_update(skip_locked=True).filter(pk__in=event_ids).order_by('id'))
+        return _apply(events)
+
+
+def outbox_lag():
+    """
+    Estado da fila: eventos pendentes (inclusive os que esperam uma nova tentativa),
+    quantos esperam o backoff, idade do mais antigo (segundos) e eventos que
+    esgotaram as tentativas.
+    """
+    now = timezone.now()
+    pending = _queued().aggregate(total=Count('id'), oldest=Min('created_at'),
+                                  retrying=Count('id', filter=Q(next_attempt_at__gt=now)))
+    oldest = pending['oldest']
+    return {
+        'pending': pending['total'],
+        'retrying': pending['retrying'],
+        'lag_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+        'failed': _exhausted().count(),
+    }
+
+
+def replay_exhausted(event_ids=None):
+    """
+    Devolve à fila os eventos que esgotaram as tentativas (depois de corrigida a
+    causa da falha): zera as tentativas e a espera. O último erro fica registrado.
+
+    :param event_ids: Só estes eventos (None = todos os esgotados).
+    :return: Número de eventos devolvidos.
+    """
+    events = _exhausted()
+    if event_ids is not None:
+        events = events.filter(pk__in=event_ids)
+    return events.update(attempts=0, next_attempt_at=None)
+
+
+def purge_processed(older_than):
+    """
+    Apaga os eventos processados há mais de older_than (timedelta).
+    """
+    return OutboxEvent.objects.filter(processed_at__lt=timezone.now() - older_than).delete()[0]
@@ -0,0 +1,165 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class MovieKeysetPagination(BasePagination):
+    """
+    Paginação por cursor (keyset) para a listagem de filmes.
+
+    Os filmes são ordenados de forma estável por (campo de ordenação, id) e a
+    próxima página é buscada com "WHERE (campo, id) > (último valor, último id)",
+    usando os índices do modelo Movie. Assim a página 500 custa o mesmo que a
+    página 1: não há OFFSET nem COUNT(*).
+
+    O cursor é opaco (base64 de um JSON) e carrega a ordenação, o valor do campo,
+    o id do último/primeiro item e a direção da navegação. Um cursor malformado ou
+    adulterado resulta em 400.
+    """
+    page_size = 10  # Número de filmes por página
+    page_size_query_param = 'page_size'  # Permitir que o cliente ajuste o tamanho
+    max_page_size = 100  # Limite máximo para o tamanho da página
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    ordering_fields = ('id', 'title', 'release_date', 'created_at')  # Campos com índice (campo, id)
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Cursor inválido.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            ordering, value, pk, reverse = self.get_ordering(request), None, None, False
+        else:
+            ordering, value, pk, reverse = cursor
+        self.ordering = ordering
+        field_name, descending = ordering.lstrip('-'), ordering.startswith('-')
+
+        # Navegar para trás equivale a percorrer a ordenação invertida
+        if reverse:
+            descending = not descending
+
+        if pk is not None:
+            queryset = queryset.filter(self.get_keyset_filter(queryset.model, field_name, descending, value, pk))
+        queryset = queryset.order_by(*self.get_order_by(field_name, descending))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        # Ao avançar, existe página anterior se viemos de um cursor; ao voltar, o inverso
+        if reverse:
+            self.has_next, self.has_previous = pk is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, pk is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, request):
+        """
+        Retorna a ordenação pedida em ?ordering=, se for um dos campos permitidos.
+        """
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        if ordering.lstrip('-') not in self.ordering_fields:
+            return self.default_ordering
+        return ordering
+
+    def get_keyset_filter(self, model, field_name, descending, value, pk):
+        """
+        Monta a condição "(campo, id) depois de (valor, pk)" na direção da ordenação.
+        """
+        lookup = 'lt' if descending else 'gt'
+        if field_name == 'id':
+            return Q(**{f'id__{lookup}': pk})
+        try:
+            value = model._meta.get_field(field_name).to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise ParseError(self.invalid_cursor_message)
+        if value is None:
+            raise ParseError(self.invalid_cursor_message)
+        return Q(**{f'{field_name}__{lookup}': value}) | Q(**{field_name: value, f'id__{lookup}': pk})
+
+    def get_order_by(self, field_name, descending):
+        prefix = '-' if descending else ''
+        if field_name == 'id':
+            return [f'{prefix}id']
+        return [f'{prefix}{field_name}', f'{prefix}id']
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        field_name = self.ordering.lstrip('-')
+        field = instance._meta.get_field(field_name)
+        payload = {
+            'o': self.ordering,
+            'v': field.value_to_string(instance),
+            'id': instance.pk,
+            'r': reverse,
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode('utf-8')).decode('ascii')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.ordering_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        """
+        Decodifica o cursor recebido. Retorna None se não houver cursor.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            ordering, pk = payload['o'], int(payload['id'])
+            if not isinstance(ordering, str) or ordering.lstrip('-') not in self.ordering_fields:
+                raise ValueError(ordering)
+            if not -2 ** 63 <= pk < 2 ** 63:  # Fora do inteiro de 64 bits do banco
+                raise ValueError(pk)
+            return ordering, payload['v'], pk, bool(payload['r'])
+        except (TypeError, KeyError, ValueError, UnicodeError, binascii.Error):
+            raise ParseError(self.invalid_cursor_message)
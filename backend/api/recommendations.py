@@ -0,0 +1,283 @@
+# recommendations.py - listas de recomendação materializadas por usuário (UserRecommendation)
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import LikeDislike, UserRecommendation, UserRecommendationState, WatchedMovie
+from .trending import get_trending_movies
+from .utils import recommend_movies_by_genre_preferences
+
+logger = logging.getLogger(__name__)
+
+GENRE_MODEL_VERSION = 'genre-sql'
+TRENDING_MODEL_VERSION = 'trending'
+
+
+def materialized_limit():
+    return getattr(settings, 'RECOMMENDATION_MATERIALIZED_LIMIT', 100)
+
+
+def _excluded_movies(user_id):
+    # Os modelos só conhecem o que foi visto até o treino: filtra o que mudou depois
+    excluded = set(WatchedMovie.objects.filter(user_id=user_id).values_list('movie_id', flat=True))
+    excluded.update(LikeDislike.objects.filter(user_id=user_id, action='dislike').values_list('movie_id', flat=True))
+    return excluded
+
+
+def _knn_artifact():
+    from .model_store import get_model_registry
+
+    return get_model_registry().get('knn')
+
+
+def compute_user_recommendations(user_id, limit=None):
+    """
+    Calcula a lista ranqueada de um usuário com o modelo configurado em
+    RECOMMENDATION_MATERIALIZED_SOURCE:
+      - 'als': modelo ALS ativo no ModelStore;
+      - 'knn': interações dos vizinhos (modelo 'knn' ativo) ponderadas pela similaridade;
+      - 'genre': pontuação por gêneros favoritos calculada no banco.
+    'als' e 'knn' caem para 'genre' se não houver modelo ou o usuário não estava no treino,
+    e 'genre' cai para os filmes em alta (api/trending.py) se o usuário não tem gêneros favoritos.
+
+    :return: (lista de (movie_id, pontuação), versão do modelo).
+    """
+    limit = limit or materialized_limit()
+    source = getattr(settings, 'RECOMMENDATION_MATERIALIZED_SOURCE', 'genre')
+    if source == 'als':
+        from .als import get_als_recommender
+
+        recommender = get_als_recommender()
+        if recommender is not None:
+            excluded = _excluded_movies(user_id)
+            rows = [(movie_id, score) for movie_id, score in recommender.recommend(user_id, limit + len(excluded))
+                    if movie_id not in excluded][:limit]
+            if rows:
+                return rows, f'als:{recommender.version}'
+    elif source == 'knn':
+        from .machineLern import recommend_movies_from_neighbours
+
+        artifact = _knn_artifact()
+        if artifact is not None:
+            excluded = _excluded_movies(user_id)
+            rows = [(movie_id, score) for movie_id, score
+                    in recommend_movies_from_neighbours(user_id, artifact, top_n=limit + len(excluded))
+                    if movie_id not in excluded][:limit]
+            if rows:
+                return rows, f'knn:{artifact.version}'
+
+    movies = recommend_movies_by_genre_preferences(user_id).values_list('id', 'score')[:limit]
+    rows = [(movie_id, float(score)) for movie_id, score in movies]
+    if rows:
+        return rows, GENRE_MODEL_VERSION
+
+    # Partida a frio (sem gêneros favoritos): filmes em alta que o usuário ainda não viu
+    excluded = _excluded_movies(user_id)
+    rows = [(movie_id, score) for movie_id, score in get_trending_movies(limit=limit + len(excluded))
+            if movie_id not in excluded][:limit]
+    return rows, TRENDING_MODEL_VERSION
+
+
+def empty_retry_seconds():
+    """
+    RECOMMENDATION_EMPTY_RETRY_SECONDS: intervalo mínimo, em segundos, entre novas
+    tentativas para um usuário cuja lista saiu vazia (sem candidatos).
+    """
+    return getattr(settings, 'RECOMMENDATION_EMPTY_RETRY_SECONDS', 600)
+
+
+def _lock_user(user_id):
+    # Serializa os recálculos do mesmo usuário (thread, modo sync, rebuild): sem isso, dois
+    # bulk_create concorrentes colidem em (user, rank). FOR NO KEY UPDATE não bloqueia as
+    # inserções que referenciam o usuário (likes, assistidos) no PostgreSQL.
+    list(User.objects.select_for_update(no_key=True).filter(pk=user_id).values_list('pk', flat=True))
+
+
+def save_user_recommendations(user_id, rows, version):
+    """
+    Substitui a lista materializada do usuário (numa transação: leitores veem a
+    lista antiga ou a nova, nunca uma mistura) e registra o cálculo em
+    UserRecommendationState, mesmo quando a lista é vazia.
+    """
+    with transaction.atomic():
+        _lock_user(user_id)
+        UserRecommendation.objects.filter(user_id=user_id).delete()
+        UserRecommendation.objects.bulk_create([
+            UserRecommendation(user_id=user_id, movie_id=movie_id, score=score, rank=rank, model_version=version)
+            for rank, (movie_id, score) in enumerate(rows, start=1)
+        ])
+        UserRecommendationState.objects.update_or_create(user_id=user_id, defaults={
+            'model_version': version, 'size': len(rows), 'refreshed_at': timezone.now(),
+        })
+    return len(rows)
+
+
+def refresh_user_recommendations(user_id, limit=None):
+    """
+    Recalcula e substitui a lista materializada do usuário. O cálculo acontece com
+    o usuário bloqueado: um recálculo concorrente espera e grava por último a
+    lista mais nova.
+
+    :return: Número de recomendações gravadas.
+    """
+    with transaction.atomic():
+        _lock_user(user_id)
+        rows, version = compute_user_recommendations(user_id, limit)
+        return save_user_recommendations(user_id, rows, version)
+
+
+def ensure_user_recommendations(user_id):
+    """
+    Chamada pela leitura quando o usuário não tem nenhuma recomendação gravada.
+
+    Lista nunca calculada: calcula e grava na hora (uma vez por usuário). Lista
+    calculada e vazia (usuário novo antes de haver filmes em alta, ou que já viu
+    tudo): o request não grava nada; se o último cálculo tiver mais de
+    RECOMMENDATION_EMPTY_RETRY_SECONDS, agenda um novo em segundo plano.
+    """
+    refreshed_at = UserRecommendationState.objects.filter(user_id=user_id).values_list(
+        'refreshed_at', flat=True).first()
+    if refreshed_at is None:
+        refresh_user_recommendations(user_id)
+    elif (timezone.now() - refreshed_at).total_seconds() > empty_retry_seconds():
+        schedule_refresh(user_id)
+
+
+def remove_user_recommendations(user_id, movie_ids):
+    """
+    Tira filmes da lista do usuário na hora (assistido ou descurtido), sem recálculo.
+    Os ranks dos demais não mudam; a ordem da lista continua a mesma.
+    """
+    return UserRecommendation.objects.filter(user_id=user_id, movie_id__in=movie_ids).delete()[0]
+
+
+# ----------------------------------------------------------------------
+# Atualização em segundo plano
+# ----------------------------------------------------------------------
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()  # Usuários com recálculo na fila ou rodando (no máximo um por usuário)
+_dirty = set()  # Usuários com eventos chegados durante o recálculo: roda de novo no fim
+_pending_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'RECOMMENDATION_REFRESH_WORKERS', 2),
+                    thread_name_prefix='recommendations',
+                )
+    return _executor
+
+
+def _refresh_job(user_id):
+    try:
+        while True:
+            try:
+                refresh_user_recommendations(user_id)
+            except Exception:
+                logger.exception('Falha ao atualizar as recomendações do usuário %s', user_id)
+            # O usuário só sai de _pending depois do recálculo; eventos que chegaram
+            # enquanto ele rodava pedem mais uma volta, em vez de um job concorrente
+            with _pending_lock:
+                if user_id not in _dirty:
+                    _pending.discard(user_id)
+                    break
+                _dirty.discard(user_id)
+    finally:
+        # Cada thread abre sua própria conexão; fecha para não deixá-la pendurada
+        connection.close()
+
+
+def schedule_refresh(user_id):
+    """
+    Agenda o recálculo da lista do usuário para depois do commit da transação
+    corrente. Vários eventos do mesmo usuário antes da execução viram um só recálculo.
+
+    RECOMMENDATION_REFRESH_MODE: 'async' (thread em segundo plano, padrão),
+    'sync' (no próprio request, útil em testes) ou 'off'.
+    """
+    mode = getattr(settings, 'RECOMMENDATION_REFRESH_MODE', 'async')
+    if mode == 'off':
+        return
+    if mode == 'sync':
+        transaction.on_commit(lambda: refresh_user_recommendations(user_id))
+        return
+
+    def submit():
+        with _pending_lock:
+            if user_id in _pending:
+                _dirty.add(user_id)
+                return
+            _pending.add(user_id)
+        _get_executor().submit(_refresh_job, user_id)
+
+    transaction.on_commit(submit)
+
+
+# ----------------------------------------------------------------------
+# Reconstrução completa (manage.py rebuild_recommendations)
+# ----------------------------------------------------------------------
+def rebuild_shard(user_ids, limit=None):
+    """
+    Recalcula as listas de um grupo de usuários. Executada em um processo do pool:
+    fecha as conexões herdadas do processo pai antes de usar o banco.
+
+    :return: (usuários processados, recomendações gravadas).
+    """
+    from django.db import connections
+
+    connections.close_all()
+    limit = limit or materialized_limit()
+    written = 0
+    remaining = list(user_ids)
+    if getattr(settings, 'RECOMMENDATION_MATERIALIZED_SOURCE', 'genre') == 'knn':
+        written, remaining = _rebuild_knn_batch(remaining, limit)
+    for user_id in remaining:
+        written += refresh_user_recommendations(user_id, limit)
+    connections.close_all()
+    return len(user_ids), written
+
+
+def _rebuild_knn_batch(user_ids, limit):
+    """
+    Fonte 'knn' em lote: uma única agregação esparsa para o grupo inteiro, em vez
+    de uma por usuário. Devolve os usuários que ficaram sem lista (fora do treino)
+    para seguirem pelo caminho individual (fallback por gêneros).
+
+    :return: (recomendações gravadas, usuários restantes).
+    """
+    from .machineLern import recommend_movies_from_neighbours_batch
+
+    artifact = _knn_artifact()
+    if artifact is None:
+        return 0, user_ids
+
+    excluded = {}
+    for model in (WatchedMovie, LikeDislike):
+        queryset = model.objects.filter(user_id__in=user_ids)
+        if model is LikeDislike:
+            queryset = queryset.filter(action='dislike')
+        for user_id, movie_id in queryset.values_list('user_id', 'movie_id').iterator():
+            excluded.setdefault(user_id, set()).add(movie_id)
+
+    top_n = limit + max((len(movies) for movies in excluded.values()), default=0)
+    version = f'knn:{artifact.version}'
+    written = 0
+    remaining = []
+    for user_id, ranked in recommend_movies_from_neighbours_batch(user_ids, artifact, top_n=top_n).items():
+        seen = excluded.get(user_id, ())
+        rows = [(movie_id, score) for movie_id, score in ranked if movie_id not in seen][:limit]
+        if rows:
+            written += save_user_recommendations(user_id, rows, version)
+        else:
+            remaining.append(user_id)
+    return written, remaining
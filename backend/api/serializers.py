@@ -3,7 +3,10 @@ from django.contrib.auth.models import User
 from django.db import transaction
 from decimal import Decimal
 from .models import Genre, Movie, Rating, Preference, LikeDislike, WatchedMovie, FavoriteMovie
-from .utils import adjust_user_preferences
+from .counters import counter_buffer
+from .interactions import EVENT_TYPES, record_watch
+from .outbox import enqueue_interaction
+from .stats import like_action_deltas
 
 
 # Serializer para o modelo de usuário (User)
@@ -156,6 +159,14 @@ class PreferenceListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Preference
         fields = ['id', 'nome_genre', 'preference_type', 'priority', 'nome_user']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        buffer = counter_buffer()
+        if buffer is not None:
+            # Aplica os ajustes deste processo que ainda não foram gravados (api/counters.py)
+            data['priority'] = buffer.pending_priority(instance.user_id, instance.genre_id, instance.priority)
+        return data
     
 class WatchedMovieSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
@@ -167,23 +178,14 @@ class WatchedMovieSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'movie', 'watch_count']
 
     def save(self, **kwargs):
-        # Criação ou incremento do contador de assistências
-        instance, created = WatchedMovie.objects.get_or_create(
-            user=self.validated_data['user'],
-            movie=self.validated_data['movie'],
-            defaults={'watch_count': 1}
-        )
-        if not created:
-            instance.watch_count += 1
-            instance.save()
-
-        # Ajusta as preferências de gênero com base no filme assistido
-        adjust_user_preferences(
-            user=instance.user,
-            genres=instance.movie.genres.all(),
-            action="favorite",
-            weight=1
-        )
+        # Criação ou incremento do contador de assistências num único comando atômico
+        with transaction.atomic():
+            instance, created = record_watch(self.validated_data['user'].id, self.validated_data['movie'].id)
+
+            # Contadores e preferências de gênero ficam para o worker do outbox
+            enqueue_interaction(instance.user_id, instance.movie_id,
+                                stats={'watched': 1 if created else 0}, preference=('favorite', 1))
+        self.instance = instance
         return instance
     
 
@@ -198,18 +200,16 @@ class LikeDislikeSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'movie', 'action', 'created_at']
 
     def save(self, **kwargs):
-        instance = super().save(**kwargs)
-
-        # Ajusta as preferências de gênero com base na ação
-        weight = 1 if instance.action == "like" else -1
-        action = "favorite" if instance.action == "like" else "avoid"
-
-        adjust_user_preferences(
-            user=instance.user,
-            genres=instance.movie.genres.all(),
-            action=action,
-            weight=weight
-        )
+        previous_action = self.instance.action if self.instance else None
+        with transaction.atomic():
+            instance = super().save(**kwargs)
+
+            # Contadores e preferências de gênero com base na ação ficam para o worker do outbox
+            weight = 1 if instance.action == "like" else -1
+            action = "favorite" if instance.action == "like" else "avoid"
+            enqueue_interaction(instance.user_id, instance.movie_id,
+                                stats=like_action_deltas(previous_action, instance.action),
+                                preference=(action, weight))
         return instance
 
 class FavoriteMovieSerializer(serializers.ModelSerializer):
@@ -222,14 +222,31 @@ class FavoriteMovieSerializer(serializers.ModelSerializer):
         fields = ['user', 'movie', 'added_at']
 
     def save(self, **kwargs):
-        instance = super().save(**kwargs)
-
-        # Ajusta as preferências de gênero com base no filme favorito
-        adjust_user_preferences(
-            user=instance.user,
-            genres=instance.movie.genres.all(),
-            action='favorite',
-            weight=1
-        )
+        created = self.instance is None
+        with transaction.atomic():
+            instance = super().save(**kwargs)
+
+            # Contadores e preferências de gênero com base no filme favorito ficam para o worker do outbox
+            enqueue_interaction(instance.user_id, instance.movie_id,
+                                stats={'favorites': 1 if created else 0}, preference=('favorite', 1))
         return instance
 
+
+
+class InteractionEventSerializer(serializers.Serializer):
+    """
+    Um evento de /api/interactions/batch/: like, dislike, none, watched, favorite ou rating.
+    """
+    type = serializers.ChoiceField(choices=EVENT_TYPES)
+    movie_id = serializers.IntegerField(min_value=1)
+    rating = serializers.DecimalField(max_digits=3, decimal_places=1, required=False)
+
+    def validate(self, data):
+        if data['type'] == 'rating':
+            rating = data.get('rating')
+            if rating is None:
+                raise serializers.ValidationError({'rating': 'Obrigatório para eventos do tipo rating.'})
+            # Mesmas notas aceitas por Rating.rating: 1.0 a 5.0 em passos de 0.5
+            if rating < Decimal('1.0') or rating > Decimal('5.0') or rating * 2 % 1:
+                raise serializers.ValidationError({'rating': 'A avaliação deve estar entre 1.0 e 5.0, em passos de 0.5.'})
+        return data
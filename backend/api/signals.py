@@ -0,0 +1,116 @@
+# signals.py - receptores de sinais do app api
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .counters import counter_buffer
+from .events import log_event
+from .genre_index import peek_genre_index
+from .models import FavoriteMovie, Genre, LikeDislike, Movie, Preference, Rating, WatchedMovie
+from .recommendations import remove_user_recommendations, schedule_refresh
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def mark_movie_dirty(sender, instance, **kwargs):
+    """
+    Marca o filme para ser reconstruído no índice de gêneros deste processo.
+    """
+    index = peek_genre_index()
+    if index is not None:
+        index.mark_dirty([instance.pk])
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def mark_movie_genres_dirty(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Gêneros de um filme alterados (movie.genres.set/add/remove/clear ou genre.movies.*).
+    """
+    index = peek_genre_index()
+    if index is None or not action.startswith('post_'):
+        return
+    if not reverse:
+        index.mark_dirty([instance.pk])
+    elif pk_set:
+        index.mark_dirty(pk_set)
+    else:
+        # genre.movies.clear(): não sabemos quais filmes foram afetados
+        index.mark_stale()
+
+
+@receiver(post_delete, sender=Genre)
+def mark_genre_index_stale(sender, instance, **kwargs):
+    """
+    Remover um gênero apaga as relações em cascata, sem sinal m2m: reconstrói o índice.
+    """
+    index = peek_genre_index()
+    if index is not None:
+        index.mark_stale()
+
+
+@receiver(post_save, sender=WatchedMovie)
+@receiver(post_save, sender=LikeDislike)
+def remove_seen_recommendation(sender, instance, **kwargs):
+    """
+    Filme assistido ou descurtido sai da lista materializada na hora (na mesma
+    transação da escrita); o recálculo completo fica para segundo plano.
+    """
+    if sender is WatchedMovie or instance.action == 'dislike':
+        remove_user_recommendations(instance.user_id, [instance.movie_id])
+    schedule_refresh(instance.user_id)
+
+
+@receiver(post_delete, sender=WatchedMovie)
+@receiver(post_delete, sender=LikeDislike)
+@receiver(post_save, sender=FavoriteMovie)
+@receiver(post_delete, sender=FavoriteMovie)
+@receiver(post_save, sender=Preference)
+@receiver(post_delete, sender=Preference)
+def refresh_user_recommendations_on_change(sender, instance, **kwargs):
+    """
+    Interações ou preferências do usuário mudaram: recalcula a lista dele em segundo plano.
+    """
+    schedule_refresh(instance.user_id)
+
+
+@receiver(post_save, sender=WatchedMovie)
+@receiver(post_delete, sender=WatchedMovie)
+def forget_buffered_watch(sender, instance, **kwargs):
+    """
+    Linha de WatchedMovie gravada ou apagada fora de record_watch: o buffer de
+    contadores (modo 'buffered') esquece o watch_count que tinha guardado dela.
+    """
+    buffer = counter_buffer()
+    if buffer is not None:
+        buffer.forget_watch(instance.user_id, instance.movie_id)
+
+
+@receiver(post_save, sender=WatchedMovie)
+@receiver(post_save, sender=LikeDislike)
+@receiver(post_save, sender=FavoriteMovie)
+@receiver(post_save, sender=Rating)
+def log_interaction_event(sender, instance, created, **kwargs):
+    """
+    Acrescenta a interação ao histórico (InteractionEvent), na mesma transação.
+    Gravações diretas (record_watch, lote) chamam log_event(s) por conta própria.
+    """
+    if sender is WatchedMovie:
+        log_event(instance.user_id, instance.movie_id, 'watch')
+    elif sender is LikeDislike:
+        log_event(instance.user_id, instance.movie_id, instance.action)
+    elif sender is FavoriteMovie:
+        if created:
+            log_event(instance.user_id, instance.movie_id, 'favorite')
+    else:
+        log_event(instance.user_id, instance.movie_id, 'rating', instance.rating)
+
+
+# Tipo do evento gravado quando a interação é apagada
+DELETE_EVENTS = {WatchedMovie: 'unwatch', LikeDislike: 'none', FavoriteMovie: 'unfavorite', Rating: 'unrate'}
+
+
+@receiver(post_delete, sender=WatchedMovie)
+@receiver(post_delete, sender=LikeDislike)
+@receiver(post_delete, sender=FavoriteMovie)
+@receiver(post_delete, sender=Rating)
+def log_interaction_delete(sender, instance, **kwargs):
+    log_event(instance.user_id, instance.movie_id, DELETE_EVENTS[sender])
@@ -0,0 +1,147 @@
+# stats.py - manutenção da tabela desnormalizada MovieStats
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, Value, When
+
+from .counters import counter_buffer
+from .models import FavoriteMovie, LikeDislike, Movie, MovieStats, Rating, WatchedMovie
+
+STAT_FIELDS = ('likes', 'dislikes', 'favorites', 'watched', 'ratings_count', 'rating_sum')
+
+# Campo de MovieStats correspondente a cada ação de LikeDislike ('none' não conta)
+LIKE_ACTION_FIELDS = {'like': 'likes', 'dislike': 'dislikes'}
+
+
+def update_movie_stats(movie_id, **deltas):
+    """
+    Aplica incrementos (ou decrementos) nos contadores de um filme com um UPDATE
+    atômico (F()), sem ler a linha. Deve ser chamada dentro da mesma transação
+    que grava a interação.
+
+    Exemplo: update_movie_stats(movie.id, likes=1, dislikes=-1)
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    buffer = counter_buffer()
+    if buffer is not None:
+        # Write-behind: o incremento entra no buffer do processo após o commit (api/counters.py)
+        buffer.add_movie_stats(movie_id, deltas)
+        return
+
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if not MovieStats.objects.filter(movie_id=movie_id).update(**updates):
+        # Primeira interação com o filme: cria a linha (ignorando corrida) e aplica o incremento
+        MovieStats.objects.bulk_create([MovieStats(movie_id=movie_id)], ignore_conflicts=True)
+        MovieStats.objects.filter(movie_id=movie_id).update(**updates)
+
+
+def bulk_update_movie_stats(deltas):
+    """
+    Versão em lote de update_movie_stats: cria as linhas que faltam e aplica os
+    incrementos de todos os filmes com um UPDATE ... CASE por bloco de filmes.
+
+    :param deltas: Dicionário {movie_id: {campo: incremento}}.
+    """
+    deltas = {movie_id: {field: delta for field, delta in fields.items() if delta}
+              for movie_id, fields in deltas.items()}
+    movie_ids = sorted(movie_id for movie_id, fields in deltas.items() if fields)
+    if not movie_ids:
+        return
+
+    MovieStats.objects.bulk_create([MovieStats(movie_id=movie_id) for movie_id in movie_ids], ignore_conflicts=True)
+    # Em blocos, para não passar do limite de parâmetros por comando do banco
+    for start in range(0, len(movie_ids), 100):
+        chunk = movie_ids[start:start + 100]
+        updates = {}
+        for field in STAT_FIELDS:
+            whens = [When(movie_id=movie_id, then=Value(deltas[movie_id][field]))
+                     for movie_id in chunk if field in deltas[movie_id]]
+            if not whens:
+                continue
+            output_field = (MovieStats._meta.get_field(field).clone() if field == 'rating_sum'
+                            else IntegerField())
+            default = Value(Decimal('0') if field == 'rating_sum' else 0)
+            updates[field] = F(field) + Case(*whens, default=default, output_field=output_field)
+        MovieStats.objects.filter(movie_id__in=chunk).update(**updates)
+
+
+def like_action_deltas(old_action, new_action):
+    """
+    Retorna os incrementos de likes/dislikes para a troca de old_action para new_action.
+    """
+    deltas = {}
+    if old_action == new_action:
+        return deltas
+    if old_action in LIKE_ACTION_FIELDS:
+        deltas[LIKE_ACTION_FIELDS[old_action]] = -1
+    if new_action in LIKE_ACTION_FIELDS:
+        deltas[LIKE_ACTION_FIELDS[new_action]] = 1
+    return deltas
+
+
+def get_movie_stats(movie_ids):
+    """
+    Lê os contadores de vários filmes em uma única consulta.
+
+    :return: Dicionário {movie_id: MovieStats}. Filmes sem linha recebem uma instância zerada.
+    """
+    movie_ids = list(movie_ids)
+    stats = MovieStats.objects.in_bulk(movie_ids)
+    stats = {movie_id: stats.get(movie_id) or MovieStats(movie_id=movie_id) for movie_id in movie_ids}
+    buffer = counter_buffer()
+    if buffer is not None:
+        # Soma os incrementos ainda não gravados por este processo (o usuário vê o que acabou de fazer)
+        for movie_id, row in stats.items():
+            for field, delta in buffer.pending_movie_stats(movie_id).items():
+                setattr(row, field, getattr(row, field) + delta)
+    return stats
+
+
+def rebuild_movie_stats(batch_size=1000):
+    """
+    Recalcula MovieStats do zero a partir das tabelas de interação.
+
+    :return: Número de linhas gravadas.
+    """
+    totals = {}
+
+    def movie_totals(movie_id):
+        return totals.setdefault(movie_id, {field: 0 for field in STAT_FIELDS})
+
+    likes = (
+        LikeDislike.objects.values('movie_id')
+        .annotate(likes=Count('id', filter=Q(action='like')), dislikes=Count('id', filter=Q(action='dislike')))
+        .order_by()
+    )
+    for row in likes:
+        movie_totals(row['movie_id']).update(likes=row['likes'], dislikes=row['dislikes'])
+
+    for row in FavoriteMovie.objects.values('movie_id').annotate(total=Count('id')).order_by():
+        movie_totals(row['movie_id'])['favorites'] = row['total']
+
+    for row in WatchedMovie.objects.values('movie_id').annotate(total=Count('id')).order_by():
+        movie_totals(row['movie_id'])['watched'] = row['total']
+
+    ratings = Rating.objects.values('movie_id').annotate(total=Count('id'), rating_sum=Sum('rating')).order_by()
+    for row in ratings:
+        movie_totals(row['movie_id']).update(ratings_count=row['total'], rating_sum=row['rating_sum'] or Decimal('0'))
+
+    with transaction.atomic():
+        MovieStats.objects.all().delete()
+        rows = (
+            MovieStats(movie_id=movie_id, **totals.get(movie_id, {}))
+            for movie_id in Movie.objects.values_list('id', flat=True).order_by('id')
+        )
+        created = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                created += len(MovieStats.objects.bulk_create(batch))
+                batch = []
+        if batch:
+            created += len(MovieStats.objects.bulk_create(batch))
+    return created
@@ -1,3 +1,1771 @@
-from django.test import TestCase
+import base64
+import datetime
+import importlib.util
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from scipy import sparse
+from sklearn.neighbors import NearestNeighbors
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .aimovies import train_svd_artifacts
+from .als import ALSRecommender, top_k_batch, train_als, train_als_artifacts
+from .ann import RandomProjectionLSH
+from .catalog import MISSING_RELEASE_DATE, import_catalog
+from .events import EventCursor, log_event, log_events
+from .evaluation import (Engine, PopularityEngine, evaluate_engine, generate_events, relevant_items,
+                         temporal_split, write_dataset)
+from . import dashboard
+from .counters import CounterBuffer, get_counter_buffer
+from .content import build_tfidf_matrix, rebuild_movie_similarities, top_k_similar
+from .genre_index import GenreScoringIndex
+from .hybrid import CANDIDATE_SOURCES, hybrid_recommendations
+from .management.commands.benchmark_ann import synthetic_interactions
+from .machineLern import (DEFAULT_IMPLICIT_WEIGHTS, build_interaction_matrix, build_knn_model,
+                          recommend_movies_collaborative, recommend_movies_from_neighbours,
+                          recommend_movies_from_neighbours_batch, recommend_movies_user_based,
+                          recommend_movies_user_based_batch, train_knn_artifacts, update_interaction_matrix)
+from .model_store import ModelRegistry, ModelStore
+from .models import (DashboardSnapshot, EventCheckpoint, FavoriteMovie, Genre, GenreTrending, InteractionEvent, LikeDislike, Movie,
+                     MovieStats, MovieTrending, OutboxEvent, Preference, Rating, TrendingEpoch, UserRecommendation,
+                     UserRecommendationState, WatchedMovie)
+from .outbox import (HANDLERS, INTERACTION_EVENT, enqueue_interaction, handle_interaction, outbox_lag,
+                     process_batch, process_events, replay_exhausted, retry_delay)
+from .recommendations import refresh_user_recommendations
+from .serializers import PreferenceListSerializer
+from .trending import (apply_trending_deltas, clear_trending_cache, forward_weight, get_trending_movies,
+                       rating_value, rebase_trending, record_event)
+from .stats import STAT_FIELDS, bulk_update_movie_stats, get_movie_stats, like_action_deltas, rebuild_movie_stats
+from .utils import (adjust_user_preferences, bulk_adjust_preferences, get_bulk_interactions, get_movie_interactions,
+                    get_user_interactions, recommend_movies_by_genre_preferences)
+
+
+def create_interactions(n_users, n_movies, seed=0, per_user=12):
+    """
+    Usuários, filmes e interações aleatórias (avaliações, likes, favoritos e
+    assistências) com semente fixa; gravados com bulk_create, sem os sinais.
+    """
+    rng = random.Random(seed)
+    users = User.objects.bulk_create([User(username=f'user{index}') for index in range(n_users)])
+    movies = Movie.objects.bulk_create([
+        Movie(title=f'Filme {index}', description='', duration=90, release_date=datetime.date(2000, 1, 1))
+        for index in range(n_movies)
+    ])
+    ratings, likes, favorites, watched = [], [], [], []
+    for user in users:
+        for movie in rng.sample(movies, min(per_user, n_movies)):
+            if rng.random() < 0.6:
+                ratings.append(Rating(user=user, movie=movie, rating=rng.randint(2, 10) / 2))
+            if rng.random() < 0.4:
+                likes.append(LikeDislike(user=user, movie=movie, action=rng.choice(['like', 'dislike', 'none'])))
+            if rng.random() < 0.2:
+                favorites.append(FavoriteMovie(user=user, movie=movie))
+            if rng.random() < 0.5:
+                watched.append(WatchedMovie(user=user, movie=movie, watch_count=rng.randint(1, 3)))
+    Rating.objects.bulk_create(ratings)
+    LikeDislike.objects.bulk_create(likes)
+    FavoriteMovie.objects.bulk_create(favorites)
+    WatchedMovie.objects.bulk_create(watched)
+    return users, movies
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'])
+class WatchCountConcurrencyTest(TransactionTestCase):
+    """
+    Requests paralelos de "assistido" para o mesmo usuário e filme: o contador
+    final tem que ser exatamente o número de requests (nenhum incremento perdido).
+    """
+    threads = 8
+    requests_per_thread = 10
+
+    def setUp(self):
+        self.user = User.objects.create_user('viewer', 'viewer@example.com', 'senha')
+        self.movie = Movie.objects.create(title='Filme', description='Descrição',
+                                          release_date=datetime.date(2000, 1, 1), duration=90)
+
+    def test_parallel_mark_as_watched_counts_every_request(self):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+        errors = []
+
+        def watch():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                for _ in range(self.requests_per_thread):
+                    response = client.post('/api/watched_movies/mark_as_watched/',
+                                           {'movie_id': self.movie.id}, format='json')
+                    statuses.append(response.status_code)
+            except Exception as error:  # Falhas na thread não chegam ao runner do teste
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=watch) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        total = self.threads * self.requests_per_thread
+        self.assertEqual(errors, [])
+        self.assertEqual(len(statuses), total)
+        # Exatamente um request cria a linha (201); os demais incrementam (200)
+        self.assertEqual(statuses.count(201), 1)
+        self.assertEqual(statuses.count(200), total - 1)
+        self.assertEqual(WatchedMovie.objects.get(user=self.user, movie=self.movie).watch_count, total)
+
+    def test_increment_watch_count_returns_new_value(self):
+        watched = WatchedMovie.objects.create(user=self.user, movie=self.movie)
+        stale = WatchedMovie.objects.get(pk=watched.pk)
+
+        watched.increment_watch_count()
+        stale.increment_watch_count()  # Cópia desatualizada: a soma continua sendo feita pelo banco
+
+        self.assertEqual(watched.watch_count, 2)
+        self.assertEqual(stale.watch_count, 3)
+        self.assertEqual(WatchedMovie.objects.get(pk=watched.pk).watch_count, 3)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'])
+class OutboxTest(TestCase):
+    """
+    Outbox das interações (outbox.py): cada evento produz seus efeitos uma única vez,
+    a falha de um evento não deixa efeitos parciais e volta à fila só após o backoff.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('outbox', 'outbox@example.com', 'senha')
+        self.genre = Genre.objects.create(name='Drama')
+        self.movies = []
+        for index in range(2):
+            movie = Movie.objects.create(title=f'Filme {index}', description='', duration=90,
+                                         release_date=datetime.date(2000, 1, 1))
+            movie.genres.set([self.genre])
+            self.movies.append(movie)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def like(self, movie):
+        response = self.client.post('/api/like_dislike/like_dislike_action/',
+                                    {'movie_id': movie.id, 'action': 'like'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def likes(self, movie):
+        return MovieStats.objects.filter(movie=movie).values_list('likes', flat=True).first() or 0
+
+    def priority(self):
+        return Preference.objects.filter(user=self.user, genre=self.genre).values_list('priority', flat=True).first()
+
+    def test_each_event_is_applied_exactly_once(self):
+        self.like(self.movies[0])
+        event = OutboxEvent.objects.get()
+        self.assertEqual(self.likes(self.movies[0]), 0)  # Modo 'worker': nada aplicado no request
+
+        self.assertEqual(process_batch(), (1, 0))
+        self.assertEqual(process_batch(), (0, 0))
+        self.assertEqual(process_events([event.pk]), (0, 0))
+
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(event.attempts, 1)
+        self.assertEqual(self.likes(self.movies[0]), 1)
+        self.assertEqual(self.priority(), 1)
+
+    def test_failed_handler_is_rolled_back_and_retried_after_backoff(self):
+        broken, healthy = self.movies
+
+        def flaky(event):
+            handle_interaction(event)  # Efeitos gravados antes da falha têm que ser desfeitos
+            if event.payload['movie_id'] == broken.id:
+                raise RuntimeError('falha no handler')
+
+        failing = enqueue_interaction(self.user.id, broken.id, stats={'likes': 1}, preference=('favorite', 1))
+        enqueue_interaction(self.user.id, healthy.id, stats={'likes': 1})
+        with mock.patch.dict(HANDLERS, {INTERACTION_EVENT: flaky}), self.assertLogs('api.outbox', 'ERROR'):
+            self.assertEqual(process_batch(), (1, 1))
+            # O evento que falhou espera o backoff: não é pego de novo na hora
+            self.assertEqual(process_batch(), (0, 0))
+
+        self.assertEqual(self.likes(broken), 0)
+        self.assertIsNone(self.priority())
+        self.assertEqual(self.likes(healthy), 1)
+        failing.refresh_from_db()
+        self.assertIsNone(failing.processed_at)
+        self.assertEqual(failing.attempts, 1)
+        self.assertIn('RuntimeError: falha no handler', failing.last_error)
+        self.assertAlmostEqual((failing.next_attempt_at - timezone.now()).total_seconds(),
+                               retry_delay(1).total_seconds(), delta=2)
+
+        OutboxEvent.objects.filter(pk=failing.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(process_batch(), (1, 0))
+        self.assertEqual(self.likes(broken), 1)
+        self.assertEqual(self.priority(), 1)
+
+    @override_settings(OUTBOX_RETRY_BASE_SECONDS=5, OUTBOX_RETRY_MAX_SECONDS=60)
+    def test_retry_delay_doubles_up_to_the_ceiling(self):
+        self.assertEqual([retry_delay(attempts).total_seconds() for attempts in range(1, 6)], [5, 10, 20, 40, 60])
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BASE_SECONDS=0)
+    def test_exhausted_events_leave_the_queue_until_replayed(self):
+        event = enqueue_interaction(self.user.id, self.movies[0].id, stats={'likes': 1})
+        handler = mock.Mock(side_effect=RuntimeError('fora do ar'))
+        with mock.patch.dict(HANDLERS, {INTERACTION_EVENT: handler}), self.assertLogs('api.outbox', 'ERROR'):
+            self.assertEqual(process_batch(), (0, 1))
+            self.assertEqual(process_batch(), (0, 1))
+            self.assertEqual(process_batch(), (0, 0))
+        self.assertEqual(outbox_lag()['failed'], 1)
+
+        self.assertEqual(replay_exhausted([event.pk + 1]), 0)
+        self.assertEqual(replay_exhausted(), 1)
+        self.assertEqual(process_batch(), (1, 0))
+        self.assertEqual(self.likes(self.movies[0]), 1)
+        self.assertEqual(outbox_lag()['failed'], 0)
+
+    @override_settings(OUTBOX_MODE='sync')
+    def test_sync_mode_applies_the_effects_after_the_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.like(self.movies[0])
+            self.assertEqual(self.likes(self.movies[0]), 0)  # Só depois do commit
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNotNone(OutboxEvent.objects.get().processed_at)
+        self.assertEqual(self.likes(self.movies[0]), 1)
+        self.assertEqual(self.priority(), 1)
+        self.assertEqual(outbox_lag()['pending'], 0)
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=3)
+    def test_outbox_lag_counts_pending_retrying_and_exhausted_events(self):
+        self.assertEqual(outbox_lag(), {'pending': 0, 'retrying': 0, 'lag_seconds': 0.0, 'failed': 0})
+
+        now = timezone.now()
+        events = [enqueue_interaction(self.user.id, self.movies[0].id, stats={'likes': 1}) for _ in range(5)]
+        OutboxEvent.objects.filter(pk=events[0].pk).update(created_at=now - datetime.timedelta(seconds=120))
+        OutboxEvent.objects.filter(pk=events[1].pk).update(attempts=1, next_attempt_at=now + datetime.timedelta(minutes=5))
+        OutboxEvent.objects.filter(pk=events[2].pk).update(attempts=3, created_at=now - datetime.timedelta(hours=1))
+        OutboxEvent.objects.filter(pk=events[3].pk).update(processed_at=now, created_at=now - datetime.timedelta(hours=2))
+
+        lag = outbox_lag()
+        # Esgotados e processados não contam no atraso
+        self.assertEqual({key: lag[key] for key in ('pending', 'retrying', 'failed')},
+                         {'pending': 3, 'retrying': 1, 'failed': 1})
+        self.assertAlmostEqual(lag['lag_seconds'], 120, delta=5)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'])
+class InteractionBatchTest(TestCase):
+    """
+    /api/interactions/batch/: resultado por evento, eventos do mesmo filme aplicados
+    na ordem recebida, assistências somadas e eventos inválidos recusados um a um.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('batch', 'batch@example.com', 'senha')
+        self.movies = [Movie.objects.create(title=f'Filme {index}', description='', duration=90,
+                                            release_date=datetime.date(2000, 1, 1)) for index in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, events):
+        return self.client.post('/api/interactions/batch/', {'events': events}, format='json')
+
+    def test_mixed_batch_reports_each_event_and_keeps_the_order(self):
+        first, second, third = (movie.id for movie in self.movies)
+        # Estado anterior: like e assistência no primeiro filme, favorito e nota no segundo
+        response = self.post([{'type': 'like', 'movie_id': first}, {'type': 'watched', 'movie_id': first},
+                              {'type': 'favorite', 'movie_id': second},
+                              {'type': 'rating', 'movie_id': second, 'rating': '4.0'}])
+        self.assertEqual(response.status_code, 200)
+
+        response = self.post([
+            {'type': 'like', 'movie_id': first},
+            {'type': 'dislike', 'movie_id': first},
+            {'type': 'like', 'movie_id': second},
+            {'type': 'dislike', 'movie_id': second},
+            {'type': 'watched', 'movie_id': first},
+            {'type': 'watched', 'movie_id': third},
+            {'type': 'watched', 'movie_id': third},
+            {'type': 'favorite', 'movie_id': second},
+            {'type': 'favorite', 'movie_id': third},
+            {'type': 'favorite', 'movie_id': third},
+            {'type': 'rating', 'movie_id': second, 'rating': '4.0'},
+            {'type': 'rating', 'movie_id': third, 'rating': '3.5'},
+            {'type': 'rating', 'movie_id': third, 'rating': '4.5'},
+            {'type': 'rating', 'movie_id': third},
+            {'type': 'rating', 'movie_id': third, 'rating': '4.3'},
+            {'type': 'like', 'movie_id': 999999},
+            {'type': 'share', 'movie_id': first},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.data['data']
+        self.assertEqual([result['status'] for result in data['results']], [
+            'unchanged', 'updated', 'created', 'updated',
+            'updated', 'created', 'updated',
+            'unchanged', 'created', 'unchanged',
+            'unchanged', 'created', 'updated',
+            'error', 'error', 'error', 'error',
+        ])
+        self.assertEqual([result['index'] for result in data['results']], list(range(17)))
+        self.assertEqual((data['applied'], data['errors']), (13, 4))
+        self.assertEqual([set(result['errors']) for result in data['results'][13:]],
+                         [{'rating'}, {'rating'}, {'movie_id'}, {'type'}])
+
+        # Estado final: vale o último evento de cada filme; assistências somadas pelo banco
+        self.assertEqual(dict(LikeDislike.objects.filter(user=self.user).values_list('movie_id', 'action')),
+                         {first: 'dislike', second: 'dislike'})
+        self.assertEqual(dict(WatchedMovie.objects.filter(user=self.user).values_list('movie_id', 'watch_count')),
+                         {first: 2, third: 2})
+        self.assertEqual(sorted(FavoriteMovie.objects.filter(user=self.user).values_list('movie_id', flat=True)),
+                         [second, third])
+        self.assertEqual({movie_id: float(rating) for movie_id, rating in
+                          Rating.objects.filter(user=self.user).values_list('movie_id', 'rating')},
+                         {second: 4.0, third: 4.5})
+
+        # Contadores aplicados pelo outbox a partir dos dois lotes
+        process_batch()
+        stats = {row.movie_id: (row.likes, row.dislikes, row.watched, row.favorites, row.ratings_count,
+                                float(row.rating_sum)) for row in MovieStats.objects.all()}
+        self.assertEqual(stats[first], (0, 1, 1, 0, 0, 0.0))
+        self.assertEqual(stats[second], (0, 1, 0, 1, 1, 4.0))
+        self.assertEqual(stats[third], (0, 0, 1, 1, 1, 4.5))
+
+    def test_batch_without_valid_events_is_rejected(self):
+        response = self.post([{'type': 'like', 'movie_id': 999999}, {'type': 'rating', 'movie_id': self.movies[0].id}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.data['data']['results']], ['error', 'error'])
+        self.assertFalse(LikeDislike.objects.exists())
+        self.assertEqual(self.post([]).status_code, 400)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct')
+class GenreIndexParityTest(TestCase):
+    """
+    O índice em memória (genre_index.py) tem que devolver os mesmos filmes que o motor SQL.
+    """
+
+    def test_favorite_genre_with_zero_priority_is_candidate(self):
+        user = User.objects.create_user('fan', 'fan@example.com', 'senha')
+        zero, high = Genre.objects.create(name='Zero'), Genre.objects.create(name='Alta')
+        other = Genre.objects.create(name='Outro')
+        movies = {}
+        for name, genre in (('zero', zero), ('alta', high), ('outro', other)):
+            movies[name] = Movie.objects.create(title=name, description='', release_date=datetime.date(2000, 1, 1),
+                                                duration=90)
+            movies[name].genres.add(genre)
+        # Prioridade 0: um like seguido de dislike já leva a isso (bulk_adjust_preferences limita em 0)
+        Preference.objects.create(user=user, genre=zero, preference_type='favorite', priority=0)
+        Preference.objects.create(user=user, genre=high, preference_type='favorite', priority=3)
+
+        expected = list(recommend_movies_by_genre_preferences(user).values_list('id', flat=True))
+        ranked, total = GenreScoringIndex().load().recommend(user, k=10)
+
+        self.assertEqual(expected, [movies['alta'].id, movies['zero'].id])
+        self.assertEqual([movie_id for movie_id, _ in ranked], expected)
+        self.assertEqual(total, 2)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct')
+class GenrePreferenceScoringTest(TestCase):
+    """
+    recommend_movies_by_genre_preferences (pontuação no SQL) tem que repetir a pontuação
+    do antigo laço em Python de PersonalizedRecommendationsViewOrdeby.
+    """
+
+    def python_scores(self, user):
+        # Referência: 2 * prioridade por gênero favorito do filme, +3 se curtido
+        favorites = dict(Preference.objects.filter(user=user, preference_type='favorite')
+                         .values_list('genre_id', 'priority'))
+        watched = set(WatchedMovie.objects.filter(user=user).values_list('movie_id', flat=True))
+        actions = dict(LikeDislike.objects.filter(user=user).values_list('movie_id', 'action'))
+        scores = {}
+        for movie in Movie.objects.prefetch_related('genres'):
+            genre_ids = [genre.id for genre in movie.genres.all() if genre.id in favorites]
+            if not genre_ids or movie.id in watched or actions.get(movie.id) == 'dislike':
+                continue
+            scores[movie.id] = sum(2 * favorites[genre_id] for genre_id in genre_ids) \
+                + (3 if actions.get(movie.id) == 'like' else 0)
+        return scores
+
+    def test_sql_scores_match_the_python_scorer(self):
+        rng = random.Random(7)
+        genres = [Genre.objects.create(name=f'Gênero {index}') for index in range(6)]
+        movies = []
+        for index in range(40):
+            movie = Movie.objects.create(title=f'Filme {index}', description='', duration=90,
+                                         release_date=datetime.date(2000, 1, 1))
+            movie.genres.set(rng.sample(genres, rng.randint(1, 3)))
+            movies.append(movie)
+        users = [User.objects.create_user(f'user{index}', f'user{index}@example.com', 'senha') for index in range(2)]
+        for user in users:
+            for genre in rng.sample(genres, 4):
+                Preference.objects.create(user=user, genre=genre, priority=rng.randint(0, 5),
+                                          preference_type=rng.choice(['favorite', 'favorite', 'avoid']))
+            for movie in rng.sample(movies, 15):
+                kind = rng.choice(['like', 'dislike', 'none', 'watched'])
+                if kind == 'watched':
+                    WatchedMovie.objects.create(user=user, movie=movie)
+                else:
+                    LikeDislike.objects.create(user=user, movie=movie, action=kind)
+
+        for user in users:
+            with self.subTest(user=user.username):
+                expected = self.python_scores(user)
+                self.assertTrue(expected)
+                ranked = list(recommend_movies_by_genre_preferences(user).values_list('id', 'score'))
+                self.assertEqual(dict(ranked), expected)
+                self.assertEqual(ranked, sorted(expected.items(), key=lambda item: (-item[1], item[0])))
+
+
+class TfidfSmallCatalogueTest(TestCase):
+    """
+    Catálogos vazios ou minúsculos não podem derrubar o TF-IDF de "mais como este".
+    """
+
+    def test_empty_single_and_stopword_only_catalogues(self):
+        movie_ids, matrix = build_tfidf_matrix([])
+        self.assertEqual((len(movie_ids), matrix.shape), (0, (0, 0)))
+
+        movie_ids, matrix = build_tfidf_matrix([(1, 'Um filme de aventura')])
+        self.assertEqual(matrix.shape[0], 1)
+
+        movie_ids, matrix = build_tfidf_matrix([(1, 'de a o'), (2, 'o de')])
+        self.assertEqual(matrix.shape, (2, 0))
+        self.assertEqual([len(neighbours) for _, neighbours, _ in top_k_similar(matrix)], [0, 0])
+
+    def test_rebuild_on_empty_and_single_movie_catalogue(self):
+        self.assertEqual(rebuild_movie_similarities(), (0, 0))
+        Movie.objects.create(title='Sozinho', description='Único filme', release_date=datetime.date(2000, 1, 1),
+                             duration=90)
+        self.assertEqual(rebuild_movie_similarities(), (1, 0))
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   RECOMMENDATION_ENGINE='materialized', RECOMMENDATION_MATERIALIZED_SOURCE='genre',
+                   ALLOWED_HOSTS=['testserver'])
+class MaterializedRecommendationsTest(TransactionTestCase):
+    """
+    Listas materializadas (recommendations.py): leitura sem escrita para listas
+    vazias e recálculos concorrentes do mesmo usuário.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('novo', 'novo@example.com', 'senha')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_empty_list_is_computed_once_and_read_without_writes(self):
+        # Sem gêneros favoritos e sem filmes em alta: nenhum candidato
+        response = self.client.get('/api/movies/recomendado/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserRecommendationState.objects.get(user=self.user).size, 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/movies/recomendado/')
+        self.assertEqual(response.status_code, 200)
+        writes = [query['sql'] for query in queries
+                  if query['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, [])
+
+    def test_parallel_refreshes_of_one_user_do_not_collide(self):
+        genre = Genre.objects.create(name='Drama')
+        Preference.objects.create(user=self.user, genre=genre, preference_type='favorite', priority=3)
+        for index in range(5):
+            movie = Movie.objects.create(title=f'Filme {index}', description='', duration=90,
+                                         release_date=datetime.date(2000, 1, 1))
+            movie.genres.add(genre)
+
+        threads = 6
+        barrier = threading.Barrier(threads)
+        errors = []
+
+        def refresh():
+            try:
+                barrier.wait()
+                refresh_user_recommendations(self.user.id)
+            except Exception as error:  # Falhas na thread não chegam ao runner do teste
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=refresh) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        ranks = list(UserRecommendation.objects.filter(user=self.user).order_by('rank').values_list('rank', flat=True))
+        self.assertEqual(ranks, [1, 2, 3, 4, 5])
+        self.assertEqual(UserRecommendationState.objects.get(user=self.user).size, 5)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'])
+class HybridBudgetTest(TransactionTestCase):
+    """
+    Fontes que estouram o orçamento do request não podem continuar ocupando o pool.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('hibrido', 'hibrido@example.com', 'senha')
+
+    def test_slow_source_is_interrupted_at_the_deadline(self):
+        finished = threading.Event()
+
+        def slow_source(user_id, limit):
+            try:
+                with connection.cursor() as cursor:
+                    # Consulta longa (dezenas de segundos sem interrupção)
+                    cursor.execute('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c '
+                                   'WHERE x < 1000000000) SELECT count(*) FROM c')
+                return []
+            finally:
+                finished.set()
+
+        with mock.patch.dict(CANDIDATE_SOURCES, {'genre': slow_source}):
+            _, sources = hybrid_recommendations(self.user.id, weights={'genre': 1.0}, budget=0.2)
+            # A thread do pool é liberada logo depois do prazo, não quando a consulta terminaria
+            self.assertTrue(finished.wait(2))
+        self.assertEqual(sources['genre']['status'], 'timeout')
+
+    def test_non_finite_weights_and_budget_are_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for query in ('weights=genre:nan', 'weights=content:inf', 'budget_ms=nan'):
+            response = client.get(f'/api/movies/recomendado/hybrid/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+class SVDTrainingTest(TestCase):
+    """
+    train_svd_artifacts com os dois backends: os parâmetros têm que ficar na
+    ordem dos índices compactos (user_ids/movie_ids), não na ordem interna do backend.
+    """
+
+    def train(self, backend):
+        # Dois grupos de usuários com gostos opostos; linhas embaralhadas para a ordem de
+        # aparição (ids internos do surprise) não coincidir com os índices compactos
+        rows = [(user, movie, 5 if (user % 2) == (movie < 5) else 1) for user in range(1, 21) for movie in range(10)]
+        random.Random(0).shuffle(rows)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('userId,movieId,rating\n')
+            csv_file.writelines(f'{user},{movie},{rating}\n' for user, movie, rating in rows)
+        self.addCleanup(os.remove, csv_file.name)
+
+        arrays, metadata = train_svd_artifacts(ratings_csv=csv_file.name, factors=4, epochs=200, lr=0.05,
+                                               reg=0.01, batch_size=8, backend=backend)
+        user_index = {user_id: row for row, user_id in enumerate(arrays['user_ids'])}
+        movie_index = {movie_id: col for col, movie_id in enumerate(arrays['movie_ids'])}
+        errors = []
+        for user, movie, rating in rows:
+            u, m = user_index[user], movie_index[movie]
+            prediction = (metadata['global_mean'] + arrays['user_bias'][u] + arrays['item_bias'][m]
+                          + arrays['user_factors'][u] @ arrays['item_factors'][m])
+            errors.append((prediction - rating) ** 2)
+        self.assertEqual(metadata['backend'], backend)
+        # Parâmetros trocados de usuário/filme dariam erro da ordem do desvio das notas (2)
+        self.assertLess(float(np.sqrt(np.mean(errors))), 0.5)
+
+    def test_numpy_backend(self):
+        self.train('numpy')
+
+    @skipUnless(importlib.util.find_spec('surprise'), 'scikit-surprise não instalado')
+    def test_surprise_backend(self):
+        self.train('surprise')
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   TRENDING_HALF_LIFE_HOURS=1)
+class TrendingEpochTest(TestCase):
+    """
+    Época do "forward decay" (trending.py): pontuações longe da época não podem
+    estourar o float, e o rebase mantém a tendência atual.
+    """
+
+    def setUp(self):
+        self.movies = [Movie.objects.create(title=f'Filme {index}', description='', duration=90,
+                                            release_date=datetime.date(2000, 1, 1)) for index in range(2)]
+        clear_trending_cache()
+        self.addCleanup(clear_trending_cache)  # O cache de leitura é do processo: não vaza para outros testes
+
+    def set_epoch(self, epoch):
+        TrendingEpoch.objects.update_or_create(key='trending', defaults={'epoch': epoch})
+
+    def test_event_far_from_the_epoch_rebases_instead_of_overflowing(self):
+        # Com meia-vida de 1h, exp(λ * (agora - 2024-01-01)) estoura o float
+        self.set_epoch(datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc))
+        record_event(self.movies[0].id, 'like')
+        record_event(self.movies[1].id, 'favorite')
+
+        epoch = TrendingEpoch.objects.get(key='trending').epoch
+        self.assertLess((timezone.now() - epoch).total_seconds(), 60)
+        trending = get_trending_movies()
+        self.assertEqual([movie_id for movie_id, _ in trending], [self.movies[1].id, self.movies[0].id])
+        self.assertAlmostEqual(trending[0][1], 2.0, places=2)
+
+    def test_rebase_keeps_current_trend_and_rescales_stale_deltas(self):
+        old_epoch = timezone.now() - datetime.timedelta(hours=10)
+        self.set_epoch(old_epoch)
+        record_event(self.movies[0].id, 'like')
+        self.assertAlmostEqual(MovieTrending.objects.get(movie=self.movies[0]).score, 2 ** 10, delta=1)
+        before = get_trending_movies()
+
+        rebase_trending()
+        clear_trending_cache()
+        self.assertAlmostEqual(MovieTrending.objects.get(movie=self.movies[0]).score, 1.0, places=2)
+        self.assertAlmostEqual(get_trending_movies()[0][1], before[0][1], places=2)
+
+        # Incremento calculado com a época antiga (ex.: pendente no buffer) é reescalado
+        apply_trending_deltas({self.movies[1].id: 2.0 * forward_weight(epoch=old_epoch)}, old_epoch)
+        self.assertAlmostEqual(MovieTrending.objects.get(movie=self.movies[1]).score, 2.0, places=2)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'])
+class TrendingTransitionTest(TestCase):
+    """
+    Tendência pelo outbox: só mudanças reais de estado contam; remoções e trocas
+    de like para dislike descontam o peso anterior.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='tendencia')
+        self.genre = Genre.objects.create(name='Suspense')
+        self.movie = Movie.objects.create(title='Filme', description='', duration=90,
+                                          release_date=datetime.date(2000, 1, 1))
+        self.movie.genres.set([self.genre])
+        # Época = agora: os fatores ficam ~1 e a pontuação é a soma dos pesos
+        TrendingEpoch.objects.update_or_create(key='trending', defaults={'epoch': timezone.now()})
+        clear_trending_cache()
+        self.addCleanup(clear_trending_cache)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def score(self):
+        process_batch()
+        movie = MovieTrending.objects.filter(movie=self.movie).values_list('score', flat=True).first() or 0.0
+        genre = GenreTrending.objects.filter(genre=self.genre).values_list('score', flat=True).first() or 0.0
+        self.assertAlmostEqual(movie, genre, places=6)
+        return movie
+
+    def like(self, action):
+        response = self.client.post('/api/like_dislike/like_dislike_action/',
+                                    {'movie_id': self.movie.id, 'action': action}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_repeated_like_is_counted_once(self):
+        self.like('like')
+        self.like('like')
+        self.assertAlmostEqual(self.score(), 1.0, places=3)
+        self.like('like')
+        self.assertAlmostEqual(self.score(), 1.0, places=3)
+
+    def test_flip_and_removal_subtract_the_previous_action(self):
+        self.like('like')
+        self.like('dislike')
+        self.assertAlmostEqual(self.score(), -0.5, places=3)
+        self.like('none')
+        self.assertAlmostEqual(self.score(), 0.0, places=3)
+
+        self.like('like')
+        row = LikeDislike.objects.get(user=self.user, movie=self.movie)
+        self.assertEqual(self.client.delete(f'/api/like_dislike/{row.pk}/').status_code, 204)
+        self.assertAlmostEqual(self.score(), 0.0, places=3)
+
+    def test_favorite_and_rating_follow_the_stored_state(self):
+        self.client.post('/api/favorite_movies/favorite_movie_action/', {'movie_id': self.movie.id}, format='json')
+        self.client.post('/api/favorite_movies/favorite_movie_action/', {'movie_id': self.movie.id}, format='json')
+        self.assertAlmostEqual(self.score(), 2.0, places=3)
+        favorite = FavoriteMovie.objects.get(user=self.user, movie=self.movie)
+        self.assertEqual(self.client.delete(f'/api/favorite_movies/{favorite.pk}/').status_code, 204)
+        self.assertAlmostEqual(self.score(), 0.0, places=3)
+
+        for rating in (5, 5, 1):
+            response = self.client.post('/api/ratings/create/', {'movie': self.movie.id, 'rating': rating},
+                                        format='json')
+            self.assertIn(response.status_code, (200, 201))
+        self.assertAlmostEqual(self.score(), rating_value(1), places=3)
+
+    def test_batch_applies_transitions_in_order(self):
+        response = self.client.post('/api/interactions/batch/', {'events': [
+            {'type': 'like', 'movie_id': self.movie.id},
+            {'type': 'like', 'movie_id': self.movie.id},
+            {'type': 'dislike', 'movie_id': self.movie.id},
+            {'type': 'favorite', 'movie_id': self.movie.id},
+            {'type': 'favorite', 'movie_id': self.movie.id},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertAlmostEqual(self.score(), -0.5 + 2.0, places=3)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct')
+class PreferenceAdjustmentTest(TestCase):
+    """
+    bulk_adjust_preferences: prioridade limitada a 0..5 pelo próprio banco, tanto no
+    upsert (PostgreSQL/SQLite) quanto no caminho genérico (bulk_create + UPDATE com F()).
+    """
+    # Banco sem ON CONFLICT: só a escolha do caminho em utils vê o "outro" banco; o ORM segue no SQLite
+    backends = {'upsert': None, 'fallback': mock.Mock(vendor='other')}
+
+    def setUp(self):
+        self.user = User.objects.create_user('fan', 'fan@example.com', 'senha')
+        self.genres = [Genre.objects.create(name=f'Gênero {index}') for index in range(2)]
+
+    def priorities(self):
+        return {preference.genre_id: (preference.preference_type, preference.priority)
+                for preference in Preference.objects.filter(user=self.user)}
+
+    def run_on_each_backend(self, check):
+        for backend, fake_connection in self.backends.items():
+            with self.subTest(backend=backend), \
+                    mock.patch('api.utils.connection', fake_connection or connection):
+                Preference.objects.filter(user=self.user).delete()
+                check()
+
+    def test_priority_is_clamped_at_five_and_zero(self):
+        genre = self.genres[0]
+
+        def check():
+            bulk_adjust_preferences(self.user.id, [genre.id], 3)
+            bulk_adjust_preferences(self.user.id, [genre.id], 3)
+            self.assertEqual(self.priorities()[genre.id][1], 5)
+            bulk_adjust_preferences(self.user.id, [genre.id], -4)
+            bulk_adjust_preferences(self.user.id, [genre.id], -4)
+            self.assertEqual(self.priorities()[genre.id][1], 0)
+            bulk_adjust_preferences(self.user.id, [genre.id], -1)
+            self.assertEqual(self.priorities()[genre.id][1], 0)
+
+        self.run_on_each_backend(check)
+
+    def test_avoid_lowers_an_existing_favorite(self):
+        genre = self.genres[0]
+
+        def check():
+            Preference.objects.create(user=self.user, genre=genre, preference_type='favorite', priority=3)
+            adjust_user_preferences(self.user, [genre], 'avoid', 1)
+            # O tipo da linha existente não muda; só a prioridade cai
+            self.assertEqual(self.priorities()[genre.id], ('favorite', 2))
+
+        self.run_on_each_backend(check)
+
+    def test_new_rows_take_their_type_from_the_sign_of_delta(self):
+        favorite, avoided = self.genres
+
+        def check():
+            bulk_adjust_preferences(self.user.id, [favorite.id], 1)
+            bulk_adjust_preferences(self.user.id, [avoided.id], -1)
+            self.assertEqual(self.priorities(), {favorite.id: ('favorite', 1), avoided.id: ('avoid', 0)})
+
+        self.run_on_each_backend(check)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='sync', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'])
+class LikePreferenceConcurrencyTest(TransactionTestCase):
+    """
+    Likes paralelos do mesmo usuário em filmes que dividem um gênero: cada like soma
+    1 ao gênero comum, sem incrementos perdidos (a soma é feita pelo banco).
+    """
+    threads = 4  # Abaixo do teto de 5: o total final mostra se algum incremento se perdeu
+
+    def setUp(self):
+        self.user = User.objects.create_user('liker', 'liker@example.com', 'senha')
+        self.common = Genre.objects.create(name='Comum')
+        self.movies = []
+        self.own_genres = []
+        for index in range(self.threads):
+            genre = Genre.objects.create(name=f'Gênero {index}')
+            movie = Movie.objects.create(title=f'Filme {index}', description='', duration=90,
+                                         release_date=datetime.date(2000, 1, 1))
+            movie.genres.set([self.common, genre])
+            self.movies.append(movie)
+            self.own_genres.append(genre)
+
+    def test_parallel_likes_do_not_lose_preference_increments(self):
+        barrier = threading.Barrier(self.threads)
+        statuses = []
+        errors = []
+
+        def like(movie):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            try:
+                barrier.wait()
+                response = client.post('/api/like_dislike/like_dislike_action/',
+                                       {'movie_id': movie.id, 'action': 'like'}, format='json')
+                statuses.append(response.status_code)
+            except Exception as error:  # Falhas na thread não chegam ao runner do teste
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=like, args=(movie,)) for movie in self.movies]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(statuses, [200] * self.threads)
+        priorities = dict(Preference.objects.filter(user=self.user).values_list('genre_id', 'priority'))
+        self.assertEqual(priorities.pop(self.common.id), self.threads)
+        self.assertEqual(priorities, {genre.id: 1 for genre in self.own_genres})
+
+
+class CatalogImportTest(TestCase):
+    """
+    Importação em lote (catalog.py): reimportar o mesmo CSV não regrava nada, e só os
+    filmes cujo gênero mudou têm as relações filme-gênero substituídas.
+    """
+    header = 'id,title,overview,release_date,runtime,poster_path,genres\n'
+    drama = "[{'id': 18, 'name': 'Drama'}]"
+    comedy = "[{'id': 35, 'name': 'Comedy'}]"
+
+    def write_csv(self, lines):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8')
+        self.addCleanup(os.remove, handle.name)
+        with handle:
+            handle.write(self.header + ''.join(f'{line}\n' for line in lines))
+        return handle.name
+
+    def movie_lines(self, second_genres):
+        return [
+            f'1,Primeiro,Texto,1999-05-01,120,/a.jpg,"{self.drama}"',
+            f'2,Segundo,Texto,,95,/b.jpg,"{second_genres}"',
+        ]
+
+    def link_writes(self, queries):
+        table = Movie.genres.through._meta.db_table
+        return [query['sql'] for query in queries
+                if table in query['sql'] and query['sql'].lstrip().upper().startswith(('INSERT', 'DELETE'))]
+
+    def test_reimport_only_rewrites_changed_movies(self):
+        totals = import_catalog(self.write_csv(self.movie_lines(self.drama)))
+        self.assertEqual((totals['created'], totals['updated']), (2, 0))
+        second = Movie.objects.get(external_id=2)
+        # Data ausente: valor fixo, não a data da importação
+        self.assertEqual(second.release_date, MISSING_RELEASE_DATE)
+
+        with CaptureQueriesContext(connection) as queries:
+            totals = import_catalog(self.write_csv(self.movie_lines(self.drama)))
+        self.assertEqual((totals['created'], totals['updated']), (0, 0))
+        self.assertEqual(self.link_writes(queries), [])
+
+        first_links = list(Movie.genres.through.objects.filter(movie__external_id=1).values_list('id', flat=True))
+        totals = import_catalog(self.write_csv(self.movie_lines(self.comedy)))
+        self.assertEqual((totals['created'], totals['updated']), (0, 1))
+        self.assertEqual(list(second.genres.values_list('name', flat=True)), ['Comedy'])
+        # As relações do filme sem mudança continuam as mesmas linhas
+        self.assertEqual(list(Movie.genres.through.objects.filter(movie__external_id=1).values_list('id', flat=True)),
+                         first_links)
+
+
+class InteractionMatrixTest(TestCase):
+    """
+    build_interaction_matrix (CSR montada em blocos) contra uma matriz densa de referência.
+    """
+
+    def setUp(self):
+        self.users, self.movies = create_interactions(8, 15, seed=3)
+
+    def dense_reference(self, weights, use_watch_count):
+        cells = {}
+
+        def add(user_id, movie_id, value):
+            cells[user_id, movie_id] = cells.get((user_id, movie_id), 0.0) + value
+
+        for user_id, movie_id, rating in Rating.objects.values_list('user_id', 'movie_id', 'rating'):
+            add(user_id, movie_id, float(rating))
+        for user_id, movie_id, action in LikeDislike.objects.values_list('user_id', 'movie_id', 'action'):
+            if action != 'none':
+                add(user_id, movie_id, weights[action])
+        for user_id, movie_id in FavoriteMovie.objects.values_list('user_id', 'movie_id'):
+            add(user_id, movie_id, weights['favorite'])
+        for user_id, movie_id, count in WatchedMovie.objects.values_list('user_id', 'movie_id', 'watch_count'):
+            add(user_id, movie_id, weights['watched'] * (count if use_watch_count else 1))
+        user_ids = sorted({user_id for user_id, _ in cells})
+        movie_ids = sorted({movie_id for _, movie_id in cells})
+        dense = np.zeros((len(user_ids), len(movie_ids)))
+        for (user_id, movie_id), value in cells.items():
+            dense[user_ids.index(user_id), movie_ids.index(movie_id)] = value
+        return dense, user_ids, movie_ids
+
+    def test_csr_matrix_matches_a_dense_reference(self):
+        for use_watch_count in (False, True):
+            with self.subTest(use_watch_count=use_watch_count):
+                # Blocos pequenos: as linhas de cada tabela chegam em vários pedaços
+                interactions = build_interaction_matrix(chunk_size=7, implicit_weights=DEFAULT_IMPLICIT_WEIGHTS,
+                                                        use_watch_count=use_watch_count)
+                dense, user_ids, movie_ids = self.dense_reference(DEFAULT_IMPLICIT_WEIGHTS, use_watch_count)
+                self.assertEqual(interactions.user_ids.tolist(), user_ids)
+                self.assertEqual(interactions.movie_ids.tolist(), movie_ids)
+                np.testing.assert_allclose(interactions.matrix.toarray(), dense, rtol=1e-6)
+
+    def test_ratings_only_and_empty_tables(self):
+        interactions = build_interaction_matrix()
+        ratings = {(user_id, movie_id): float(rating)
+                   for user_id, movie_id, rating in Rating.objects.values_list('user_id', 'movie_id', 'rating')}
+        coo = interactions.matrix.tocoo()
+        self.assertEqual({(int(interactions.user_ids[row]), int(interactions.movie_ids[col])): float(value)
+                          for row, col, value in zip(coo.row, coo.col, coo.data)}, ratings)
+
+        Rating.objects.all().delete()
+        self.assertEqual(build_interaction_matrix().shape, (0, 0))
+
+    def test_partial_update_matches_a_full_rebuild(self):
+        interactions = build_interaction_matrix(implicit_weights=DEFAULT_IMPLICIT_WEIGHTS)
+        changed = self.users[:2]
+        Rating.objects.filter(user=changed[0]).delete()
+        newcomer = User.objects.create(username='novo')
+        movie = Movie.objects.create(title='Novo', description='', duration=90, release_date=datetime.date(2000, 1, 1))
+        Rating.objects.bulk_create([Rating(user=newcomer, movie=movie, rating=4),
+                                    Rating(user=changed[1], movie=movie, rating=2)])
+
+        updated, _ = update_interaction_matrix(interactions, [user.id for user in changed] + [newcomer.id],
+                                               implicit_weights=DEFAULT_IMPLICIT_WEIGHTS)
+        full = build_interaction_matrix(implicit_weights=DEFAULT_IMPLICIT_WEIGHTS)
+        self.assertEqual(updated.user_ids.tolist(), full.user_ids.tolist())
+        self.assertEqual(updated.movie_ids.tolist(), full.movie_ids.tolist())
+        np.testing.assert_allclose(updated.matrix.toarray(), full.matrix.toarray(), rtol=1e-6)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'])
+class MovieKeysetPaginationTest(TestCase):
+    """
+    Paginação por cursor de /api/movies/: ida e volta pelos cursores sem pular nem
+    repetir filmes, mesmo com valores repetidos no campo de ordenação (desempate por id).
+    """
+    orderings = ['id', '-id', 'title', '-title', 'release_date', '-release_date', 'created_at', '-created_at']
+
+    def setUp(self):
+        self.user = User.objects.create(username='leitor')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for index in range(11):
+            # Títulos, datas e created_at repetidos em grupos de 3
+            movie = Movie.objects.create(title=f'Filme {index // 3}', slug=f'filme-{index}', description='',
+                                         duration=90, release_date=datetime.date(2000, 1, 1 + index // 3))
+            Movie.objects.filter(pk=movie.pk).update(
+                created_at=datetime.datetime(2024, 1, 1 + index // 3, tzinfo=datetime.timezone.utc))
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_round_trip_through_next_and_previous_cursors(self):
+        for ordering in self.orderings:
+            with self.subTest(ordering=ordering):
+                field = ordering.lstrip('-')
+                order_by = [ordering] if field == 'id' else [ordering, ordering.replace(field, 'id')]
+                expected = list(Movie.objects.order_by(*order_by).values_list('id', flat=True))
+
+                page = self.get(f'/api/movies/?pagination=cursor&page_size=3&ordering={ordering}')
+                self.assertIsNone(page['previous'])
+                pages = [[movie['id'] for movie in page['results']]]
+                while page['next']:
+                    page = self.get(page['next'])
+                    pages.append([movie['id'] for movie in page['results']])
+                self.assertEqual([movie_id for ids in pages for movie_id in ids], expected)
+                self.assertEqual([len(ids) for ids in pages], [3, 3, 3, 2])
+
+                # De volta, pelas mesmas páginas
+                for ids in reversed(pages[:-1]):
+                    page = self.get(page['previous'])
+                    self.assertEqual([movie['id'] for movie in page['results']], ids)
+                self.assertIsNone(page['previous'])
+
+    def test_unknown_ordering_falls_back_to_the_default(self):
+        page = self.get('/api/movies/?pagination=cursor&page_size=20&ordering=password')
+        expected = list(Movie.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual([movie['id'] for movie in page['results']], expected)
+
+    def test_malformed_or_tampered_cursor_returns_400(self):
+        def encode(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        cursors = [
+            'não-é-base64!',
+            base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+            encode(['lista']),
+            encode({'o': 'title', 'v': 'Filme 1'}),
+            encode({'o': 5, 'v': 'Filme 1', 'id': 1, 'r': False}),
+            encode({'o': 'password', 'v': 'x', 'id': 1, 'r': False}),
+            encode({'o': 'title', 'v': 'Filme 1', 'id': 'x', 'r': False}),
+            encode({'o': 'title', 'v': None, 'id': 1, 'r': False}),
+            encode({'o': 'release_date', 'v': 'ontem', 'id': 1, 'r': False}),
+            encode({'o': '-created_at', 'v': [1, 2], 'id': 1, 'r': False}),
+            encode({'o': 'id', 'v': '1', 'id': 10 ** 30, 'r': False}),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/movies/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(COUNTER_BUFFER_MODE='direct')
+class BulkInteractionsTest(TestCase):
+    """
+    get_bulk_interactions (página inteira em poucas consultas) contra as funções por filme.
+    """
+
+    def test_bulk_interactions_match_the_per_movie_flags(self):
+        users, movies = create_interactions(4, 12, seed=5, per_user=8)
+        rebuild_movie_stats()
+        quiet = Movie.objects.create(title='Sem interações', description='', duration=90,
+                                     release_date=datetime.date(2000, 1, 1))
+        movies = movies + [quiet]
+
+        for user in users:
+            with self.subTest(user=user.username):
+                with CaptureQueriesContext(connection) as queries:
+                    bulk = get_bulk_interactions([movie.id for movie in movies], user)
+                # MovieStats + uma consulta por tabela de interação, qualquer que seja o tamanho da página
+                self.assertLessEqual(len(queries), 4)
+                for movie in movies:
+                    expected = dict(get_movie_interactions(movie), user_interactions=get_user_interactions(movie, user))
+                    self.assertEqual(bulk[movie.id], expected)
+
+        self.assertEqual(get_bulk_interactions([], users[0]), {})
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='sync', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'])
+class MovieStatsConsistencyTest(TestCase):
+    """
+    Contadores incrementais de MovieStats (stats.py) têm que bater com rebuild_movie_stats,
+    que recalcula tudo a partir das tabelas de interação.
+    """
+
+    def setUp(self):
+        self.users = [User.objects.create(username=f'user{index}') for index in range(2)]
+        self.movies = [Movie.objects.create(title=f'Filme {index}', description='', duration=90,
+                                            release_date=datetime.date(2000, 1, 1)) for index in range(2)]
+
+    def snapshot(self):
+        return {row['movie_id']: tuple(row[field] for field in STAT_FIELDS)
+                for row in MovieStats.objects.values('movie_id', *STAT_FIELDS)}
+
+    def assert_matches_rebuild(self):
+        incremental = self.snapshot()
+        rebuild_movie_stats()
+        rebuilt = self.snapshot()
+        # rebuild grava uma linha por filme; o incremental só para filmes com interação
+        for movie_id, values in rebuilt.items():
+            self.assertEqual(incremental.get(movie_id, tuple(Decimal(0) if field == 'rating_sum' else 0
+                                                             for field in STAT_FIELDS)),
+                             values, movie_id)
+
+    def request(self, user, method, url, data=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.data)
+        return response
+
+    def test_api_sequence_matches_rebuild(self):
+        first, second = self.users
+        movie, other = self.movies
+        for user, actions in ((first, ['like', 'dislike', 'none', 'like']), (second, ['like', 'dislike'])):
+            for action in actions:
+                self.request(user, 'post', '/api/like_dislike/like_dislike_action/',
+                             {'movie_id': movie.id, 'action': action})
+        self.request(first, 'delete', f'/api/like_dislike/{LikeDislike.objects.get(user=first).pk}/')
+
+        self.request(first, 'post', '/api/favorite_movies/favorite_movie_action/', {'movie_id': other.id})
+        self.request(second, 'post', '/api/favorite_movies/favorite_movie_action/', {'movie_id': other.id})
+        self.request(first, 'delete', f'/api/favorite_movies/{FavoriteMovie.objects.get(user=first).pk}/')
+
+        for user in (first, first, second):
+            self.request(user, 'post', '/api/watched_movies/mark_as_watched/', {'movie_id': movie.id})
+        self.request(first, 'delete', f'/api/watched_movies/{WatchedMovie.objects.get(user=first).pk}/')
+
+        self.request(first, 'post', '/api/ratings/create/', {'movie': other.id, 'rating': '4.0'})
+        self.request(first, 'post', '/api/ratings/create/', {'movie': other.id, 'rating': '2.5'})
+        self.request(second, 'post', '/api/ratings/create/', {'movie': other.id, 'rating': '5.0'})
+
+        self.assertEqual(self.snapshot()[movie.id][:4], (0, 1, 0, 1))
+        self.assertEqual(self.snapshot()[other.id][2:], (1, 0, 2, Decimal('7.5')))
+        self.assert_matches_rebuild()
+
+    def test_bulk_deltas_from_random_transitions_match_rebuild(self):
+        rng = random.Random(11)
+        state = {}
+        for _ in range(60):
+            user, movie = rng.choice(self.users), rng.choice(self.movies)
+            previous = state.get((user.id, movie.id))
+            action = rng.choice(['like', 'dislike', 'none', 'delete'])
+            if action == 'delete':
+                if previous is None:
+                    continue
+                LikeDislike.objects.filter(user=user, movie=movie).delete()
+                deltas, state[user.id, movie.id] = like_action_deltas(previous, None), None
+            else:
+                LikeDislike.objects.update_or_create(user=user, movie=movie, defaults={'action': action})
+                deltas, state[user.id, movie.id] = like_action_deltas(previous, action), action
+            bulk_update_movie_stats({movie.id: deltas})
+        self.assert_matches_rebuild()
+
+
+class ModelStoreTest(SimpleTestCase):
+    """
+    ModelStore/ModelRegistry (model_store.py): versões gravadas por inteiro e troca
+    atômica do CURRENT, sem leitor ver uma versão pela metade.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ModelStore(directory.name)
+
+    def save(self, value, **kwargs):
+        return self.store.save('knn', {'a': np.full(1000, value), 'b': np.full((10, 10), value)},
+                               metadata={'value': value}, **kwargs)
+
+    def test_save_and_load_round_trip(self):
+        self.assertIsNone(self.store.load('knn'))
+        first = self.save(1)
+        second = self.save(2, activate=False)
+
+        self.assertEqual(self.store.versions('knn'), sorted([first, second]))
+        self.assertEqual(self.store.current_version('knn'), first)
+        artifact = self.store.load('knn')
+        self.assertEqual((artifact.version, artifact.metadata), (first, {'value': 1}))
+        np.testing.assert_array_equal(artifact['b'], np.full((10, 10), 1))
+        self.assertFalse(artifact['a'].flags.writeable)  # memmap somente leitura
+        self.assertEqual(artifact.size_bytes, artifact['a'].nbytes + artifact['b'].nbytes)
+
+        self.store.activate('knn', second)
+        self.assertEqual(self.store.load('knn').metadata, {'value': 2})
+        with self.assertRaises(FileNotFoundError):
+            self.store.activate('knn', 'inexistente')
+
+    def test_current_swap_survives_concurrent_readers(self):
+        self.save(0)
+        stop = threading.Event()
+        errors = []
+        loads = []
+
+        def read():
+            try:
+                while not stop.is_set():
+                    artifact = self.store.load('knn')
+                    value = artifact.metadata['value']
+                    # Manifesto e arrays de uma mesma versão, sempre completos
+                    if not (np.all(artifact['a'] == value) and np.all(artifact['b'] == value)):
+                        errors.append(f'versão {artifact.version} misturada')
+                    loads.append(value)
+            except Exception as error:  # Falhas na thread não chegam ao runner do teste
+                errors.append(error)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for reader in readers:
+            reader.start()
+        try:
+            for value in range(1, 40):
+                self.save(value)
+        finally:
+            stop.set()
+            for reader in readers:
+                reader.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(loads)
+        self.assertEqual(self.store.load('knn').metadata, {'value': 39})
+
+    def test_registry_picks_up_a_new_version_and_keeps_the_old_one_alive(self):
+        self.save(1)
+        registry = ModelRegistry(self.store, check_interval=3600)
+        old = registry.get('knn')
+        self.save(2)
+        self.assertIs(registry.get('knn'), old)  # Dentro do intervalo: sem conferir o CURRENT
+
+        registry.check_interval = 0
+        new = registry.get('knn')
+        self.assertEqual(new.metadata, {'value': 2})
+        self.assertIs(registry.get('knn'), new)
+        # Quem ainda segura o artefato antigo continua lendo a versão dele
+        np.testing.assert_array_equal(old['a'], np.full(1000, 1))
+        self.assertIsNone(registry.get('als'))
+
+    def test_prune_keeps_the_newest_and_the_active_version(self):
+        versions = [self.save(value) for value in range(5)]
+        self.store.activate('knn', versions[0])
+        removed = self.store.prune('knn', keep=2)
+        self.assertEqual(sorted(removed), versions[1:3])
+        self.assertEqual(self.store.versions('knn'), [versions[0]] + versions[3:])
+
+
+class RandomProjectionLSHTest(SimpleTestCase):
+    """
+    Índice aproximado (ann.py) contra o KNN exato do scikit-learn, com semente fixa.
+    """
+
+    def setUp(self):
+        self.matrix = synthetic_interactions(n_users=2000, n_items=1000, per_user=20, n_clusters=20, seed=0)
+        self.queries = self.matrix[:100]
+        _, self.exact = NearestNeighbors(metric='cosine', algorithm='brute').fit(self.matrix).kneighbors(
+            self.queries, n_neighbors=10)
+
+    def recall(self, indices):
+        return np.mean([len(set(found) & set(expected)) / 10 for found, expected in zip(indices, self.exact)])
+
+    def test_recall_against_brute_force(self):
+        lsh = RandomProjectionLSH(n_tables=16, n_bits=8, probes=3, random_state=0).fit(self.matrix)
+        distances, indices = lsh.kneighbors(self.queries, n_neighbors=10)
+        self.assertGreaterEqual(self.recall(indices), 0.8)
+        # Cada consulta acha a si mesma, e as distâncias vêm em ordem crescente
+        self.assertEqual(indices[:, 0].tolist(), list(range(100)))
+        self.assertTrue(np.all(np.diff(distances, axis=1) >= -1e-6))
+        # Só uma parte dos usuários é reordenada: não é uma busca exata disfarçada
+        queries = lsh._prepare(self.queries)
+        sizes = [len(lsh._candidates(codes[offset], projections[offset]))
+                 for _, codes, projections in lsh._hash_blocks(queries) for offset in range(len(codes))]
+        self.assertLess(np.mean(sizes), self.matrix.shape[0] / 2)
+
+    def test_hashing_in_blocks_matches_a_single_block(self):
+        whole = RandomProjectionLSH(random_state=0).fit(self.matrix)
+        blocks = RandomProjectionLSH(random_state=0, hash_batch_size=128).fit(self.matrix)
+        np.testing.assert_array_equal(whole._indexed_codes, blocks._indexed_codes)
+        np.testing.assert_array_equal(whole.kneighbors(self.queries, return_distance=False),
+                                      blocks.kneighbors(self.queries, return_distance=False))
+
+    def test_partial_fit_finds_new_rows(self):
+        lsh = RandomProjectionLSH(random_state=0).fit(self.matrix[:1500])
+        lsh.partial_fit(self.matrix[1500:1520])  # Abaixo de rebuild_fraction: ficam na área pendente
+        self.assertEqual(len(lsh._pending_codes), 20)
+        indices = lsh.kneighbors(self.matrix[1500:1520], n_neighbors=1, return_distance=False)
+        self.assertEqual(indices[:, 0].tolist(), list(range(1500, 1520)))
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct')
+class ALSTest(TestCase):
+    """
+    ALS (als.py): pontuação em lote sem itens já vistos e fatores que separam grupos de gosto.
+    """
+
+    def test_top_k_batch_matches_a_full_sort_and_excludes_seen_items(self):
+        rng = np.random.default_rng(0)
+        user_factors = rng.standard_normal((9, 4)).astype(np.float32)
+        item_factors = rng.standard_normal((30, 4)).astype(np.float32)
+        seen = sparse.random(9, 30, density=0.3, format='csr', random_state=1)
+
+        for k, batch_size in ((5, 4), (5, 2048), (40, 3)):
+            with self.subTest(k=k, batch_size=batch_size):
+                rows = {}
+                for start, columns, scores in top_k_batch(user_factors, item_factors, k=k, exclude=seen,
+                                                          batch_size=batch_size):
+                    for offset in range(len(columns)):
+                        rows[start + offset] = (columns[offset], scores[offset])
+                for row, (columns, scores) in rows.items():
+                    full = user_factors[row] @ item_factors.T
+                    unseen = [column for column in np.argsort(-full, kind='stable')
+                              if column not in set(seen[row].indices)]
+                    finite = np.isfinite(scores)
+                    self.assertEqual(columns[finite].tolist(), unseen[:min(k, 30)])
+                    self.assertFalse(set(columns[finite].tolist()) & set(seen[row].indices.tolist()))
+
+    def test_factors_separate_taste_groups(self):
+        # Usuários pares veem os filmes 0-9, ímpares os 10-19; cada um viu só metade do seu grupo
+        rng = random.Random(4)
+        rows, cols = [], []
+        for user in range(40):
+            group = range(0, 10) if user % 2 == 0 else range(10, 20)
+            picked = rng.sample(group, 5)
+            rows += [user] * len(picked)
+            cols += picked
+        matrix = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(40, 20))
+        user_factors, item_factors = train_als(matrix, factors=4, iterations=10, regularization=0.1)
+
+        for start, columns, scores in top_k_batch(user_factors, item_factors, k=3, exclude=matrix):
+            for offset, recommended in enumerate(columns.tolist()):
+                user = start + offset
+                group = set(range(0, 10) if user % 2 == 0 else range(10, 20))
+                self.assertLessEqual(set(recommended), group - set(matrix[user].indices.tolist()))
+
+    def test_recommender_over_a_stored_artifact(self):
+        users, _ = create_interactions(6, 15, seed=2)
+        arrays, metadata = train_als_artifacts(factors=4, iterations=3)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = ModelStore(directory.name)
+        store.save('als', arrays, metadata)
+        recommender = ALSRecommender(store.load('als'))
+
+        by_user = dict(recommender.recommend_all(k=5, batch_size=2))
+        for user in users:
+            recommended = recommender.recommend(user.id, k=5)
+            self.assertEqual([movie_id for movie_id, _ in recommended],
+                             [movie_id for movie_id, _ in by_user.get(user.id, [])])
+            seen = set(Rating.objects.filter(user=user).values_list('movie_id', flat=True)) \
+                | set(WatchedMovie.objects.filter(user=user).values_list('movie_id', flat=True))
+            self.assertFalse({movie_id for movie_id, _ in recommended} & seen)
+        self.assertEqual(recommender.recommend(999999), [])
+
+
+class NeighbourRecommendationsTest(TestCase):
+    """
+    Recomendações por vizinhança: as versões em lote devem dar exatamente o
+    mesmo resultado que as chamadas por usuário.
+    """
+
+    def assertSameRecommendations(self, expected, actual):
+        self.assertEqual([movie_id for movie_id, _ in actual], [movie_id for movie_id, _ in expected])
+        np.testing.assert_allclose([score for _, score in actual], [score for _, score in expected], rtol=1e-5)
+
+    def test_batch_matches_single_user_search(self):
+        users, _ = create_interactions(30, 25, seed=5, per_user=8)
+        interactions = build_interaction_matrix(implicit_weights=DEFAULT_IMPLICIT_WEIGHTS)
+        knn = build_knn_model(interactions, n_neighbors=6)
+        user_ids = [user.id for user in users] + [999999]
+
+        batch = recommend_movies_user_based_batch(user_ids, interactions, knn, n_recommendations=10,
+                                                  n_neighbors=5, batch_size=7)
+        self.assertEqual(set(batch), set(user_ids))
+        self.assertEqual(batch[999999], [])
+        for user_id in user_ids:
+            with self.subTest(user_id=user_id):
+                single = recommend_movies_collaborative(user_id, interactions, knn, top_n=10, n_neighbors=5,
+                                                        with_scores=True)
+                self.assertSameRecommendations(single, batch[user_id])
+                self.assertEqual(recommend_movies_user_based(user_id, interactions, knn),
+                                 [movie_id for movie_id, _ in batch[user_id]])
+
+    def test_batch_matches_single_user_over_a_stored_artifact(self):
+        users, _ = create_interactions(30, 25, seed=6, per_user=8)
+        arrays, metadata = train_knn_artifacts(n_neighbors=5, implicit_weights=DEFAULT_IMPLICIT_WEIGHTS,
+                                               batch_size=4)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        store = ModelStore(directory.name)
+        store.save('knn', arrays, metadata)
+        artifact = store.load('knn')
+        user_ids = [user.id for user in users] + [999999]
+
+        batch = recommend_movies_from_neighbours_batch(user_ids, artifact, top_n=10)
+        self.assertEqual(batch[999999], [])
+        self.assertTrue(any(batch[user.id] for user in users))
+        for user_id in user_ids:
+            with self.subTest(user_id=user_id):
+                self.assertSameRecommendations(recommend_movies_from_neighbours(user_id, artifact, top_n=10),
+                                               batch[user_id])
+
+
+class EvaluationHarnessTest(TestCase):
+    """
+    Avaliação offline (evaluation.py): dados sintéticos, divisão temporal e métricas.
+    """
+
+    def test_generate_events_and_temporal_split(self):
+        data = generate_events(n_users=30, n_movies=50, n_genres=4, events_per_user=6, seed=1)
+        events = data['events']
+        self.assertEqual(len(data['movie_genres']), 50)
+        self.assertEqual(len(data['user_genres']), 30)
+        self.assertTrue(set(events.kind) <= {'watched', 'like', 'dislike', 'favorite', 'rating', 'rating_high'})
+        self.assertTrue(((events.user >= 0) & (events.user < 30)).all())
+        self.assertTrue(((events.movie >= 0) & (events.movie < 50)).all())
+        # Mesma semente, mesmos dados
+        self.assertEqual(generate_events(30, 50, 4, 6, seed=1)['events'].tolist(), events.tolist())
+
+        train, test = temporal_split(events, test_fraction=0.25)
+        self.assertEqual(len(train) + len(test), len(events))
+        self.assertLess(train.time.max(), test.time.min())
+        self.assertAlmostEqual(len(test) / len(events), 0.25, delta=0.05)
+
+    def test_evaluate_engine_metrics(self):
+        data = generate_events(n_users=30, n_movies=50, n_genres=4, events_per_user=6, seed=2)
+        train, test = temporal_split(data['events'], test_fraction=0.3)
+        user_ids, movie_ids = write_dataset(data, train)
+        relevant = relevant_items(test, user_ids, movie_ids)
+        self.assertTrue(relevant)
+        self.assertEqual(Movie.objects.count(), 50)
+
+        class Oracle(Engine):
+            def recommend(self, user_id, k):
+                return sorted(relevant[user_id])[:k]
+
+        k = 5
+        perfect = evaluate_engine(Oracle(), relevant, len(movie_ids), k=k)
+        self.assertEqual(perfect['users_evaluated'], len(relevant))
+        self.assertEqual(perfect['recall@5'],
+                         round(float(np.mean([min(len(items), k) / len(items) for items in relevant.values()])), 4))
+        self.assertEqual(perfect['precision@5'],
+                         round(float(np.mean([min(len(items), k) / k for items in relevant.values()])), 4))
+
+        metrics = evaluate_engine(PopularityEngine(), relevant, len(movie_ids), k=k)
+        for name in ('precision@5', 'recall@5', 'coverage'):
+            self.assertGreaterEqual(metrics[name], 0)
+            self.assertLessEqual(metrics[name], 1)
+        self.assertIsNotNone(metrics['latency_p50_ms'])
+
+
+class EvaluateRecommendersCommandTest(TransactionTestCase):
+    """
+    O comando avalia num banco descartável: o banco configurado fica intacto.
+    """
+
+    def test_command_does_not_touch_the_configured_database(self):
+        movie = Movie.objects.create(title='Filme real', slug='filme-real', release_date=datetime.date(2020, 1, 1),
+                                     duration=90)
+        output = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        output.close()
+        self.addCleanup(os.unlink, output.name)
+
+        call_command('evaluate_recommenders', users=20, movies=30, genres=3, events_per_user=5, eval_users=10,
+                     engines=['popularity', 'content'], output=output.name, stdout=io.StringIO(), stderr=io.StringIO())
+
+        with open(output.name) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(set(report['engines']), {'popularity', 'content'})
+        self.assertEqual(list(Movie.objects.values_list('id', flat=True)), [movie.id])
+        self.assertFalse(User.objects.exists())
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='buffered')
+class CounterBufferTest(TestCase):
+    """
+    Buffer write-behind (counters.py): incrementos só depois do commit, flush que
+    falha sem perder nem duplicar, leituras com os valores pendentes e ajustes de
+    preferência aplicados em ordem, como no modo 'direct'.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='buffer')
+        self.genres = [Genre.objects.create(name=f'Gênero {index}') for index in range(3)]
+        self.movie = Movie.objects.create(title='Filme', description='', duration=90,
+                                          release_date=datetime.date(2000, 1, 1))
+        # Sem a thread de flush: os testes chamam flush()/close() na thread da transação de teste
+        patcher = mock.patch.object(CounterBuffer, '_start')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = CounterBuffer(flush_interval=3600, max_events=10 ** 6)
+        patcher = mock.patch('api.counters._buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def likes(self):
+        return MovieStats.objects.filter(movie=self.movie).values_list('likes', flat=True).first() or 0
+
+    def priority(self, genre, user=None):
+        return Preference.objects.filter(user=user or self.user, genre=genre) \
+            .values_list('priority', flat=True).first()
+
+    def test_increments_of_a_rolled_back_transaction_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.buffer.add_movie_stats(self.movie.id, {'likes': 1})
+                    adjust_user_preferences(self.user, [self.genres[0]], 'favorite', 1)
+                    raise RuntimeError('rollback')
+            except RuntimeError:
+                pass
+            self.buffer.add_movie_stats(self.movie.id, {'likes': 1})
+
+        self.assertEqual(self.buffer.metrics()['pending_events'], 1)
+        self.assertEqual(self.buffer.pending_movie_stats(self.movie.id), {'likes': 1})
+        self.assertEqual(self.buffer.close(), 1)
+        self.assertEqual(self.likes(), 1)
+        self.assertIsNone(self.priority(self.genres[0]))
+
+    def test_failed_flush_merges_back_without_double_counting(self):
+        Preference.objects.create(user=self.user, genre=self.genres[0], preference_type='favorite', priority=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buffer.add_movie_stats(self.movie.id, {'likes': 2})
+            adjust_user_preferences(self.user, [self.genres[0]], 'favorite', 3)
+
+        def fail(batch):
+            # Ajuste que chega durante o flush: vale depois dos do lote que falhou
+            with self.captureOnCommitCallbacks(execute=True):
+                adjust_user_preferences(self.user, [self.genres[0]], 'avoid', 3)
+            raise RuntimeError('banco indisponível')
+
+        with mock.patch.object(self.buffer, '_write', side_effect=fail), self.assertLogs('api.counters', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.metrics()['errors'], 1)
+        self.assertEqual(self.buffer.pending_movie_stats(self.movie.id), {'likes': 2})
+        self.assertEqual(self.buffer.pending_priority(self.user.id, self.genres[0].id, 4), 2)
+        self.assertEqual(self.likes(), 0)
+
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.likes(), 2)
+        # 4 + 3 -> 5 (limite) e 5 - 3 -> 2, como no modo 'direct'
+        self.assertEqual(self.priority(self.genres[0]), 2)
+        self.assertEqual(self.buffer.pending_movie_stats(self.movie.id), {})
+
+    def test_preference_adjustments_match_direct_mode(self):
+        direct_user = User.objects.create(username='direto')
+        sequences = [(4, [3, -3]), (None, [-1, 1]), (1, [-2, -2, 1, 1, 1, 1, 1, 1, -1])]
+        with self.captureOnCommitCallbacks(execute=True):
+            for genre, (initial, deltas) in zip(self.genres, sequences):
+                if initial is not None:
+                    for user in (self.user, direct_user):
+                        Preference.objects.create(user=user, genre=genre, preference_type='favorite',
+                                                  priority=initial)
+                for delta in deltas:
+                    adjust_user_preferences(self.user, [genre], 'favorite' if delta > 0 else 'avoid', delta)
+                    with override_settings(COUNTER_BUFFER_MODE='direct'):
+                        adjust_user_preferences(direct_user, [genre], 'favorite' if delta > 0 else 'avoid', delta)
+
+        for genre, (initial, _) in zip(self.genres, sequences):
+            self.assertEqual(self.buffer.pending_priority(self.user.id, genre.id, initial or 0),
+                             self.priority(genre, direct_user))
+        self.buffer.flush()
+        for genre in self.genres:
+            with self.subTest(genre=genre.name):
+                self.assertEqual(self.priority(genre), self.priority(genre, direct_user))
+                self.assertEqual(Preference.objects.get(user=self.user, genre=genre).preference_type,
+                                 Preference.objects.get(user=direct_user, genre=genre).preference_type)
+
+    def test_reads_include_pending_values(self):
+        MovieStats.objects.create(movie=self.movie, likes=5)
+        preference = Preference.objects.create(user=self.user, genre=self.genres[0], preference_type='favorite',
+                                               priority=4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buffer.add_movie_stats(self.movie.id, {'likes': 2, 'dislikes': 1})
+            adjust_user_preferences(self.user, [self.genres[0]], 'favorite', 3)
+            adjust_user_preferences(self.user, [self.genres[0]], 'avoid', 1)
+
+        stats = get_movie_stats([self.movie.id])[self.movie.id]
+        self.assertEqual((stats.likes, stats.dislikes), (7, 1))
+        self.assertEqual(PreferenceListSerializer(preference).data['priority'], 4)  # 4 + 3 -> 5, 5 - 1 -> 4
+        self.assertEqual(self.priority(self.genres[0]), 4)
+
+        with override_settings(COUNTER_BUFFER_MODE='direct'):
+            self.assertEqual(get_movie_stats([self.movie.id])[self.movie.id].likes, 5)
+
+    def test_close_flushes_and_is_registered_at_exit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buffer.add_movie_stats(self.movie.id, {'likes': 1})
+        self.assertEqual(self.buffer.close(), 1)
+        self.assertEqual(self.likes(), 1)
+        self.assertEqual(self.buffer.metrics()['pending_events'], 0)
+
+        with mock.patch('api.counters._buffer', None), mock.patch('api.counters.atexit.register') as register:
+            buffer = get_counter_buffer()
+            self.assertIs(get_counter_buffer(), buffer)
+        register.assert_called_once_with(buffer.close)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   EVENT_LOG_SETTLE_SECONDS=5)
+class EventLogTest(TestCase):
+    """
+    Histórico de interações (events.py): gravação e leitura incremental por checkpoint.
+    """
+
+    def setUp(self):
+        self.users = User.objects.bulk_create([User(username=f'historico{index}') for index in range(3)])
+        self.movie = Movie.objects.create(title='Filme', description='', duration=90,
+                                          release_date=datetime.date(2000, 1, 1))
+
+    def log(self, user, event_type, age_seconds=60):
+        event = log_event(user.id, self.movie.id, event_type)
+        InteractionEvent.objects.filter(pk=event.pk).update(
+            created_at=timezone.now() - datetime.timedelta(seconds=age_seconds))
+        return event.pk
+
+    def test_log_event_and_log_events(self):
+        event = log_event(self.users[0].id, self.movie.id, 'rating', 4)
+        self.assertEqual((event.event_type, event.value), ('rating', 4.0))
+        self.assertEqual(log_events(self.users[1].id, []), 0)
+        self.assertEqual(log_events(self.users[1].id, [(self.movie.id, 'like', 1), (self.movie.id, 'dislike', 1)]), 2)
+        rows = list(InteractionEvent.objects.filter(user_id=self.users[1].id).order_by('id')
+                    .values_list('event_type', 'created_at'))
+        self.assertEqual([event_type for event_type, _ in rows], ['like', 'dislike'])  # Ordem preservada
+        self.assertEqual(rows[0][1], rows[1][1])
+
+    def test_state_changes_are_logged_by_the_signals(self):
+        like = LikeDislike.objects.create(user=self.users[0], movie=self.movie, action='like')
+        like.delete()
+        self.assertEqual(list(InteractionEvent.objects.order_by('id').values_list('event_type', flat=True)),
+                         ['like', 'none'])
+
+    def test_cursor_reads_in_batches_up_to_the_settled_mark(self):
+        ids = [self.log(self.users[index % 3], 'like' if index % 2 else 'watch') for index in range(5)]
+        recent = self.log(self.users[0], 'like', age_seconds=0)
+        cursor = EventCursor('teste')
+
+        self.assertEqual(cursor.position, 0)
+        until = cursor.high_water_mark()
+        self.assertEqual(until, ids[-1])  # O evento recente fica para a próxima leitura
+        batches = list(cursor.batches(batch_size=2, until_id=until))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual([row[0] for batch in batches for row in batch], ids)
+        self.assertEqual([row[0] for batch in cursor.batches(until_id=until, event_types=['like'])
+                          for row in batch], ids[1::2])
+        self.assertEqual(cursor.changed_users(until), {user.id for user in self.users})
+        self.assertEqual(cursor.pending(), 6)
+
+        # Sem advance() (job que falhou) a leitura se repete; depois dele, só o que veio depois
+        self.assertEqual(sum(len(batch) for batch in cursor.batches(until_id=until)), 5)
+        cursor.advance(until)
+        self.assertEqual(cursor.position, until)
+        self.assertEqual(EventCheckpoint.objects.get(name='teste').last_event_id, until)
+        self.assertEqual(list(cursor.batches()), [])
+        self.assertEqual(cursor.changed_users(), set())
+
+        InteractionEvent.objects.filter(pk=recent).update(created_at=timezone.now() - datetime.timedelta(minutes=1))
+        later = self.log(self.users[2], 'favorite')
+        self.assertEqual(cursor.high_water_mark(), later)
+        self.assertEqual([row[0] for batch in cursor.batches() for row in batch], [recent, later])
+        self.assertEqual(cursor.changed_users(), {self.users[0].id, self.users[2].id})
+        self.assertEqual(EventCursor('outro').position, 0)  # Checkpoint por consumidor
+
+        cursor.reset()
+        self.assertEqual(cursor.position, 0)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'])
+class ExportViewTest(TestCase):
+    """
+    /api/export/<conjunto>/: NDJSON e CSV em streaming, filtros since/after_id e acesso só de administradores.
+    """
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', is_staff=True)
+        self.user = User.objects.create(username='comum')
+        self.movies = [Movie.objects.create(title=f'Filme {index}', description='', duration=90,
+                                            release_date=datetime.date(2000, 1, 1)) for index in range(3)]
+        self.ratings = [Rating.objects.create(user=self.user, movie=movie, rating=Decimal(value))
+                        for movie, value in zip(self.movies, ('4.5', '3.0', '1.5'))]
+        # Datas fixas para testar since
+        for rating, day in zip(self.ratings, (1, 10, 20)):
+            Rating.objects.filter(pk=rating.pk).update(
+                created_at=datetime.datetime(2024, 6, day, 12, 30, tzinfo=datetime.timezone.utc))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_with_decimal_and_datetime_values(self):
+        response = self.client.get('/api/export/ratings/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('ratings.ndjson', response['Content-Disposition'])
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [rating.pk for rating in self.ratings])
+        self.assertEqual([row['rating'] for row in rows], [4.5, 3.0, 1.5])
+        self.assertEqual(datetime.datetime.fromisoformat(rows[0]['created_at']),
+                         datetime.datetime(2024, 6, 1, 12, 30, tzinfo=datetime.timezone.utc))
+        self.assertEqual(set(rows[0]), {'id', 'user_id', 'movie_id', 'rating', 'created_at'})
+
+    def test_csv_with_filters(self):
+        text = self.export(f'/api/export/ratings/?output=csv&since=2024-06-05&after_id={self.ratings[1].pk}')
+        lines = text.splitlines()
+        self.assertEqual(lines[0], 'id,user_id,movie_id,rating,created_at')
+        self.assertEqual(len(lines), 2)
+        values = lines[1].split(',')
+        self.assertEqual(values[:4], [str(self.ratings[2].pk), str(self.user.pk), str(self.movies[2].pk), '1.5'])
+        self.assertEqual(datetime.datetime.fromisoformat(values[4]),
+                         datetime.datetime(2024, 6, 20, 12, 30, tzinfo=datetime.timezone.utc))
+
+        self.assertEqual(len(self.export('/api/export/ratings/?output=csv&since=2024-06-05').splitlines()), 3)
+        self.assertEqual(self.export('/api/export/ratings/?since=2025-01-01'), '')
+
+    def test_invalid_parameters_return_400(self):
+        for path in ('/api/export/watched/?since=2024-06-01',  # Conjunto sem campo de data
+                     '/api/export/ratings/?after_id=abc',
+                     '/api/export/ratings/?after_id=-1',
+                     '/api/export/ratings/?since=ontem',
+                     '/api/export/ratings/?output=xml',
+                     '/api/export/desconhecido/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.get(path).status_code, 400)
+
+    def test_non_admin_is_forbidden(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/export/ratings/').status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/export/ratings/').status_code, 401)
+
+
+@override_settings(RECOMMENDATION_REFRESH_MODE='off', OUTBOX_MODE='worker', COUNTER_BUFFER_MODE='direct',
+                   ALLOWED_HOSTS=['testserver'], DASHBOARD_SNAPSHOT_MAX_AGE=300)
+class DashboardViewTest(TestCase):
+    """
+    /api/dashboard/: resposta lida do snapshot (dashboard.py), recálculo agendado
+    quando ele passa da idade máxima e preferências paginadas.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='painel'))
+        self.data = {
+            'genres': [], 'ratings': [], 'genreDistribution': [],
+            'interactions': {'likes': 42, 'dislikes': 1, 'favorites': 2, 'watched': 3},
+            'preferences': [{'genre': {'id': index, 'name': f'Gênero {index}'}, 'users': 5 - index,
+                             'favorites': 1, 'avoids': 0, 'avgPriority': 3.0} for index in range(5)],
+        }
+        patcher = mock.patch('api.dashboard.threading.Thread')
+        self.thread = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def snapshot(self, age_seconds):
+        DashboardSnapshot.objects.create(key='dashboard', data=self.data,
+                                         refreshed_at=timezone.now() - datetime.timedelta(seconds=age_seconds))
+
+    def get(self, query=''):
+        response = self.client.get(f'/api/dashboard/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']
+
+    def test_fresh_snapshot_is_served_without_recomputing(self):
+        self.snapshot(age_seconds=10)
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get('?preferences_page=2&preferences_page_size=2')
+        self.assertEqual(len(queries), 1)  # Só a leitura do snapshot
+        self.assertEqual(data['interactions']['likes'], 42)  # Não recalculado (MovieStats está vazio)
+        self.assertEqual([row['genre']['id'] for row in data['preferences']], [2, 3])
+        self.assertEqual(data['preferencesPage'], {'page': 2, 'pageSize': 2, 'total': 5, 'pages': 3})
+        self.assertEqual(self.get('?preferences_page=9')['preferences'], [])
+        self.thread.assert_not_called()
+
+    def test_stale_snapshot_is_served_and_schedules_one_refresh(self):
+        self.snapshot(age_seconds=301)
+        # A thread (simulada) nunca roda para liberar a trava do processo
+        self.addCleanup(lambda: dashboard._refresh_lock.locked() and dashboard._refresh_lock.release())
+        self.assertEqual(self.get()['interactions']['likes'], 42)
+        self.thread.assert_called_once()
+        self.assertIs(self.thread.call_args.kwargs['target'], dashboard._refresh_job)
+        self.thread.return_value.start.assert_called_once()
+
+        # Recálculo em andamento (trava do processo ocupada): nenhum outro é agendado
+        self.get()
+        self.thread.assert_called_once()
+
+        dashboard.refresh_dashboard_snapshot()
+        self.assertEqual(self.get()['interactions']['likes'], 0)
+        self.thread.assert_called_once()
+
+    def test_missing_snapshot_is_computed_in_the_request(self):
+        self.assertEqual(self.get()['interactions'], {'likes': 0, 'dislikes': 0, 'favorites': 0, 'watched': 0})
+        self.assertTrue(DashboardSnapshot.objects.exists())
+        self.thread.assert_not_called()
+
+    def test_invalid_pagination_returns_400(self):
+        self.snapshot(age_seconds=10)
+        self.assertEqual(self.client.get('/api/dashboard/?preferences_page=abc').status_code, 400)
@@ -0,0 +1,394 @@
+# trending.py - tendências por filme e por gênero com decaimento exponencial, atualizadas a cada evento
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from .counters import counter_buffer
+from .models import (FavoriteMovie, GenreTrending, LikeDislike, Movie, MovieTrending, Rating, TrendingEpoch,
+                     WatchedMovie)
+
+# Peso de cada tipo de evento (sobrescrito por TRENDING_WEIGHTS nas configurações)
+DEFAULT_TRENDING_WEIGHTS = {'watch': 1.0, 'like': 1.0, 'dislike': -0.5, 'favorite': 2.0, 'rating': 1.0}
+
+
+def _weights():
+    return getattr(settings, 'TRENDING_WEIGHTS', DEFAULT_TRENDING_WEIGHTS)
+
+
+def _decay_rate():
+    # λ por segundo: a contribuição de um evento cai pela metade a cada meia-vida
+    return math.log(2) / (getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 72) * 3600)
+
+
+# Expoente λ * (t - época) a partir do qual um incremento avança a época (rebase_trending)
+# antes de gravar: exp(400) ≈ 5e173 deixa folga para somar muitos eventos longe de 1.8e308
+REBASE_EXPONENT = 400
+
+EPOCH_KEY = 'trending'
+
+_epoch_cache = {'epoch': None, 'expires': 0.0}
+_epoch_lock = threading.Lock()
+
+
+def _exponent(when, epoch):
+    return _decay_rate() * (when - epoch).total_seconds()
+
+
+def _epoch_row(lock=False):
+    """
+    Linha de TrendingEpoch; criada com a época = agora se ainda não existir.
+    """
+    queryset = TrendingEpoch.objects.select_for_update() if lock else TrendingEpoch.objects.all()
+    state = queryset.filter(key=EPOCH_KEY).first()
+    if state is None:
+        TrendingEpoch.objects.bulk_create([TrendingEpoch(key=EPOCH_KEY, epoch=timezone.now())],
+                                          ignore_conflicts=True)
+        state = queryset.get(key=EPOCH_KEY)
+    return state
+
+
+def _remember_epoch(epoch):
+    ttl = getattr(settings, 'TRENDING_CACHE_SECONDS', 30)
+    with _epoch_lock:
+        _epoch_cache.update(epoch=epoch, expires=time.monotonic() + ttl)
+
+
+def current_epoch():
+    """
+    Época gravada em TrendingEpoch, guardada em memória por TRENDING_CACHE_SECONDS.
+    """
+    with _epoch_lock:
+        if _epoch_cache['epoch'] is not None and _epoch_cache['expires'] > time.monotonic():
+            return _epoch_cache['epoch']
+    epoch = _epoch_row().epoch
+    _remember_epoch(epoch)
+    return epoch
+
+
+def _epoch_for_write():
+    """
+    Época lida na transação do incremento. No PostgreSQL, com FOR SHARE: um
+    rebase_trending concorrente espera este commit (ou este incremento espera o
+    rebase), e nenhum incremento é somado na escala errada. No SQLite as
+    transações de escrita já são serializadas (BEGIN IMMEDIATE).
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT epoch FROM {TrendingEpoch._meta.db_table} WHERE key = %s FOR SHARE', [EPOCH_KEY])
+            row = cursor.fetchone()
+        if row is not None:
+            return row[0]
+    return _epoch_row().epoch
+
+
+def _write_epoch(when, epoch):
+    """
+    Época para gravar um evento do instante when: se o fator passaria de
+    exp(REBASE_EXPONENT), avança a época antes (rebase_trending), em vez de
+    deixar math.exp estourar dentro da transação da interação.
+    """
+    if _exponent(when, epoch) > REBASE_EXPONENT:
+        epoch = rebase_trending(when)
+    return epoch
+
+
+def forward_weight(when=None, epoch=None):
+    """
+    Fator exp(λ * (t - época)) de um evento no instante when ("forward decay").
+    Somar pesos * fator dá uma pontuação que não precisa ser reescrita com o
+    tempo: a ordem entre filmes já é a ordem da tendência decaída.
+    """
+    when = when or timezone.now()
+    return math.exp(_exponent(when, epoch or current_epoch()))
+
+
+def rebase_trending(new_epoch=None):
+    """
+    Avança a época para new_epoch (padrão: agora): divide todas as pontuações por
+    exp(λ * (nova - antiga)) e grava a nova época na mesma transação. A ordem e a
+    tendência atual não mudam; só a escala dos valores gravados volta para perto de 1.
+
+    :return: Época em vigor depois da chamada.
+    """
+    new_epoch = new_epoch or timezone.now()
+    with transaction.atomic():
+        state = _epoch_row(lock=True)
+        if new_epoch <= state.epoch:
+            return state.epoch
+        factor = math.exp(-_exponent(new_epoch, state.epoch))  # Pode virar 0: tendência toda decaída
+        MovieTrending.objects.update(score=F('score') * factor)
+        GenreTrending.objects.update(score=F('score') * factor)
+        state.epoch = new_epoch
+        state.save(update_fields=['epoch', 'updated_at'])
+
+        def forget():
+            _remember_epoch(new_epoch)
+            clear_trending_cache()
+
+        transaction.on_commit(forget)
+    return new_epoch
+
+
+def rating_value(rating):
+    """
+    Avaliação de 1 a 5 vira um valor de -1 a 1 (3 é neutro).
+    """
+    return (float(rating) - 3) / 2
+
+
+def _state_events(kind, state):
+    if state is None or state is False or state == 'none':
+        return []
+    if kind == 'like':
+        return [(state, 1.0)]
+    if kind == 'rating':
+        return [('rating', rating_value(state))]
+    if kind == 'watch':
+        return [('watch', float(state))]
+    return [(kind, 1.0)]
+
+
+def trending_transition(kind, previous, current):
+    """
+    Eventos de tendência da mudança de estado de uma interação: soma o estado
+    novo e desconta o anterior, para que a pontuação acompanhe o que está
+    gravado (como rebuild_trending). Repetir a mesma ação não soma nada; remover
+    a interação desconta o seu peso (como um evento negativo no instante atual).
+
+    :param kind: 'like' (estados 'like', 'dislike', 'none' ou None), 'favorite'
+                 (True/False), 'rating' (nota ou None) ou 'watch' (watch_count ou None).
+    :return: Lista de (tipo, valor) para record_events ou enqueue_interaction.
+    """
+    if previous == current:
+        return []
+    return _state_events(kind, current) + [(event, -value) for event, value in _state_events(kind, previous)]
+
+
+def record_event(movie_id, kind, value=1.0, when=None):
+    """
+    Soma um evento na tendência do filme e dos seus gêneros: um UPDATE atômico
+    por tabela (F()), sem GROUP BY nem leitura das linhas. Deve ser chamada na
+    mesma transação da interação.
+
+    :param kind: 'watch', 'like', 'dislike', 'favorite' ou 'rating'.
+    :param value: Multiplicador do peso (ex.: rating_value(nota)).
+    """
+    delta = _weights().get(kind, 0) * value
+    if not delta:
+        return
+    when = when or timezone.now()
+
+    buffer = counter_buffer()
+    if buffer is not None:
+        # Write-behind: filmes muito acessados viram um UPDATE por flush (api/counters.py); o
+        # incremento leva a época usada, e o flush corrige a escala se ela tiver avançado
+        epoch = _write_epoch(when, current_epoch())
+        buffer.add_trending(movie_id, delta * forward_weight(when, epoch), epoch)
+        return
+    delta *= forward_weight(when, _write_epoch(when, _epoch_for_write()))
+
+    if not MovieTrending.objects.filter(movie_id=movie_id).update(score=F('score') + delta):
+        # Primeiro evento do filme: cria a linha (ignorando corrida) e aplica o incremento
+        MovieTrending.objects.bulk_create([MovieTrending(movie_id=movie_id)], ignore_conflicts=True)
+        MovieTrending.objects.filter(movie_id=movie_id).update(score=F('score') + delta)
+
+    genre_ids = list(Movie.genres.through.objects.filter(movie_id=movie_id).values_list('genre_id', flat=True))
+    if genre_ids:
+        GenreTrending.objects.bulk_create([GenreTrending(genre_id=genre_id) for genre_id in genre_ids],
+                                          ignore_conflicts=True)
+        GenreTrending.objects.filter(genre_id__in=genre_ids).update(score=F('score') + delta)
+
+
+def record_events(events, when=None):
+    """
+    Versão em lote de record_event: soma os eventos por filme e por gênero e
+    aplica tudo com um UPDATE ... CASE por tabela.
+
+    :param events: Iterável de (movie_id, kind, value).
+    """
+    weights = _weights()
+    movie_deltas = {}
+    for movie_id, kind, value in events:
+        delta = weights.get(kind, 0) * value
+        if delta:
+            movie_deltas[movie_id] = movie_deltas.get(movie_id, 0.0) + delta
+    if not movie_deltas:
+        return
+    when = when or timezone.now()
+
+    buffer = counter_buffer()
+    epoch = _write_epoch(when, current_epoch() if buffer is not None else _epoch_for_write())
+    factor = forward_weight(when, epoch)
+    movie_deltas = {movie_id: delta * factor for movie_id, delta in movie_deltas.items()}
+    if buffer is not None:
+        for movie_id, delta in movie_deltas.items():
+            buffer.add_trending(movie_id, delta, epoch)
+        return
+    apply_trending_deltas(movie_deltas)
+
+
+def apply_trending_deltas(movie_deltas, epoch=None):
+    """
+    Soma pontuações já multiplicadas pelo fator do evento (forward_weight) nos
+    filmes e nos seus gêneros, com um UPDATE ... CASE por tabela.
+
+    :param movie_deltas: Dicionário {movie_id: incremento}.
+    :param epoch: Época usada no cálculo dos incrementos (padrão: a gravada, já lida nesta
+                  transação). Se ela tiver avançado desde então, os incrementos são reescalados.
+    """
+    movie_deltas = {movie_id: delta for movie_id, delta in movie_deltas.items() if delta}
+    if not movie_deltas:
+        return
+    if epoch is not None:
+        stored = _epoch_for_write()
+        if stored != epoch:
+            scale = math.exp(-_exponent(stored, epoch))
+            movie_deltas = {movie_id: delta * scale for movie_id, delta in movie_deltas.items()}
+
+    genre_deltas = {}
+    for movie_id, genre_id in Movie.genres.through.objects.filter(movie_id__in=list(movie_deltas)) \
+            .values_list('movie_id', 'genre_id'):
+        genre_deltas[genre_id] = genre_deltas.get(genre_id, 0.0) + movie_deltas[movie_id]
+
+    for model, key, deltas in ((MovieTrending, 'movie_id', movie_deltas), (GenreTrending, 'genre_id', genre_deltas)):
+        if not deltas:
+            continue
+        ids = sorted(deltas)
+        model.objects.bulk_create([model(**{key: pk}) for pk in ids], ignore_conflicts=True)
+        # Em blocos, para não passar do limite de parâmetros por comando do banco
+        for start in range(0, len(ids), 250):
+            chunk = ids[start:start + 250]
+            model.objects.filter(**{f'{key}__in': chunk}).update(score=F('score') + Case(
+                *[When(**{key: pk}, then=Value(deltas[pk])) for pk in chunk],
+                default=Value(0.0), output_field=FloatField(),
+            ))
+
+
+# ----------------------------------------------------------------------
+# Leitura: listas ordenadas pelo índice de score, guardadas em memória por alguns segundos
+# ----------------------------------------------------------------------
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cached(key, load):
+    ttl = getattr(settings, 'TRENDING_CACHE_SECONDS', 30)
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+    rows = load()
+    with _cache_lock:
+        _cache[key] = (now + ttl, rows)
+    return rows
+
+
+def clear_trending_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _cache_size():
+    return getattr(settings, 'TRENDING_CACHE_SIZE', 500)
+
+
+def _current_decay(epoch):
+    # 1 / forward_weight(agora), calculado com expoente negativo: nunca estoura, no máximo vai a 0
+    return math.exp(-_exponent(timezone.now(), epoch))
+
+
+def get_trending_movies(genre_id=None, limit=20):
+    """
+    Filmes em alta (opcionalmente só de um gênero), lidos em ordem pelo índice de score.
+
+    :return: Lista de (movie_id, tendência atual) em ordem decrescente; a tendência
+             atual é a pontuação gravada dividida pelo fator de agora.
+    """
+    def load():
+        queryset = MovieTrending.objects.filter(score__gt=0)
+        if genre_id is not None:
+            queryset = queryset.filter(movie__genres=genre_id)
+        return _epoch_row().epoch, list(
+            queryset.order_by('-score', 'movie_id').values_list('movie_id', 'score')[:_cache_size()])
+
+    epoch, rows = _cached(('movies', genre_id), load)
+    decay = _current_decay(epoch)
+    return [(movie_id, score * decay) for movie_id, score in rows[:limit]]
+
+
+def get_trending_genres(limit=10):
+    """
+    Gêneros em alta.
+
+    :return: Lista de (genre_id, tendência atual) em ordem decrescente.
+    """
+    def load():
+        rows = GenreTrending.objects.filter(score__gt=0).order_by('-score', 'genre_id')
+        return _epoch_row().epoch, list(rows.values_list('genre_id', 'score')[:_cache_size()])
+
+    epoch, rows = _cached(('genres',), load)
+    decay = _current_decay(epoch)
+    return [(genre_id, score * decay) for genre_id, score in rows[:limit]]
+
+
+# ----------------------------------------------------------------------
+# Reconstrução completa (manage.py rebuild_trending)
+# ----------------------------------------------------------------------
+def rebuild_trending(batch_size=1000, now=None):
+    """
+    Recalcula as tendências a partir das tabelas de interação, usando a data de
+    cada registro. WatchedMovie não guarda data: as assistências contam como
+    eventos do momento da reconstrução. A época passa a ser o momento da
+    reconstrução (todos os fatores ficam <= 1).
+
+    :return: (filmes com tendência, gêneros com tendência).
+    """
+    weights = _weights()
+    now = now or timezone.now()
+    totals = {}
+
+    def add(movie_id, kind, when, value=1.0):
+        if weights.get(kind, 0) and value:
+            totals[movie_id] = totals.get(movie_id, 0.0) + weights[kind] * value * forward_weight(when, now)
+
+    for movie_id, action, created_at in LikeDislike.objects.filter(action__in=('like', 'dislike')) \
+            .values_list('movie_id', 'action', 'created_at').iterator(chunk_size=batch_size):
+        add(movie_id, action, created_at)
+    for movie_id, added_at in FavoriteMovie.objects.values_list('movie_id', 'added_at').iterator(chunk_size=batch_size):
+        add(movie_id, 'favorite', added_at)
+    for movie_id, rating, created_at in Rating.objects.values_list('movie_id', 'rating', 'created_at') \
+            .iterator(chunk_size=batch_size):
+        add(movie_id, 'rating', created_at, rating_value(rating))
+    for movie_id, watch_count in WatchedMovie.objects.values_list('movie_id', 'watch_count') \
+            .iterator(chunk_size=batch_size):
+        add(movie_id, 'watch', now, watch_count)
+
+    genre_totals = {}
+    for movie_id, genre_id in Movie.genres.through.objects.values_list('movie_id', 'genre_id') \
+            .iterator(chunk_size=batch_size):
+        if movie_id in totals:
+            genre_totals[genre_id] = genre_totals.get(genre_id, 0.0) + totals[movie_id]
+
+    with transaction.atomic():
+        state = _epoch_row(lock=True)
+        state.epoch = now
+        state.save(update_fields=['epoch', 'updated_at'])
+        MovieTrending.objects.all().delete()
+        GenreTrending.objects.all().delete()
+        MovieTrending.objects.bulk_create(
+            [MovieTrending(movie_id=movie_id, score=score) for movie_id, score in totals.items()],
+            batch_size=batch_size,
+        )
+        GenreTrending.objects.bulk_create(
+            [GenreTrending(genre_id=genre_id, score=score) for genre_id, score in genre_totals.items()],
+            batch_size=batch_size,
+        )
+    _remember_epoch(now)
+    clear_trending_cache()
+    return len(totals), len(genre_totals)
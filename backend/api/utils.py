@@ -1,58 +1,126 @@
 # utils.py (pode ser criado um arquivo utilitário para funções auxiliares)
-from django.db.models import Count
+from django.db import connection, transaction
+from django.db.models import Case, Count, Exists, ExpressionWrapper, F, IntegerField, OuterRef, QuerySet, Sum, Value, When
+from django.db.models.functions import Greatest, Least
 from rest_framework.response import Response
 from rest_framework import status
 
 from sklearn.neighbors import NearestNeighbors
 import numpy as np
 
-from .models import Preference,LikeDislike,Movie,Rating
+from .models import Preference,LikeDislike,Movie,Rating,FavoriteMovie,WatchedMovie
+from .counters import counter_buffer
+from .stats import get_movie_stats
+
+# Faixa de Preference.priority mantida pelos ajustes automáticos (0 = neutro)
+MIN_PREFERENCE_PRIORITY = 0
+MAX_PREFERENCE_PRIORITY = 5
+
+
+def bulk_adjust_preferences(user_id, genre_ids, delta):
+    """
+    Soma delta na prioridade das preferências do usuário para vários gêneros em
+    um único comando, com a prioridade limitada no próprio SQL:
+
+        INSERT ... VALUES (...), (...) ON CONFLICT (user_id, genre_id)
+        DO UPDATE SET priority = LEAST(GREATEST(priority + delta, 0), 5)
+
+    (MIN/MAX no SQLite). Gêneros sem preferência ganham uma linha 'favorite'
+    (delta > 0) ou 'avoid'. Como a soma é feita pelo banco, likes simultâneos do
+    mesmo usuário não perdem incrementos. Outros bancos usam bulk_create com
+    ignore_conflicts seguido de um UPDATE com F().
+
+    :return: Número de gêneros ajustados.
+    """
+    genre_ids = sorted(set(genre_ids))  # Ordem fixa: transações concorrentes travam as linhas na mesma ordem
+    if not genre_ids or not delta:
+        return 0
+
+    preference_type = 'favorite' if delta > 0 else 'avoid'
+    initial = min(max(delta, MIN_PREFERENCE_PRIORITY), MAX_PREFERENCE_PRIORITY)
+    if connection.vendor in ('postgresql', 'sqlite'):
+        quote = connection.ops.quote_name
+        table = quote(Preference._meta.db_table)
+        least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+        values = ', '.join(['(%s, %s, %s, %s)'] * len(genre_ids))
+        params = []
+        for genre_id in genre_ids:
+            params.extend([user_id, genre_id, preference_type, initial])
+        params.extend([delta, MIN_PREFERENCE_PRIORITY, MAX_PREFERENCE_PRIORITY])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({quote("user_id")}, {quote("genre_id")}, {quote("preference_type")}, '
+                f'{quote("priority")}) VALUES {values} '
+                f'ON CONFLICT ({quote("user_id")}, {quote("genre_id")}) DO UPDATE SET '
+                f'{quote("priority")} = {least}({greatest}({table}.{quote("priority")} + %s, %s), %s)',
+                params,
+            )
+    else:
+        with transaction.atomic():
+            # Linhas novas nascem com 0: o UPDATE abaixo leva todas a clamp(prioridade + delta)
+            Preference.objects.bulk_create(
+                [Preference(user_id=user_id, genre_id=genre_id, preference_type=preference_type, priority=0)
+                 for genre_id in genre_ids],
+                ignore_conflicts=True,
+            )
+            Preference.objects.filter(user_id=user_id, genre_id__in=genre_ids).update(
+                priority=Least(Greatest(F('priority') + delta, MIN_PREFERENCE_PRIORITY), MAX_PREFERENCE_PRIORITY)
+            )
+    return len(genre_ids)
+
 
 def adjust_user_preferences(user, genres, action, weight):
     """
-    Ajusta as preferências do usuário para uma lista de gêneros.
-
-    :param user: Usuário para ajustar as preferências.
-    :param genres: Lista de gêneros a serem ajustados.
-    :param action: Tipo de ação ('favorite', 'avoid').
-    :param weight: Peso da ação (positivo ou negativo).
-    """
-    for genre in genres:
-        # Busca ou cria a preferência
-        preference, created = Preference.objects.get_or_create(
-            user=user,
-            genre=genre,
-            defaults={"priority": weight}  # Inicializa prioridade ao criar
-        )
-        
-        # Se a preferência já existia, ajusta o valor
-        if not created:
-            if action == "favorite":
-                preference.priority += weight
-            elif action == "avoid":
-                preference.priority -= weight  # Peso negativo reduz preferência
-            
-            # Evitar valores negativos extremos, opcional
-            preference.priority = max(preference.priority, 0)
-            print(" # Se a preferência já existia, ajusta o valor")
-        
-        # Salva a instância
-        preference.save()
+    Ajusta as preferências do usuário para uma lista de gêneros (ver bulk_adjust_preferences).
+
+    :param user: Usuário (ou ID do usuário) para ajustar as preferências.
+    :param genres: Gêneros a serem ajustados (queryset, instâncias ou IDs).
+    :param action: Tipo de ação ('favorite' aumenta a prioridade, 'avoid' diminui).
+    :param weight: Intensidade do ajuste (o sinal vem da ação).
+    """
+    if isinstance(genres, QuerySet):
+        genre_ids = list(genres.values_list('pk', flat=True))
+    else:
+        genre_ids = [getattr(genre, 'pk', genre) for genre in genres]
+
+    user_id = getattr(user, 'pk', user)
+    delta = abs(weight) if action == 'favorite' else -abs(weight)
+    buffer = counter_buffer()
+    if buffer is not None:
+        # Write-behind (api/counters.py): o flush grava os ajustes somados e agenda o recálculo
+        buffer.add_preferences(user_id, genre_ids, delta)
+        return
+    if bulk_adjust_preferences(user_id, genre_ids, delta):
+        # O INSERT direto não dispara post_save de Preference: agenda o recálculo da lista aqui
+        from .recommendations import schedule_refresh
+
+        schedule_refresh(user_id)
+
+
+def preference_for_rating(rating, created):
+    """
+    Ajuste de preferência de uma avaliação: (ação, peso) para adjust_user_preferences,
+    ou None. Uma avaliação nova conta como favorita a partir de 4; uma alterada, a partir de 3.
+    """
+    if rating >= (4 if created else 3):
+        return ('favorite', 1)
+    if rating <= 2:
+        return ('avoid', -1)
+    return None
+
 
 def get_movie_interactions(movie):
     """
     Função para retornar a contagem de likes, favoritos e assistidos de um filme.
     """
-    likes_count = movie.likes_disliked_by.filter(action='like').count()
-    dislikes_count = movie.likes_disliked_by.filter(action='dislike').count()
-    favorite_count = movie.favorited_by.count()
-    watched_count = movie.watchedmovie_set.count()
+    # Lê os contadores desnormalizados (MovieStats) em vez de fazer COUNT(*) nas interações
+    stats = get_movie_stats([movie.id])[movie.id]
 
     return {
-        'likes_count': likes_count,
-        'dislikes_count': dislikes_count,
-        'favorite_count': favorite_count,
-        'watched_count': watched_count
+        'likes_count': stats.likes,
+        'dislikes_count': stats.dislikes,
+        'favorite_count': stats.favorites,
+        'watched_count': stats.watched
     }
 
 
@@ -81,6 +149,50 @@ def get_user_interactions(movie, user):
         'watched': watched_count,  # Quantas vezes o filme foi assistido
     }
 
+
+def get_bulk_interactions(movie_ids, user):
+    """
+    Versão em lote de get_movie_interactions + get_user_interactions.
+
+    Em vez de ~9 consultas por filme, lê os totais de MovieStats em uma única
+    consulta e o estado do usuário logado com uma consulta por tabela de
+    interação (LikeDislike, FavoriteMovie, WatchedMovie) para todos os filmes da página.
+
+    :param movie_ids: IDs dos filmes da página.
+    :param user: Usuário logado.
+    :return: Dicionário {movie_id: {'likes_count', 'dislikes_count', 'favorite_count',
+             'watched_count', 'user_interactions': {'liked', 'favorited', 'watched'}}}.
+    """
+    movie_ids = list(movie_ids)
+    if not movie_ids:
+        return {}
+
+    # Totais: uma leitura da tabela MovieStats
+    interactions = {
+        movie_id: {
+            'likes_count': stats.likes,
+            'dislikes_count': stats.dislikes,
+            'favorite_count': stats.favorites,
+            'watched_count': stats.watched,
+            'user_interactions': {'liked': 'none', 'favorited': False, 'watched': 0},
+        }
+        for movie_id, stats in get_movie_stats(movie_ids).items()
+    }
+
+    # Estado do usuário: like/dislike, favorito e entradas de assistido
+    user_likes = LikeDislike.objects.filter(user=user, movie_id__in=movie_ids).values_list('movie_id', 'action')
+    for movie_id, action in user_likes:
+        if action in ('like', 'dislike'):
+            interactions[movie_id]['user_interactions']['liked'] = action
+
+    for movie_id in FavoriteMovie.objects.filter(user=user, movie_id__in=movie_ids).values_list('movie_id', flat=True):
+        interactions[movie_id]['user_interactions']['favorited'] = True
+
+    for movie_id in WatchedMovie.objects.filter(user=user, movie_id__in=movie_ids).values_list('movie_id', flat=True):
+        interactions[movie_id]['user_interactions']['watched'] += 1
+
+    return interactions
+
 # Utilitário para respostas uniformes
 def create_response(message, data=None, status_code=status.HTTP_200_OK):
     response = {"message": message}
@@ -101,6 +213,34 @@ def recommend_movies_based_on_likes(user):
     
     return recommended_movies
 
+def recommend_movies_by_genre_preferences(user):
+    """
+    Retorna um queryset de filmes recomendados, com a pontuação calculada no banco.
+
+    A pontuação é a mesma usada em PersonalizedRecommendationsViewOrdeby:
+      - 2 * prioridade de cada gênero favorito do usuário presente no filme
+        (junção dos gêneros do filme com Preference.priority);
+      - +3 se o usuário curtiu o filme.
+    Filmes já assistidos ou descurtidos são excluídos. O resultado vem ordenado
+    por (-score, id), então fatiar o queryset gera ORDER BY ... LIMIT no SQL.
+    """
+    watched_movie_ids = WatchedMovie.objects.filter(user=user).values('movie_id')
+    disliked_movie_ids = LikeDislike.objects.filter(user=user, action='dislike').values('movie_id')
+    liked = LikeDislike.objects.filter(user=user, movie=OuterRef('pk'), action='like')
+
+    return (
+        # Filtro e agregação no mesmo relacionamento: a soma considera só as preferências do usuário
+        Movie.objects.filter(genres__preferences__user=user, genres__preferences__preference_type='favorite')
+        .exclude(id__in=watched_movie_ids)
+        .exclude(id__in=disliked_movie_ids)
+        .annotate(genre_score=Sum('genres__preferences__priority'))
+        .annotate(score=ExpressionWrapper(
+            2 * F('genre_score') + Case(When(Exists(liked), then=Value(3)), default=Value(0)),
+            output_field=IntegerField(),
+        ))
+        .order_by('-score', 'id')
+    )
+
 def calculate_movie_score(self, movie, user):
     """
     Função para calcular a pontuação do filme baseado no histórico de interações e preferências do usuário.
@@ -1,5 +1,5 @@
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly, IsAdminUser
 from rest_framework import viewsets,generics
 from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.tokens import RefreshToken,AccessToken
@@ -11,9 +11,12 @@ from rest_framework.exceptions import ValidationError
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.decorators import action
 from sklearn.metrics.pairwise import cosine_similarity
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.http import StreamingHttpResponse
+import math
 import pandas as pd
-from .models import Movie, Rating, Genre,Preference,LikeDislike,WatchedMovie,FavoriteMovie
+from .models import Movie, Rating, Genre,Preference,LikeDislike,WatchedMovie,FavoriteMovie,UserRecommendation
 from .serializers import (
     UserSerializer,
     MovieSerializer,
@@ -23,10 +26,25 @@ from .serializers import (
     FavoriteMovieSerializer,
     WatchedMovieSerializer,
     LikeDislikeSerializer,
-    PreferenceListSerializer
+    PreferenceListSerializer,
+    InteractionEventSerializer
 )
-from .utils import create_response,get_movie_interactions,get_user_interactions,adjust_user_preferences,calculate_movie_score,get_user_favorite_genre_ids  # Importando a função
-from django.db.models import Avg,Count,Q,F
+from .content import get_similar_movies
+from .counters import get_counter_buffer
+from .dashboard import get_dashboard_snapshot
+from .export import ExportError, iter_export, parse_since
+from .genre_index import IndexedRecommendations, get_genre_index
+from .hybrid import CANDIDATE_SOURCES, DEFAULT_HYBRID_WEIGHTS, hybrid_recommendations
+from .interactions import apply_interaction_batch, record_watch
+from .model_store import get_model_registry
+from .outbox import enqueue_interaction
+from .pagination import MovieKeysetPagination
+from .recommendations import ensure_user_recommendations
+from .stats import like_action_deltas
+from .trending import get_trending_genres, get_trending_movies, trending_transition
+from .utils import create_response,get_bulk_interactions,preference_for_rating,recommend_movies_by_genre_preferences  # Importando a função
+from django.db import transaction
+from django.db.models import F
 
 class MoviePagination(PageNumberPagination):
     """
@@ -202,30 +220,22 @@ class RatingCreateUpdateView(APIView):
         """
         movie_id = request.data.get('movie')
         user = request.user
-        rating_value = request.data.get('rating')  # Exemplo de valor da avaliação (de 1 a 5)
 
         # Verifica se o usuário já avaliou esse filme
         existing_rating = Rating.objects.filter(user=user, movie_id=movie_id).first()
-
-        # Função para ajustar as preferências com base na avaliação
-        def adjust_preferences_based_on_rating(action, weight):
-            try:
-                movie = Movie.objects.get(id=movie_id)
-                adjust_user_preferences(user, movie.genres.all(), action, weight)  # Ajusta a preferência do usuário
-            except Movie.DoesNotExist:
-                pass
+        previous_value = existing_rating.rating if existing_rating else None
 
         # Se já existe uma avaliação, atualiza a avaliação
         if existing_rating:
             serializer = RatingSerializer(existing_rating, data=request.data, partial=True, context={'request': request})
             if serializer.is_valid():
-                updated_rating = serializer.save()  # Atualiza a avaliação com os novos dados
-
-                # Ajusta a preferência baseada na avaliação
-                if rating_value >= 3:
-                    adjust_preferences_based_on_rating('favorite', 1)
-                elif rating_value <= 2:
-                    adjust_preferences_based_on_rating('avoid', -1)
+                with transaction.atomic():
+                    updated_rating = serializer.save()  # Atualiza a avaliação com os novos dados
+                    # Contadores e preferência baseada na avaliação ficam para o worker do outbox
+                    enqueue_interaction(user.id, updated_rating.movie_id,
+                                        stats={'rating_sum': updated_rating.rating - previous_value},
+                                        preference=preference_for_rating(updated_rating.rating, created=False),
+                                        trending=trending_transition('rating', previous_value, updated_rating.rating))
 
                 return create_response(
                     message='Avaliação atualizada com sucesso.',
@@ -244,13 +254,13 @@ class RatingCreateUpdateView(APIView):
             request.data['user'] = user.id  # Associando automaticamente o usuário autenticado
             serializer = RatingSerializer(data=request.data, context={'request': request})
             if serializer.is_valid():
-                created_rating = serializer.save()  # Cria a nova avaliação
-
-                # Ajusta a preferência baseada na avaliação
-                if rating_value >= 4:
-                    adjust_preferences_based_on_rating('favorite', 1)
-                elif rating_value <= 2:
-                    adjust_preferences_based_on_rating('avoid', -1)
+                with transaction.atomic():
+                    created_rating = serializer.save()  # Cria a nova avaliação
+                    # Contadores e preferência baseada na avaliação ficam para o worker do outbox
+                    enqueue_interaction(user.id, created_rating.movie_id,
+                                        stats={'ratings_count': 1, 'rating_sum': created_rating.rating},
+                                        preference=preference_for_rating(created_rating.rating, created=True),
+                                        trending=trending_transition('rating', None, created_rating.rating))
 
                 return create_response(
                     message='Avaliação criada com sucesso.',
@@ -288,20 +298,25 @@ class MovieListCreateView(APIView):
                 # Caso o gênero não exista na base de dados, retorna todos os filmes
                 movies = Movie.objects.all()
 
-        # Aplicar paginação
-        paginator = MoviePagination()
-        paginated_movies = paginator.paginate_queryset(movies, request)
+        # Aplicar paginação: por cursor (keyset) se pedido, senão por número de página
+        if request.query_params.get("pagination") == "cursor" or "cursor" in request.query_params:
+            paginator = MovieKeysetPagination()
+        else:
+            paginator = MoviePagination()
+        paginated_movies = paginator.paginate_queryset(movies.prefetch_related('genres'), request)
+
+        # Interações de toda a página em um número constante de consultas
+        page_interactions = get_bulk_interactions([movie.id for movie in paginated_movies], user)
 
         movie_data = []
 
         # Adicionando interações personalizadas para o usuário logado
         for movie in paginated_movies:
             movie_info = MovieSerializer(movie).data  # Serializa os dados básicos do filme
-            interactions = get_movie_interactions(movie)  # Obtém as interações gerais
-            user_interactions = get_user_interactions(movie, user)  # Obtém as interações do usuário logado
+            interactions = dict(page_interactions[movie.id])
 
             # Atualiza as interações específicas do usuário
-            movie_info['user_interactions'] = user_interactions
+            movie_info['user_interactions'] = interactions.pop('user_interactions')
             # Atualiza as interações gerais no filme
             movie_info.update(interactions)
 
@@ -349,69 +364,37 @@ class GenreListView(APIView):
 class DashboardView(APIView):
     """
     View para retornar os dados consolidados do dashboard.
+
+    Os agregados vêm do snapshot pré-calculado (api/dashboard.py): uma leitura
+    por request, qualquer que seja o número de usuários. As preferências vêm
+    resumidas por gênero e paginadas (?preferences_page=&preferences_page_size=).
     """
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        # Obter todos os  e gêneros
-        genres = Genre.objects.all()
-
-        # Serializar  e gêneros
-        genre_serializer = GenreSerializer(genres, many=True)
-
-        # Avaliações médias por gênero
-        avg_ratings = (
-            Rating.objects.values("movie__genres__name")
-            .annotate(avgRating=Avg("rating"))
-            .distinct()
-        )
-        ratings_by_genre = [
-            {"genre": r["movie__genres__name"], "avgRating": r["avgRating"]}
-            for r in avg_ratings
-        ]
-
-        # Contagem de interações (likes, dislikes, favoritos e assistidos)
-        interactions = {
-            "likes": LikeDislike.objects.filter(action="like").count(),
-            "dislikes": LikeDislike.objects.filter(action="dislike").count(),
-            "favorites": FavoriteMovie.objects.count(),
-            "watched": WatchedMovie.objects.count(),
-        }
+        snapshot = get_dashboard_snapshot()
+        data = dict(snapshot.data)
 
-        # Distribuição de filmes por gênero
-        genre_distribution = (
-            Movie.objects.values("genres__name")
-            .annotate(value=Count("id"))
-        )
-        genre_distribution_data = [
-            {"name": g["genres__name"], "value": g["value"]} for g in genre_distribution
-        ]
-        
-        preferences = Preference.objects.all()
-        lista_preferences = []
-
-        for preference in preferences:
-            serialized_data = PreferenceSerializer(preference).data  # Serializa a preferência atual
-            
-            # Adiciona informações relacionadas
-            serialized_data['genre'] = GenreSerializer(preference.genre).data  # Serializa o gênero associado
-            serialized_data['username'] = preference.user.username  # Adiciona o nome do usuário
-
-            lista_preferences.append(serialized_data)
-
-        # Dados consolidados para o dashboard
-        dashboard_data = {
-            
-            "genres": genre_serializer.data,
-            "ratings": ratings_by_genre,
-            "interactions": interactions,
-            "genreDistribution": genre_distribution_data,
-            "preferences": lista_preferences
+        # Paginação do resumo de preferências por gênero
+        default_size = getattr(settings, 'DASHBOARD_PREFERENCES_PAGE_SIZE', 20)
+        try:
+            page = max(int(request.query_params.get('preferences_page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('preferences_page_size', default_size)), 1), 100)
+        except ValueError:
+            return create_response(message="Parâmetros de paginação inválidos.", status_code=400)
+        preferences = data.get('preferences', [])
+        data['preferences'] = preferences[(page - 1) * page_size:page * page_size]
+        data['preferencesPage'] = {
+            'page': page,
+            'pageSize': page_size,
+            'total': len(preferences),
+            'pages': (len(preferences) + page_size - 1) // page_size,
         }
+        data['refreshedAt'] = snapshot.refreshed_at
 
         return create_response(
             message="Dados consolidados do dashboard",
-            data=dashboard_data
+            data=data
         )
     
 # class PersonalizedRecommendationsViewOrdeby(APIView):
@@ -472,96 +455,334 @@ class PersonalizedRecommendationsViewOrdeby(APIView):
     def get(self, request):
         user = request.user
 
-        # 1. Obter gêneros favoritos do usuário, considerando prioridades e intensidade de preferência
-        favorite_genre_ids = Preference.objects.filter(user=user, preference_type="favorite")\
-                                                 .order_by('-priority')\
-                                                 .values_list('genre_id', flat=True)
-
-        # 2. Obter gêneros secundários ou similares, se o usuário tem filmes avaliados positivamente em outros gêneros
-        secondary_genre_ids = Preference.objects.filter(user=user, preference_type="favorite")\
-                                                 .exclude(genre_id__in=favorite_genre_ids)\
-                                                 .values_list('genre_id', flat=True)
+        # Motor de pontuação: 'materialized' (lista pré-calculada em UserRecommendation, padrão),
+        # 'sql' (anotação no banco) ou 'index' (índice vetorizado em memória)
+        engine = request.query_params.get('engine', getattr(settings, 'RECOMMENDATION_ENGINE', 'materialized'))
+        paginator = MoviePagination()
+        if engine == 'materialized':
+            result_page = self.get_materialized_page(user, paginator, request)
+        else:
+            if engine == 'index':
+                movies = IndexedRecommendations(get_genre_index().rank(user))
+            else:
+                # 1-4. Pontuação, exclusão de assistidos/descurtidos e ordenação feitas no banco
+                movies = recommend_movies_by_genre_preferences(user).prefetch_related('genres')
 
-        # 3. Excluir filmes já assistidos ou avaliados negativamente
-        watched_movie_ids = WatchedMovie.objects.filter(user=user).values_list('movie_id', flat=True)
-        disliked_movie_ids = LikeDislike.objects.filter(user=user, action="dislike").values_list('movie_id', flat=True)
-        
-        # Combine os dois conjuntos no Python
-        excluded_movie_ids = set(watched_movie_ids) | set(disliked_movie_ids)
+            # Paginação usando a classe personalizada: apenas a página pedida é carregada
+            result_page = paginator.paginate_queryset(movies, request)
 
-        # 4. Buscar filmes baseados nos gêneros favoritos e secundários e excluir os já assistidos/avaliados
-        movies = Movie.objects.filter(
-            Q(genres__id__in=favorite_genre_ids) | Q(genres__id__in=secondary_genre_ids)
-        ).exclude(
-            id__in=excluded_movie_ids
-        ).distinct()
+        # Interações da página em um número constante de consultas
+        bulk_interactions = get_bulk_interactions([movie.id for movie in result_page], user)
 
-        # 5. Calcular a pontuação para cada filme, com base na interação do usuário
+        # 5. Serializar somente os filmes da página
         movie_list = []
-        for movie in movies:
+        for movie in result_page:
             movie_info = MovieSerializer(movie).data  # Serializa os dados básicos do filme
-            interactions = self.get_movie_interactions(movie)  # Obtém as interações gerais do filme
-            user_interactions = self.get_user_interactions(movie, user)  # Obtém as interações do usuário com o filme
-
-            # Ajuste da pontuação do filme
-            movie_score = self.calculate_movie_score(movie, user, favorite_genre_ids, secondary_genre_ids)  # Função para calcular a pontuação
+            interactions = self.get_movie_interactions(bulk_interactions[movie.id])  # Obtém as interações gerais do filme
+            user_interactions = self.get_user_interactions(bulk_interactions[movie.id])  # Obtém as interações do usuário com o filme
 
             # Atualiza as interações e a pontuação do filme
             movie_info['user_interactions'] = user_interactions
             movie_info.update(interactions)
-            movie_info['score'] = movie_score
+            movie_info['score'] = movie.score
 
             movie_list.append(movie_info)
 
-        # Paginação usando a classe personalizada
-        paginator = MoviePagination()
-        result_page = paginator.paginate_queryset(movie_list, request)
-
         # Retorna a resposta paginada
-        return paginator.get_paginated_response(result_page)
+        return paginator.get_paginated_response(movie_list)
 
-    def calculate_movie_score(self, movie, user, favorite_genre_ids, secondary_genre_ids):
+    def get_materialized_page(self, user, paginator, request):
         """
-        Função para calcular a pontuação do filme baseada nas preferências de gênero e interações do usuário.
+        Lê a página da lista materializada (UserRecommendation) pelo índice (user, rank).
+        Se o usuário ainda não tem lista, ela é calculada e gravada na hora (só na
+        primeira vez; listas vazias são recalculadas em segundo plano).
         """
-        score = 0
-
-        # Pontuação baseada nos gêneros favoritos, com pesos de prioridade
-        for genre in movie.genres.all():
-            if genre.id in favorite_genre_ids:
-                # Peso maior para gêneros favoritos
-                preference = Preference.objects.get(user=user, genre=genre)
-                score += 2 * preference.priority  # Prioridade influencia o peso
-
-            if genre.id in secondary_genre_ids:
-                # Peso menor para gêneros secundários
-                score += 1  # Peso básico
+        recommendations = (
+            UserRecommendation.objects.filter(user=user)
+            .select_related('movie')
+            .prefetch_related('movie__genres')
+            .order_by('rank')
+        )
+        if not recommendations.exists():
+            ensure_user_recommendations(user.id)
+        page = paginator.paginate_queryset(recommendations, request)
 
-        # Pontuação baseada nas interações do usuário
-        user_interactions = self.get_user_interactions(movie, user)
-        if user_interactions.get('liked'):
-            score += 3  # Aumenta a pontuação se o usuário gostou
-        elif user_interactions.get('disliked'):
-            score -= 3  # Diminui a pontuação se o usuário não gostou
+        movies = []
+        for recommendation in page:
+            recommendation.movie.score = recommendation.score
+            movies.append(recommendation.movie)
+        return movies
 
-        return score
+    def get_movie_interactions(self, movie_interactions):
+        """
+        Função para retornar interações gerais com o filme, a partir do resultado de get_bulk_interactions.
+        """
+        return {"likes": movie_interactions['likes_count'], "dislikes": movie_interactions['dislikes_count']}
 
-    def get_movie_interactions(self, movie):
+    def get_user_interactions(self, movie_interactions):
         """
-        Função para retornar interações gerais com o filme.
+        Função para obter as interações específicas do usuário com o filme, a partir de get_bulk_interactions.
         """
-        likes = LikeDislike.objects.filter(movie=movie, action="like").count()
-        dislikes = LikeDislike.objects.filter(movie=movie, action="dislike").count()
-        return {"likes": likes, "dislikes": dislikes}
+        liked = movie_interactions['user_interactions']['liked']
+        return {"liked": liked == 'like', "disliked": liked == 'dislike'}
+
+
+
+class HybridRecommendationsView(APIView):
+    """
+    Recomendações híbridas: candidatos colaborativos, por conteúdo e por gênero,
+    gerados em paralelo e misturados com pesos.
 
-    def get_user_interactions(self, movie, user):
+    Parâmetros: limit (1-100), budget_ms (tempo máximo por fonte) e
+    weights (ex.: collaborative:1,content:0.5,genre:1). A resposta informa, em
+    'sources', quais fontes entraram e quais estouraram o orçamento.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            budget_ms = request.query_params.get('budget_ms')
+            if budget_ms and not math.isfinite(float(budget_ms)):
+                raise ValueError("'budget_ms' precisa ser um número finito")
+            budget = min(max(float(budget_ms), 1), 5000) / 1000 if budget_ms else None
+            weights = self.parse_weights(request.query_params.get('weights'))
+        except ValueError as error:
+            return create_response(message=f"Parâmetro inválido: {error}", status_code=400)
+
+        recommendations, sources = hybrid_recommendations(request.user.id, limit=limit, weights=weights, budget=budget)
+        movies = Movie.objects.prefetch_related('genres').in_bulk([movie_id for movie_id, _, _ in recommendations])
+
+        results = []
+        for movie_id, score, movie_sources in recommendations:
+            if movie_id not in movies:
+                continue
+            movie_info = MovieSerializer(movies[movie_id]).data
+            movie_info['score'] = score
+            movie_info['sources'] = movie_sources
+            results.append(movie_info)
+        return create_response(message="Recomendações híbridas geradas com sucesso.",
+                               data={'results': results, 'sources': sources})
+
+    def parse_weights(self, raw):
         """
-        Função para obter as interações específicas do usuário com o filme.
+        Converte 'fonte:peso,fonte:peso' em dicionário, partindo dos pesos configurados.
         """
-        like = LikeDislike.objects.filter(movie=movie, user=user, action="like").exists()
-        dislike = LikeDislike.objects.filter(movie=movie, user=user, action="dislike").exists()
-        return {"liked": like, "disliked": dislike}
-  
+        weights = dict(getattr(settings, 'HYBRID_WEIGHTS', DEFAULT_HYBRID_WEIGHTS))
+        if not raw:
+            return weights
+        for item in raw.split(','):
+            name, _, value = item.partition(':')
+            if name not in CANDIDATE_SOURCES:
+                raise ValueError(f"fonte desconhecida '{name}'")
+            weights[name] = float(value)
+            if not math.isfinite(weights[name]):
+                raise ValueError(f"peso inválido para '{name}'")
+        return weights
+
+
+class SimilarMoviesView(APIView):
+    """
+    Filmes parecidos com o filme informado ("mais como este"), lidos da tabela
+    MovieSimilarity pré-calculada (manage.py build_similar_movies).
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return create_response(message="Parâmetro 'limit' inválido.", status_code=400)
+
+        similarities = list(get_similar_movies(pk, limit))
+        if not similarities and not Movie.objects.filter(pk=pk).exists():
+            return create_response(message='Filme não encontrado', status_code=404)
+
+        data = []
+        for similarity in similarities:
+            movie_info = MovieSerializer(similarity.similar_movie).data
+            movie_info['similarity'] = round(similarity.score, 4)
+            data.append(movie_info)
+        return create_response(message="Filmes similares recuperados com sucesso.", data=data)
+
+
+class TrendingMoviesView(APIView):
+    """
+    Filmes em alta: pontuação de likes, favoritos, assistências e avaliações com
+    decaimento exponencial no tempo, mantida a cada interação (api/trending.py).
+
+    Parâmetros: genre (id ou slug, opcional) e limit (1-100). Sem gênero, a
+    resposta traz também os gêneros em alta.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+        except ValueError:
+            return create_response(message="Parâmetro 'limit' inválido.", status_code=400)
+
+        genre_param = request.query_params.get('genre')
+        genre_id = None
+        if genre_param:
+            lookup = {'pk': genre_param} if genre_param.isdigit() else {'slug': genre_param}
+            genre_id = Genre.objects.filter(**lookup).values_list('id', flat=True).first()
+            if genre_id is None:
+                return create_response(message='Gênero não encontrado', status_code=404)
+
+        trending = get_trending_movies(genre_id=genre_id, limit=limit)
+        movies = Movie.objects.prefetch_related('genres').in_bulk([movie_id for movie_id, _ in trending])
+        results = []
+        for movie_id, score in trending:
+            if movie_id in movies:
+                movie_info = MovieSerializer(movies[movie_id]).data
+                movie_info['trending'] = round(score, 4)
+                results.append(movie_info)
+
+        data = {'results': results}
+        if genre_id is None:
+            genres = get_trending_genres()
+            names = dict(Genre.objects.filter(id__in=[genre_id for genre_id, _ in genres]).values_list('id', 'name'))
+            data['genres'] = [{'id': genre_id, 'name': names.get(genre_id), 'trending': round(score, 4)}
+                              for genre_id, score in genres]
+        return create_response(message="Filmes em alta recuperados com sucesso.", data=data)
+
+
+class InteractionBatchView(APIView):
+    """
+    Recebe vários eventos do usuário autenticado de uma vez (sincronização offline,
+    importação de histórico): {"events": [{"type": "like", "movie_id": 1},
+    {"type": "rating", "movie_id": 2, "rating": 4.5}, ...]}.
+
+    Tipos: like, dislike, none, watched, favorite e rating. Os eventos são validados
+    juntos, os filmes conferidos com uma consulta e os válidos gravados numa única
+    transação; a resposta traz o resultado de cada evento, na ordem recebida.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        events = request.data.get('events') if isinstance(request.data, dict) else request.data
+        max_events = getattr(settings, 'INTERACTIONS_BATCH_MAX', 500)
+        if not isinstance(events, list) or not events:
+            return create_response(message="Envie uma lista 'events' com ao menos um evento.", status_code=400)
+        if len(events) > max_events:
+            return create_response(message=f"Máximo de {max_events} eventos por lote.", status_code=400)
+
+        serializers_ = [InteractionEventSerializer(data=event) for event in events]
+        valid = [serializer.is_valid() for serializer in serializers_]
+        movie_ids = {serializer.validated_data['movie_id'] for serializer, ok in zip(serializers_, valid) if ok}
+        existing = set(Movie.objects.filter(id__in=movie_ids).values_list('id', flat=True))
+
+        results = []
+        accepted = []
+        for index, (serializer, ok) in enumerate(zip(serializers_, valid)):
+            result = {'index': index}
+            if ok and serializer.validated_data['movie_id'] not in existing:
+                ok = False
+                result['errors'] = {'movie_id': ['Filme não encontrado.']}
+            elif not ok:
+                result['errors'] = serializer.errors
+            if ok:
+                event = serializer.validated_data
+                result.update(type=event['type'], movie_id=event['movie_id'])
+                accepted.append((result, event))
+            else:
+                result['status'] = 'error'
+            results.append(result)
+
+        if accepted:
+            statuses = apply_interaction_batch(request.user.id, [event for _, event in accepted])
+            for (result, _), status in zip(accepted, statuses):
+                result['status'] = status
+
+        if not accepted:
+            return create_response(message="Nenhum evento válido.", data={'results': results}, status_code=400)
+        return create_response(
+            message=f"{len(accepted)} de {len(results)} eventos gravados.",
+            data={'results': results, 'applied': len(accepted), 'errors': len(results) - len(accepted)},
+        )
+
+
+class RecommendationIndexStatusView(APIView):
+    """
+    Retorna o estado do índice de recomendação em memória deste processo
+    (filmes, gêneros, tempo de construção e consumo de memória).
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        index = get_genre_index().refresh()
+        return create_response(message="Estado do índice de recomendação.", data=index.describe())
+
+
+class ModelStatusView(APIView):
+    """
+    Retorna os modelos treinados: versão ativa, versões disponíveis, tempo de carga
+    e tamanho dos artefatos carregados por este worker.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return create_response(message="Estado dos modelos.", data=get_model_registry().status())
+
+
+class ExportView(APIView):
+    """
+    Exporta um conjunto de interações (ratings, likes, favorites, watched,
+    preferences ou events) em streaming, como NDJSON (padrão) ou CSV:
+
+        GET /api/export/<conjunto>/?output=csv&since=2024-06-01&after_id=1000
+
+    As linhas saem em ordem de id, lidas em blocos (api/export.py); a memória
+    não cresce com o tamanho da tabela. Para continuar uma exportação, passe em
+    after_id o último id recebido.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, dataset):
+        output = request.query_params.get('output', 'ndjson')
+        filters = {}
+
+        since = request.query_params.get('since')
+        if since:
+            filters['since'] = parse_since(since)
+            if filters['since'] is None:
+                return create_response(message="Data inválida em since (use AAAA-MM-DD ou ISO 8601).",
+                                       status_code=400)
+        after_id = request.query_params.get('after_id')
+        if after_id:
+            if not after_id.isdigit():
+                return create_response(message="after_id deve ser um número inteiro.", status_code=400)
+            filters['after_id'] = int(after_id)
+
+        try:
+            chunks = iter_export(dataset, output, **filters)
+        except ExportError as error:
+            return create_response(message=str(error), status_code=400)
+
+        content_type = 'text/csv; charset=utf-8' if output == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{output}"'
+        return response
+
+
+class CounterBufferStatusView(APIView):
+    """
+    Métricas do buffer de contadores (write-behind) deste worker: incrementos
+    pendentes por tipo e latência dos flushes.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return create_response(message="Estado do buffer de contadores.", data=get_counter_buffer().metrics())
 
 
 class FavoriteMovieViewSet(viewsets.ModelViewSet):
@@ -570,6 +791,13 @@ class FavoriteMovieViewSet(viewsets.ModelViewSet):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def perform_destroy(self, instance):
+        # Remove a interação e enfileira o desconto nos contadores e na tendência do filme na mesma transação
+        with transaction.atomic():
+            enqueue_interaction(instance.user_id, instance.movie_id, stats={'favorites': -1},
+                                trending=trending_transition('favorite', True, False))
+            instance.delete()
+
     # Recuperar detalhes do FavoriteMovie incluindo o usuário e o filme
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()  # Pega o FavoriteMovie pela chave primária (ID)
@@ -608,11 +836,14 @@ class FavoriteMovieViewSet(viewsets.ModelViewSet):
             return create_response({'message': 'Filme não encontrado'}, status=404)
 
         # Cria ou atualiza o registro de favorito
-        favorite_movie, created = FavoriteMovie.objects.get_or_create(user=user, movie=movie)
+        with transaction.atomic():
+            favorite_movie, created = FavoriteMovie.objects.get_or_create(user=user, movie=movie)
+            if created:
+                # Contadores e preferências dos gêneros do filme favoritado ficam para o worker do outbox
+                enqueue_interaction(user.id, movie.id, stats={'favorites': 1}, preference=('favorite', 1),
+                                    trending=trending_transition('favorite', False, True))
 
         if created:
-            # Ajusta as preferências do usuário para os gêneros do filme favoritado
-            adjust_user_preferences(user, movie.genres.all(), action='favorite', weight=1)
             return create_response(message='Filme adicionado aos favoritos com sucesso.', status_code=201)
         else:
             return create_response(message='O filme já está nos favoritos.', status_code=200)
@@ -624,6 +855,13 @@ class WatchedMovieViewSet(viewsets.ModelViewSet):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def perform_destroy(self, instance):
+        # Remove a interação e enfileira o desconto nos contadores e na tendência do filme na mesma transação
+        with transaction.atomic():
+            enqueue_interaction(instance.user_id, instance.movie_id, stats={'watched': -1},
+                                trending=trending_transition('watch', instance.watch_count, None))
+            instance.delete()
+
     # Recuperar detalhes do WatchedMovie incluindo o usuário e o filme
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()  # Pega o WatchedMovie pela chave primária (ID)
@@ -666,22 +904,19 @@ class WatchedMovieViewSet(viewsets.ModelViewSet):
         except Movie.DoesNotExist:
             return create_response(message='Filme não encontrado', status_code=404)
 
-        # Marca o filme como assistido ou atualiza o contador
-        watched_movie, created = WatchedMovie.objects.get_or_create(user=user, movie=movie)
+        # Marca o filme como assistido ou incrementa o contador, num único comando atômico
+        with transaction.atomic():
+            watched_movie, created = record_watch(user.id, movie.id)
+            if created:
+                # Filme marcado pela primeira vez: contadores e preferências dos gêneros
+                # do filme assistido ficam para o worker do outbox
+                enqueue_interaction(user.id, movie.id, stats={'watched': 1}, preference=('favorite', 1))
 
+        data = {'watch_count': watched_movie.watch_count}
         if created:
-            # Se o filme for marcado pela primeira vez como assistido
-            watched_movie.watch_count = 1
-            watched_movie.save()
-
-            # Ajusta as preferências do usuário para os gêneros do filme assistido
-            adjust_user_preferences(user, movie.genres.all(), action='favorite', weight=1)
-            return create_response(message='Filme marcado como assistido com sucesso.', status_code=201)
+            return create_response(message='Filme marcado como assistido com sucesso.', data=data, status_code=201)
         else:
-            # Se o filme já foi assistido, incrementa o contador
-            watched_movie.watch_count += 1
-            watched_movie.save()
-            return create_response(message='O filme já foi assistido. Contador incrementado.', status_code=200)
+            return create_response(message='O filme já foi assistido. Contador incrementado.', data=data, status_code=200)
 
 
 
@@ -691,6 +926,13 @@ class LikeDislikeViewSet(viewsets.ModelViewSet):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def perform_destroy(self, instance):
+        # Remove a interação e enfileira o desconto nos contadores e na tendência do filme na mesma transação
+        with transaction.atomic():
+            enqueue_interaction(instance.user_id, instance.movie_id, stats=like_action_deltas(instance.action, None),
+                                trending=trending_transition('like', instance.action, None))
+            instance.delete()
+
     # Recuperar detalhes do LikeDislike incluindo o usuário e o filme
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()  # Pega o LikeDislike pela chave primária (ID)
@@ -740,16 +982,19 @@ class LikeDislikeViewSet(viewsets.ModelViewSet):
             )
 
         # Verifica se já existe uma interação para esse usuário e filme
-        like_dislike_instance, created = LikeDislike.objects.update_or_create(
-            user=user, movie=movie,
-            defaults={'action': action}
-        )
-
-        # Ajustar preferências do usuário com base na ação
-        if action == 'like':
-            adjust_user_preferences(user, movie.genres.all(), action='favorite', weight=1)
-        elif action == 'dislike':
-            adjust_user_preferences(user, movie.genres.all(), action='avoid', weight=-1)
+        with transaction.atomic():
+            previous_action = LikeDislike.objects.select_for_update()\
+                                                 .filter(user=user, movie=movie)\
+                                                 .values_list('action', flat=True).first()
+            like_dislike_instance, created = LikeDislike.objects.update_or_create(
+                user=user, movie=movie,
+                defaults={'action': action}
+            )
+            # Contadores, tendência (só a mudança de estado) e preferências do usuário com base
+            # na ação ficam para o worker do outbox
+            preference = {'like': ('favorite', 1), 'dislike': ('avoid', -1)}.get(action)
+            enqueue_interaction(user.id, movie.id, stats=like_action_deltas(previous_action, action),
+                                preference=preference, trending=trending_transition('like', previous_action, action))
 
         message = "Ação de like/dislike realizada com sucesso."
         return create_response(message=message, data=LikeDislikeSerializer(like_dislike_instance).data, status_code=200)
@@ -60,6 +60,89 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 12,  # Número padrão de itens por página
 }
 
+# Motor padrão de /api/movies/recomendado/: 'materialized' (lista gravada em UserRecommendation),
+# 'sql' (pontuação no banco) ou 'index' (índice em memória)
+RECOMMENDATION_ENGINE = os.environ.get('RECOMMENDATION_ENGINE', 'materialized')
+
+# Listas materializadas: modelo que as gera ('genre', 'als' ou 'knn'), tamanho, e como são
+# recalculadas após cada interação ('async' em threads, 'sync' ou 'off')
+RECOMMENDATION_MATERIALIZED_SOURCE = os.environ.get('RECOMMENDATION_MATERIALIZED_SOURCE', 'genre')
+RECOMMENDATION_MATERIALIZED_LIMIT = int(os.environ.get('RECOMMENDATION_MATERIALIZED_LIMIT', 100))
+RECOMMENDATION_REFRESH_MODE = os.environ.get('RECOMMENDATION_REFRESH_MODE', 'async')
+RECOMMENDATION_REFRESH_WORKERS = int(os.environ.get('RECOMMENDATION_REFRESH_WORKERS', 2))
+# Listas que saíram vazias são recalculadas (em segundo plano) no máximo uma vez por intervalo
+RECOMMENDATION_EMPTY_RETRY_SECONDS = int(os.environ.get('RECOMMENDATION_EMPTY_RETRY_SECONDS', 600))
+
+# Recomendação híbrida (/api/movies/recomendado/hybrid/): peso de cada fonte de candidatos,
+# orçamento de tempo por request (fontes que passam dele ficam de fora) e threads do pool
+HYBRID_WEIGHTS = {
+    'collaborative': float(os.environ.get('HYBRID_WEIGHT_COLLABORATIVE', 1.0)),
+    'content': float(os.environ.get('HYBRID_WEIGHT_CONTENT', 1.0)),
+    'genre': float(os.environ.get('HYBRID_WEIGHT_GENRE', 1.0)),
+}
+HYBRID_BUDGET_MS = int(os.environ.get('HYBRID_BUDGET_MS', 300))
+HYBRID_WORKERS = int(os.environ.get('HYBRID_WORKERS', 8))
+
+# Outbox das interações: 'worker' (efeitos aplicados por manage.py process_outbox) ou 'sync'
+# (aplicados logo após o commit do request); tentativas antes de um evento sair da fila e espera
+# após cada falha (base * 2^(tentativas - 1), limitada ao máximo, em segundos)
+OUTBOX_MODE = os.environ.get('OUTBOX_MODE', 'worker')
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_RETRY_BASE_SECONDS = float(os.environ.get('OUTBOX_RETRY_BASE_SECONDS', 5))
+OUTBOX_RETRY_MAX_SECONDS = float(os.environ.get('OUTBOX_RETRY_MAX_SECONDS', 3600))
+
+# Máximo de eventos por request em /api/interactions/batch/
+INTERACTIONS_BATCH_MAX = int(os.environ.get('INTERACTIONS_BATCH_MAX', 500))
+
+# Buffer de contadores: 'direct' (um UPDATE por incremento) ou 'buffered' (incrementos somados em
+# memória e gravados em lote a cada N ms ou M incrementos; perde o que estiver pendente se o
+# processo morrer sem encerrar). Linhas de WatchedMovie lembradas por processo para o buffer.
+COUNTER_BUFFER_MODE = os.environ.get('COUNTER_BUFFER_MODE', 'direct')
+COUNTER_BUFFER_FLUSH_MS = int(os.environ.get('COUNTER_BUFFER_FLUSH_MS', 200))
+COUNTER_BUFFER_MAX_EVENTS = int(os.environ.get('COUNTER_BUFFER_MAX_EVENTS', 1000))
+COUNTER_BUFFER_KNOWN_WATCHES = int(os.environ.get('COUNTER_BUFFER_KNOWN_WATCHES', 10000))
+
+# Histórico de interações (api/events.py): leitores incrementais ignoram eventos com menos de N
+# segundos, para não pular um id gravado por uma transação que ainda não terminou. A idade conta
+# do INSERT, não do commit: N tem que ser maior que a transação mais longa que grava no histórico
+# (no PostgreSQL; no SQLite as transações de escrita já terminam na ordem dos ids)
+EVENT_LOG_SETTLE_SECONDS = int(os.environ.get('EVENT_LOG_SETTLE_SECONDS', 5))
+
+# Dashboard: idade máxima do snapshot antes de um request agendar o recálculo (segundos) e
+# tamanho padrão da página do resumo de preferências por gênero
+DASHBOARD_SNAPSHOT_MAX_AGE = int(os.environ.get('DASHBOARD_SNAPSHOT_MAX_AGE', 300))
+DASHBOARD_PREFERENCES_PAGE_SIZE = int(os.environ.get('DASHBOARD_PREFERENCES_PAGE_SIZE', 20))
+
+# Tendências (/api/movies/trending/): meia-vida do decaimento e peso de cada evento. A época do
+# "forward decay" fica no banco (TrendingEpoch) e avança sozinha antes de as pontuações gravadas
+# (que dobram a cada meia-vida) estourarem o float; manage.py rebase_trending a avança na hora.
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', 72))
+TRENDING_WEIGHTS = {
+    'watch': float(os.environ.get('TRENDING_WEIGHT_WATCH', 1.0)),
+    'like': float(os.environ.get('TRENDING_WEIGHT_LIKE', 1.0)),
+    'dislike': float(os.environ.get('TRENDING_WEIGHT_DISLIKE', -0.5)),
+    'favorite': float(os.environ.get('TRENDING_WEIGHT_FAVORITE', 2.0)),
+    'rating': float(os.environ.get('TRENDING_WEIGHT_RATING', 1.0)),
+}
+TRENDING_CACHE_SECONDS = int(os.environ.get('TRENDING_CACHE_SECONDS', 30))
+
+# Diretório dos artefatos de modelos treinados (manage.py train_models) e intervalo, em segundos,
+# com que cada worker confere se há uma nova versão ativa
+MODEL_DIR = Path(os.environ.get('MODEL_DIR', BASE_DIR / 'model_store'))
+MODEL_CHECK_INTERVAL = int(os.environ.get('MODEL_CHECK_INTERVAL', 5))
+
+# Cópia local dos dados do NLTK (stopwords), baixada só no primeiro uso
+NLTK_DATA_DIR = Path(os.environ.get('NLTK_DATA_DIR', BASE_DIR / 'nltk_data'))
+
+# Busca de vizinhos do KNN: 'brute' (exata) ou 'lsh' (aproximada, api/ann.py).
+# n_tables/probes maiores aumentam o recall; n_bits maior reduz a latência.
+KNN_ALGORITHM = os.environ.get('KNN_ALGORITHM', 'brute')
+KNN_ANN_PARAMS = {
+    'n_tables': int(os.environ.get('KNN_ANN_TABLES', 16)),
+    'n_bits': int(os.environ.get('KNN_ANN_BITS', 8)),
+    'probes': int(os.environ.get('KNN_ANN_PROBES', 3)),
+}
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -119,6 +202,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # BEGIN IMMEDIATE: cada transação pega o lock de escrita no início e espera a vez
+        # (timeout em segundos), em vez de falhar com "database is locked" ao passar de
+        # leitura para escrita (ex.: recálculos concorrentes das recomendações)
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+        # Banco de testes em arquivo: o padrão em memória (cache compartilhado) recusa
+        # escritas concorrentes na hora, e os testes de concorrência usam várias threads
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
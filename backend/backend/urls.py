@@ -8,7 +8,10 @@ from rest_framework.routers import DefaultRouter
 from api.views import (VerifyTokenView,PersonalizedRecommendationsViewOrdeby,
                         DashboardView, MovieListCreateView, 
                        PreferenceCreateView, RatingCreateUpdateView, GenreListView, UserCreateView,
-                       FavoriteMovieViewSet, WatchedMovieViewSet, LikeDislikeViewSet,PreferenceListView
+                       FavoriteMovieViewSet, WatchedMovieViewSet, LikeDislikeViewSet,PreferenceListView,
+                       RecommendationIndexStatusView, ModelStatusView, SimilarMoviesView,
+                       HybridRecommendationsView, TrendingMoviesView, InteractionBatchView,
+                       CounterBufferStatusView, ExportView
                        )
 
 # Gerador da documentação Swagger
@@ -37,7 +40,15 @@ urlpatterns = [
     path('api/dashboard/', DashboardView.as_view(), name='dashboard'),
     path('api/genres/', GenreListView.as_view(), name='genre-list'),
     path('api/movies/', MovieListCreateView.as_view(), name='movie-list-create'),
+    path('api/movies/trending/', TrendingMoviesView.as_view(), name='movie-trending'),
+    path('api/movies/<int:pk>/similar/', SimilarMoviesView.as_view(), name='movie-similar'),
     path('api/movies/recomendado/', PersonalizedRecommendationsViewOrdeby.as_view(), name='movie-recomendados'),
+    path('api/movies/recomendado/hybrid/', HybridRecommendationsView.as_view(), name='movie-recomendados-hybrid'),
+    path('api/movies/recomendado/index/', RecommendationIndexStatusView.as_view(), name='recommendation-index-status'),
+    path('api/models/status/', ModelStatusView.as_view(), name='model-status'),
+    path('api/interactions/batch/', InteractionBatchView.as_view(), name='interactions-batch'),
+    path('api/counters/status/', CounterBufferStatusView.as_view(), name='counter-buffer-status'),
+    path('api/export/<str:dataset>/', ExportView.as_view(), name='export'),
     path('api/ratings/create/', RatingCreateUpdateView.as_view(), name='rating-list-create'),
     path('api/register/', UserCreateView.as_view(), name='user-register'),
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
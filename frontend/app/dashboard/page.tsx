@@ -35,7 +35,7 @@ import {
   Tooltip
 } from 'recharts';
 // Importação das tipagens
-import { MovieList, MovieDashboardData } from '@/types/types';
+import { MovieList, MovieDashboardData, GenrePreferenceSummary } from '@/types/types';
 import api, { fetchMovies } from '@/services/api';
 import { Favorite, Movie, ThumbDown, ThumbUp } from '@mui/icons-material';
 
@@ -206,28 +206,10 @@ const MovieDashboard: React.FC = () => {
                 <CardHeader title="Preferências de Gênero" />
                 <CardContent>
                   {movieData.preferences && movieData.preferences.length > 0 ? (
-                    <TableContainer component={Paper}>
-                      <Table>
-                        <TableHead>
-                          <TableRow>
-                            <TableCell>Gênero</TableCell>
-                            <TableCell>Tipo de Preferência</TableCell>
-                            <TableCell>user</TableCell>
-                            <TableCell>Nº prioridade</TableCell>
-                          </TableRow>
-                        </TableHead>
-                        <TableBody>
-                          {movieData.preferences.map((pref, index) => (
-                            <TableRow key={index}>
-                              <TableCell>{pref.genre.name}</TableCell>
-                              <TableCell>{pref.preference_type}</TableCell>
-                              <TableCell>{pref.username}</TableCell>
-                              <TableCell>{pref.priority}</TableCell>
-                            </TableRow>
-                          ))}
-                        </TableBody>
-                      </Table>
-                    </TableContainer>
+                    <GenrePreferencesTable
+                      initialRows={movieData.preferences}
+                      pageInfo={movieData.preferencesPage}
+                    />
                   ) : (
                     <Typography color="textSecondary">Nenhuma preferência disponível</Typography>
                   )}
@@ -240,6 +222,78 @@ const MovieDashboard: React.FC = () => {
     </Container>
   );
 };
+// Resumo de preferências por gênero: a primeira página vem com o dashboard; as
+// demais são pedidas ao backend com ?preferences_page=
+const GenrePreferencesTable: React.FC<{
+  initialRows: GenrePreferenceSummary[];
+  pageInfo?: MovieDashboardData['preferencesPage'];
+}> = ({ initialRows, pageInfo }) => {
+  const [rows, setRows] = useState<GenrePreferenceSummary[]>(initialRows);
+  const [page, setPage] = useState(pageInfo?.page ?? 1); // Página atual (a partir de 1, como no backend)
+  const [loading, setLoading] = useState(false);
+  const [error, setError] = useState<string | null>(null);
+
+  const handleChangePage = async (_: React.MouseEvent<HTMLButtonElement> | null, newPage: number) => {
+    try {
+      setLoading(true);
+      const token = localStorage.getItem('access_token');
+      const response = await api.get(`/dashboard/`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { preferences_page: newPage + 1, preferences_page_size: pageInfo?.pageSize },
+      });
+      setRows(response.data.data.preferences ?? []);
+      setPage(newPage + 1);
+      setError(null);
+    } catch (err) {
+      console.error("Error fetching preferences:", err);
+      setError("Não foi possível carregar as preferências.");
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  return (
+    <>
+      <TableContainer component={Paper}>
+        <Table>
+          <TableHead>
+            <TableRow>
+              <TableCell>Gênero</TableCell>
+              <TableCell>Favoritos</TableCell>
+              <TableCell>Evitados</TableCell>
+              <TableCell>Prioridade média</TableCell>
+            </TableRow>
+          </TableHead>
+          <TableBody>
+            {rows.map((pref) => (
+              <TableRow key={pref.genre.id}>
+                <TableCell>{pref.genre.name}</TableCell>
+                <TableCell>{pref.favorites}</TableCell>
+                <TableCell>{pref.avoids}</TableCell>
+                <TableCell>{pref.avgPriority}</TableCell>
+              </TableRow>
+            ))}
+          </TableBody>
+        </Table>
+      </TableContainer>
+      {error && <Typography color="error">{error}</Typography>}
+
+      {/* Paginação (sem preferencesPage, ex.: cache antigo, mostra só a página recebida) */}
+      {pageInfo && pageInfo.pages > 1 && (
+        <TablePagination
+          component="div"
+          count={pageInfo.total}
+          rowsPerPage={pageInfo.pageSize}
+          rowsPerPageOptions={[]}
+          page={page - 1}
+          onPageChange={handleChangePage}
+          disabled={loading}
+        />
+      )}
+    </>
+  );
+};
+
 const MovieTableWithPagination: React.FC = () => {
 
   const [movies, setMovies] = useState<MovieList[]>([]);
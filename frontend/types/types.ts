@@ -101,5 +101,16 @@ export interface MovieDashboardData {
     watched: number;
   };
   genreDistribution: { name: string; value: number }[];
-  preferences?: Preference[]
+  preferences?: GenrePreferenceSummary[];  // Resumo por gênero, paginado (preferencesPage)
+  preferencesPage?: { page: number; pageSize: number; total: number; pages: number };
+  refreshedAt?: string;  // Momento do cálculo do snapshot do dashboard
+}
+
+// Preferências de todos os usuários agregadas por gênero (dashboard)
+export interface GenrePreferenceSummary {
+  genre: { id: number; name: string };
+  users: number;
+  favorites: number;
+  avoids: number;
+  avgPriority: number;
 }
\ No newline at end of file